@@ -6,7 +6,7 @@ import sys
 import time
 
 from channel import channel_factory
-from common import const
+from common import const, warm_up
 from config import load_config
 from plugins import *
 import threading
@@ -17,7 +17,6 @@ def sigterm_handler_wrap(_signo):
 
     def func(_signo, _stack_frame):
         logger.info("signal {} received, exiting...".format(_signo))
-        conf().save_user_datas()
         if callable(old_handler):  #  check old_handler
             return old_handler(_signo, _stack_frame)
         sys.exit(0)
@@ -37,6 +36,8 @@ def start_channel(channel_name: str):
             threading.Thread(target=linkai_client.start, args=(channel,)).start()
         except Exception as e:
             pass
+    # channel.startup()会阻塞，在此之前启动后台预热
+    warm_up.start()
     channel.startup()
 
 
@@ -68,4 +69,8 @@ def run():
 
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        from common.startup_profile import profile_startup
+
+        sys.exit(profile_startup())
     run()
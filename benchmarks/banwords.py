@@ -0,0 +1,112 @@
+"""
+敏感词匹配基准测试，对比WordsSearch与编译后的双数组自动机
+
+- 50000个词的词库的构建耗时和内存占用
+- 从banwords.dat缓存加载的耗时
+- FindFirst/ContainsAny/Replace的扫描吞吐
+
+用法(在项目根目录执行):
+    python -m benchmarks.banwords
+"""
+
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from plugins.plugin_manager import PluginManager
+
+# 导入插件包时会注册插件，需要和PluginManager.scan_plugins一样先设置插件路径
+PluginManager().current_plugin_path = os.path.join("plugins", "banwords")
+
+from plugins.banwords.lib.automaton import CompiledWordsSearch, source_digest  # noqa: E402
+from plugins.banwords.lib.WordsSearch import WordsSearch  # noqa: E402
+
+# 常用汉字区间内的字符
+CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+
+def build_words(n, seed=0):
+    rnd = random.Random(seed)
+    words = set()
+    while len(words) < n:
+        words.add("".join(rnd.choice(CHARS) for _ in range(rnd.randint(2, 6))))
+    return sorted(words)
+
+
+def build_texts(words, n, length=200, seed=1):
+    rnd = random.Random(seed)
+    texts = []
+    for i in range(n):
+        text = [rnd.choice(CHARS) for _ in range(length)]
+        # 十分之一的文本包含一个敏感词
+        if i % 10 == 0:
+            word = rnd.choice(words)
+            pos = rnd.randrange(length - len(word))
+            text[pos: pos + len(word)] = word
+        texts.append("".join(text))
+    return texts
+
+
+def bench_build(cls, words):
+    start = time.perf_counter()
+    searchr = cls()
+    searchr.SetKeywords(words)
+    elapsed = time.perf_counter() - start
+    # tracemalloc会显著拖慢构建，内存单独再构建一次统计
+    del searchr
+    gc.collect()
+    tracemalloc.start()
+    searchr = cls()
+    searchr.SetKeywords(words)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return searchr, elapsed, size
+
+
+def bench_scan(searchr, texts):
+    result = {}
+    for name in ("FindFirst", "ContainsAny", "Replace"):
+        method = getattr(searchr, name)
+        elapsed = float("inf")
+        for _ in range(3):  # 取三次中最快的一次
+            start = time.perf_counter()
+            for text in texts:
+                method(text)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        result[name] = len(texts) * len(texts[0]) / elapsed / 1e6
+    return result
+
+
+def main():
+    words = build_words(50000)
+    texts = build_texts(words, 2000)
+    print("构建50000个词(耗时 / 内存):")
+    searchers = {}
+    for name, cls in [("WordsSearch", WordsSearch), ("compiled", CompiledWordsSearch)]:
+        searchr, elapsed, size = bench_build(cls, words)
+        searchers[name] = searchr
+        print("  {:<12} {:>8.2f}s {:>10.1f}MB".format(name, elapsed, size / 1024 / 1024))
+
+    digest = source_digest("\n".join(words).encode("utf-8"))
+    path = os.path.join(tempfile.mkdtemp(), "banwords.dat")
+    searchers["compiled"].save(path, digest)
+    start = time.perf_counter()
+    searchers["mmap"] = CompiledWordsSearch.load(path, digest)
+    elapsed = time.perf_counter() - start
+    print("从缓存加载({:.1f}MB): {:.3f}s".format(os.path.getsize(path) / 1024 / 1024, elapsed))
+
+    for text in texts[:200]:
+        expected = searchers["WordsSearch"].Replace(text)
+        assert searchers["compiled"].Replace(text) == expected and searchers["mmap"].Replace(text) == expected
+
+    print("扫描吞吐(百万字符/秒):")
+    for name, searchr in searchers.items():
+        result = bench_scan(searchr, texts)
+        print("  {:<12} ".format(name) + "  ".join("{} {:>6.2f}".format(k, v) for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
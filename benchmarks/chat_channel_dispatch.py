@@ -0,0 +1,131 @@
+"""
+ChatChannel 调度延迟与空闲CPU占用基准测试
+
+对比旧的200ms轮询调度与就绪队列调度：
+- 预先构造N个有任务处理中的会话(并发额度已占满，队列为空)，模拟大量群成员同时在等待LLM回复
+- 统计空闲期间consume线程消耗的CPU时间
+- 统计新消息从produce到开始执行的延迟
+
+用法(在项目根目录执行):
+    python -m benchmarks.chat_channel_dispatch --sessions 10000
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from collections import deque
+
+from bridge.context import Context, ContextType
+from channel import chat_channel
+from channel.chat_channel import ChatChannel
+from common.dequeue import Dequeue
+
+
+class _BenchChannel(ChatChannel):
+    def __init__(self):
+        # 不启动consume线程，由bench自行启动；每个实例使用独立的调度状态
+        self.started = {}
+        self.running = True
+        self.sessions = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.ready_queue = deque()
+        self.ready_set = set()
+        self.ready_cond = threading.Condition(self.lock)
+
+    def _handle(self, context: Context):
+        self.started[context["msg_no"]] = time.perf_counter()
+
+
+class _PollingChannel(_BenchChannel):
+    # 旧实现：每200ms遍历全部会话
+    def consume(self):
+        while self.running:
+            with self.lock:
+                session_ids = list(self.sessions.keys())
+            for session_id in session_ids:
+                with self.lock:
+                    context_queue, semaphore = self.sessions[session_id]
+                if semaphore.acquire(blocking=False):
+                    if not context_queue.empty():
+                        context = context_queue.get()
+                        future = chat_channel.handler_pool.submit(self._select_lane(context), self._handle, context)
+                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
+                    else:
+                        semaphore.release()
+            time.sleep(0.2)
+
+    def _thread_pool_callback(self, session_id, **kwargs):
+        def func(worker):
+            with self.lock:
+                self.sessions[session_id][1].release()
+
+        return func
+
+
+def _fill_busy_sessions(channel, n):
+    for i in range(n):
+        semaphore = threading.BoundedSemaphore(1)
+        semaphore.acquire()  # 模拟处理中的任务
+        channel.sessions["busy_%d" % i] = [Dequeue(), semaphore]
+
+
+def _consumer_cpu(thread_ident):
+    try:
+        return time.pthread_getcpuclockid(thread_ident)
+    except (AttributeError, OSError):
+        return None
+
+
+def run(channel_cls, sessions, messages, idle_seconds):
+    channel = channel_cls()
+    _fill_busy_sessions(channel, sessions)
+    consumer = threading.Thread(target=channel.consume, daemon=True)
+    consumer.start()
+    time.sleep(0.3)
+    clock_id = _consumer_cpu(consumer.ident)
+
+    cpu_start = time.clock_gettime(clock_id) if clock_id is not None else time.process_time()
+    time.sleep(idle_seconds)
+    cpu_end = time.clock_gettime(clock_id) if clock_id is not None else time.process_time()
+
+    latencies = []
+    for i in range(messages):
+        context = Context(ContextType.TEXT, "hello", {"session_id": "new_%d" % i, "msg_no": i})
+        produced = time.perf_counter()
+        channel.produce(context)
+        deadline = produced + 2
+        while i not in channel.started and time.perf_counter() < deadline:
+            time.sleep(0.0005)
+        if i in channel.started:
+            latencies.append((channel.started[i] - produced) * 1000)
+        time.sleep(0.01)
+    channel.running = False
+    return (cpu_end - cpu_start) / idle_seconds * 100, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--idle", type=float, default=3.0)
+    args = parser.parse_args()
+
+    for name, cls in (("polling", _PollingChannel), ("ready-queue", _BenchChannel)):
+        cpu, latencies = run(cls, args.sessions, args.messages, args.idle)
+        latencies.sort()
+        print(
+            "{:<12} sessions={} idle_cpu={:.1f}% latency p50={:.2f}ms p99={:.2f}ms max={:.2f}ms".format(
+                name,
+                args.sessions,
+                cpu,
+                statistics.median(latencies),
+                latencies[int(len(latencies) * 0.99) - 1],
+                latencies[-1],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+ChatGPTSession.discard_exceeding 基准测试，与旧实现(每丢弃一条消息就重新计算全部消息的token)对比
+
+用法(在项目根目录执行):
+    python -m benchmarks.chat_gpt_session_tokens
+未安装tiktoken时使用按字符数估算的模型(wenxin)
+"""
+
+import timeit
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, num_tokens_from_messages
+
+
+class LegacyChatGPTSession(ChatGPTSession):
+    def discard_exceeding(self, max_tokens, cur_tokens=None):
+        cur_tokens = num_tokens_from_messages(self.messages, self.model)
+        while cur_tokens > max_tokens:
+            if len(self.messages) > 2:
+                self.messages.pop(1)
+            elif len(self.messages) == 2 and self.messages[1]["role"] == "assistant":
+                self.messages.pop(1)
+                cur_tokens = num_tokens_from_messages(self.messages, self.model)
+                break
+            else:
+                break
+            cur_tokens = num_tokens_from_messages(self.messages, self.model)
+        return cur_tokens
+
+
+def pick_model():
+    try:
+        import tiktoken  # noqa: F401
+
+        return "gpt-3.5-turbo"
+    except ImportError:
+        return "wenxin"
+
+
+def build_session(cls, model, n):
+    session = cls("bench", system_prompt="You are a helpful assistant.", model=model)
+    for i in range(n // 2):
+        session.add_query("第{}个问题: how do I speed up token counting in a long conversation?".format(i))
+        session.add_reply("第{}个回答: cache the per-message counts and subtract when discarding.".format(i))
+    return session
+
+
+def bench(cls, model, n, repeat=5):
+    total = 0.0
+    for _ in range(repeat):
+        session = build_session(cls, model, n)
+        max_tokens = session.calc_tokens() // 4  # 丢弃约3/4的历史
+        total += timeit.timeit(lambda: session.discard_exceeding(max_tokens), number=1)
+        # 之后每轮对话只新增一问一答
+        session.add_query("new question")
+        session.add_reply("new answer")
+        total += timeit.timeit(lambda: session.discard_exceeding(max_tokens), number=1)
+    return total / repeat
+
+
+def main():
+    model = pick_model()
+    print("model={}".format(model))
+    for n in (50, 200, 1000):
+        legacy = bench(LegacyChatGPTSession, model, n)
+        cached = bench(ChatGPTSession, model, n)
+        print("messages={:<5} legacy={:.2f}ms cached={:.2f}ms speedup={:.1f}x".format(n, legacy * 1e3, cached * 1e3, legacy / cached if cached else 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+ChatChannel._compose_context基准测试，对比逐条读取配置、线性查找的旧实现与预编译的触发匹配器
+
+- 模拟群聊中大部分消息不触发机器人的场景: 白名单中的群里的普通聊天，以及白名单外的群消息
+- 另外统计@机器人的消息，旧实现每条都要重新拼接和编译移除@的正则
+
+用法(在项目根目录执行):
+    python -m benchmarks.compose_context
+"""
+
+import random
+import re
+import time
+
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+from channel.chat_channel import ChatChannel, check_contain, check_prefix
+from channel.chat_message import ChatMessage
+from common.log import logger
+from config import conf
+from plugins import EventContext, Event, PluginManager
+
+
+class _BenchChannel(ChatChannel):
+    NOT_SUPPORT_REPLYTYPE = [ReplyType.VOICE]
+
+    def __init__(self):
+        # 不启动consume线程
+        self.name = "bot"
+        self.user_id = "@self"
+
+
+class _LegacyChannel(_BenchChannel):
+    # 旧实现
+    def _compose_context(self, ctype: ContextType, content, **kwargs):
+        context = Context(ctype, content)
+        context.kwargs = kwargs
+        # context首次传入时，origin_ctype是None,
+        # 引入的起因是：当输入语音时，会嵌套生成两个context，第一步语音转文本，第二步通过文本生成文字回复。
+        # origin_ctype用于第二步文本回复时，判断是否需要匹配前缀，如果是私聊的语音，就不需要匹配前缀
+        if "origin_ctype" not in context:
+            context["origin_ctype"] = ctype
+        # context首次传入时，receiver是None，根据类型设置receiver
+        first_in = "receiver" not in context
+        # 群名匹配过程，设置session_id和receiver
+        if first_in:  # context首次传入时，receiver是None，根据类型设置receiver
+            config = conf()
+            cmsg = context["msg"]
+            user_data = conf().get_user_data(cmsg.from_user_id)
+            context["openai_api_key"] = user_data.get("openai_api_key")
+            context["gpt_model"] = user_data.get("gpt_model")
+            if context.get("isgroup", False):
+                group_name = cmsg.other_user_nickname
+                group_id = cmsg.other_user_id
+
+                group_name_white_list = config.get("group_name_white_list", [])
+                group_name_keyword_white_list = config.get("group_name_keyword_white_list", [])
+                if any(
+                    [
+                        group_name in group_name_white_list,
+                        "ALL_GROUP" in group_name_white_list,
+                        check_contain(group_name, group_name_keyword_white_list),
+                    ]
+                ):
+                    group_chat_in_one_session = conf().get("group_chat_in_one_session", [])
+                    session_id = cmsg.actual_user_id
+                    if any(
+                        [
+                            group_name in group_chat_in_one_session,
+                            "ALL_GROUP" in group_chat_in_one_session,
+                        ]
+                    ):
+                        session_id = group_id
+                else:
+                    logger.debug(f"No need reply, groupName not in whitelist, group_name={group_name}")
+                    return None
+                context["session_id"] = session_id
+                context["receiver"] = group_id
+            else:
+                context["session_id"] = cmsg.other_user_id
+                context["receiver"] = cmsg.other_user_id
+            e_context = PluginManager().emit_event(EventContext(Event.ON_RECEIVE_MESSAGE, {"channel": self, "context": context}))
+            context = e_context["context"]
+            if e_context.is_pass() or context is None:
+                return context
+            if cmsg.from_user_id == self.user_id and not config.get("trigger_by_self", True):
+                logger.debug("[chat_channel]self message skipped")
+                return None
+
+        # 消息内容匹配过程，并处理content
+        if ctype == ContextType.TEXT:
+            if first_in and "」\n- - - - - - -" in content:  # 初次匹配 过滤引用消息
+                logger.debug(content)
+                logger.debug("[chat_channel]reference query skipped")
+                return None
+
+            nick_name_black_list = conf().get("nick_name_black_list", [])
+            if context.get("isgroup", False):  # 群聊
+                # 校验关键字
+                match_prefix = check_prefix(content, conf().get("group_chat_prefix"))
+                match_contain = check_contain(content, conf().get("group_chat_keyword"))
+                flag = False
+                if context["msg"].to_user_id != context["msg"].actual_user_id:
+                    if match_prefix is not None or match_contain is not None:
+                        flag = True
+                        if match_prefix:
+                            content = content.replace(match_prefix, "", 1).strip()
+                    if context["msg"].is_at:
+                        nick_name = context["msg"].actual_user_nickname
+                        if nick_name and nick_name in nick_name_black_list:
+                            # 黑名单过滤
+                            logger.warning(f"[chat_channel] Nickname {nick_name} in In BlackList, ignore")
+                            return None
+
+                        logger.info("[chat_channel]receive group at")
+                        if not conf().get("group_at_off", False):
+                            flag = True
+                        self.name = self.name if self.name is not None else ""  # 部分渠道self.name可能没有赋值
+                        pattern = f"@{re.escape(self.name)}(\u2005|\u0020)"
+                        subtract_res = re.sub(pattern, r"", content)
+                        if isinstance(context["msg"].at_list, list):
+                            for at in context["msg"].at_list:
+                                pattern = f"@{re.escape(at)}(\u2005|\u0020)"
+                                subtract_res = re.sub(pattern, r"", subtract_res)
+                        if subtract_res == content and context["msg"].self_display_name:
+                            # 前缀移除后没有变化，使用群昵称再次移除
+                            pattern = f"@{re.escape(context['msg'].self_display_name)}(\u2005|\u0020)"
+                            subtract_res = re.sub(pattern, r"", content)
+                        content = subtract_res
+                if not flag:
+                    if context["origin_ctype"] == ContextType.VOICE:
+                        logger.info("[chat_channel]receive group voice, but checkprefix didn't match")
+                    return None
+            else:  # 单聊
+                nick_name = context["msg"].from_user_nickname
+                if nick_name and nick_name in nick_name_black_list:
+                    # 黑名单过滤
+                    logger.warning(f"[chat_channel] Nickname '{nick_name}' in In BlackList, ignore")
+                    return None
+
+                match_prefix = check_prefix(content, conf().get("single_chat_prefix", [""]))
+                if match_prefix is not None:  # 判断如果匹配到自定义前缀，则返回过滤掉前缀+空格后的内容
+                    content = content.replace(match_prefix, "", 1).strip()
+                elif context["origin_ctype"] == ContextType.VOICE:  # 如果源消息是私聊的语音消息，允许不匹配前缀，放宽条件
+                    pass
+                else:
+                    logger.info("[chat_channel]receive single chat msg, but checkprefix didn't match")
+                    return None
+            content = content.strip()
+            img_match_prefix = check_prefix(content, conf().get("image_create_prefix",[""]))
+            if img_match_prefix:
+                content = content.replace(img_match_prefix, "", 1)
+                context.type = ContextType.IMAGE_CREATE
+            else:
+                context.type = ContextType.TEXT
+            context.content = content.strip()
+            if "desire_rtype" not in context and conf().get("always_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+                context["desire_rtype"] = ReplyType.VOICE
+        elif context.type == ContextType.VOICE:
+            if "desire_rtype" not in context and conf().get("voice_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+                context["desire_rtype"] = ReplyType.VOICE
+        return context
+
+
+def setup_config():
+    config = conf()
+    config["group_name_white_list"] = ["group%d" % i for i in range(100)]
+    config["group_name_keyword_white_list"] = ["kw%d" % i for i in range(20)]
+    config["group_chat_in_one_session"] = ["group%d" % i for i in range(0, 100, 3)]
+    config["nick_name_black_list"] = ["black%d" % i for i in range(200)]
+    config["group_chat_prefix"] = ["@bot", "bot", "小助手", "AI"]
+    config["group_chat_keyword"] = ["关键词%d" % i for i in range(30)]
+    config["single_chat_prefix"] = ["bot", "@bot"]
+    config["image_create_prefix"] = ["画", "看", "找"]
+
+
+def build_msgs(n, at_ratio=0.0, seed=0):
+    rnd = random.Random(seed)
+    msgs = []
+    for i in range(n):
+        msg = ChatMessage(None)
+        group = rnd.randrange(200)  # 一半的群不在白名单中
+        msg.other_user_id = "@@group%d" % group
+        msg.other_user_nickname = "group%d" % group
+        msg.from_user_id = msg.other_user_id
+        msg.to_user_id = "@self"
+        member = rnd.randrange(500)
+        msg.actual_user_id = "@member%d" % member
+        msg.actual_user_nickname = "member%d" % member
+        msg.self_display_name = "机器人"
+        msg.is_group = True
+        if rnd.random() < at_ratio:
+            msg.is_at = True
+            msg.at_list = ["bot", "member%d" % rnd.randrange(500)]
+            msg.content = "@bot\u2005今天天气怎么样 %d" % i
+        else:
+            msg.content = "大家好，今天天气不错 %d" % i
+        msgs.append(msg)
+    return msgs
+
+
+def bench(channel, msgs):
+    start = time.perf_counter()
+    for msg in msgs:
+        channel._compose_context(ContextType.TEXT, msg.content, isgroup=True, msg=msg)
+    return len(msgs) / (time.perf_counter() - start)
+
+
+def main():
+    logger.disabled = True
+    setup_config()
+    for title, at_ratio in [("未触发的群消息", 0.0), ("@机器人的群消息", 1.0)]:
+        msgs = build_msgs(20000, at_ratio)
+        print("{}:".format(title))
+        for name, channel in [("legacy", _LegacyChannel()), ("matcher", _BenchChannel())]:
+            best = max(bench(channel, msgs) for _ in range(3))
+            print("  {:<8} {:>10.0f} msg/s".format(name, best))
+
+
+if __name__ == "__main__":
+    main()
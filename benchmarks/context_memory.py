@@ -0,0 +1,122 @@
+"""
+排队消息的内存基准测试，对比旧的Context/Reply/ChatMessage(每个实例一个__dict__)与使用__slots__的实现
+
+- 模拟ChatChannel.sessions队列中积压的群聊文本消息: 每条包含一个ChatMessage和一个_compose_context生成的Context
+- 另外统计同样数量的Reply
+
+用法(在项目根目录执行):
+    python -m benchmarks.context_memory --contexts 100000
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from channel.chat_message import ChatMessage
+
+
+class LegacyContext:
+    def __init__(self, type: ContextType = None, content=None, kwargs=None):
+        self.type = type
+        self.content = content
+        self.kwargs = kwargs if kwargs is not None else {}
+
+
+class LegacyReply:
+    def __init__(self, type: ReplyType = None, content=None):
+        self.type = type
+        self.content = content
+
+
+class LegacyChatMessage(object):
+    msg_id = None
+    create_time = None
+    ctype = None
+    content = None
+    from_user_id = None
+    from_user_nickname = None
+    to_user_id = None
+    to_user_nickname = None
+    other_user_id = None
+    other_user_nickname = None
+    my_msg = False
+    self_display_name = None
+    is_group = False
+    is_at = False
+    actual_user_id = None
+    actual_user_nickname = None
+    at_list = None
+    _prepare_fn = None
+    _prepared = False
+    _rawmsg = None
+
+    def __init__(self, _rawmsg):
+        self._rawmsg = _rawmsg
+
+
+def build(n, context_cls, msg_cls):
+    queue = []
+    for i in range(n):
+        # 与WechatMessage群聊文本消息赋值的字段相同
+        msg = msg_cls(None)
+        msg.msg_id = str(7000000000000000000 + i)
+        msg.create_time = 1700000000 + i
+        msg.ctype = ContextType.TEXT
+        msg.content = "@bot 今天天气怎么样 %d" % i
+        msg.from_user_id = "@@group%d" % (i % 500)
+        msg.from_user_nickname = "group%d" % (i % 500)
+        msg.to_user_id = "@self"
+        msg.to_user_nickname = "bot"
+        msg.other_user_id = msg.from_user_id
+        msg.other_user_nickname = msg.from_user_nickname
+        msg.is_group = True
+        msg.is_at = True
+        msg.actual_user_id = "@member%d" % i
+        msg.actual_user_nickname = "member%d" % i
+        msg.self_display_name = "bot"
+        context = context_cls(ContextType.TEXT, "今天天气怎么样 %d" % i)
+        context.kwargs["origin_ctype"] = ContextType.TEXT
+        context.kwargs["isgroup"] = True
+        context.kwargs["msg"] = msg
+        context.kwargs["session_id"] = msg.actual_user_id
+        context.kwargs["receiver"] = msg.other_user_id
+        queue.append(context)
+    return queue
+
+
+def measure(fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    result = fn(*args)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def build_replies(n, reply_cls):
+    return [reply_cls(ReplyType.TEXT, None) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contexts", type=int, default=100000)
+    args = parser.parse_args()
+    n = args.contexts
+    print("{}条排队的消息(ChatMessage + Context):".format(n))
+    legacy = measure(build, n, LegacyContext, LegacyChatMessage)
+    slotted = measure(build, n, Context, ChatMessage)
+    print("  旧实现    {:>7.1f}MB  每条 {:>5.0f}B".format(legacy / 1024 / 1024, legacy / n))
+    print("  __slots__ {:>7.1f}MB  每条 {:>5.0f}B".format(slotted / 1024 / 1024, slotted / n))
+    print("{}个Reply:".format(n))
+    legacy = measure(build_replies, n, LegacyReply)
+    slotted = measure(build_replies, n, Reply)
+    print("  旧实现    {:>7.1f}MB  每个 {:>5.0f}B".format(legacy / 1024 / 1024, legacy / n))
+    print("  __slots__ {:>7.1f}MB  每个 {:>5.0f}B".format(slotted / 1024 / 1024, slotted / n))
+
+
+if __name__ == "__main__":
+    main()
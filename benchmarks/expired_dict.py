@@ -0,0 +1,80 @@
+"""
+ExpiredDict 基准测试，与旧实现(datetime + 读取时才删除)对比
+
+- set/get/in 的单次耗时
+- 只写不读的场景(如receivedMsgs)下，过期后残留的key数量
+
+用法(在项目根目录执行):
+    python -m benchmarks.expired_dict
+"""
+
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from common.expired_dict import ExpiredDict
+
+
+class LegacyExpiredDict(dict):
+    def __init__(self, expires_in_seconds):
+        super().__init__()
+        self.expires_in_seconds = expires_in_seconds
+
+    def __getitem__(self, key):
+        value, expiry_time = super().__getitem__(key)
+        if datetime.now() > expiry_time:
+            del self[key]
+            raise KeyError("expired {}".format(key))
+        self.__setitem__(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
+        super().__setitem__(key, (value, expiry_time))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+
+def bench_ops(cls, n=100000):
+    d = cls(3600)
+    keys = ["msg_%d" % i for i in range(n)]
+    t_set = timeit.timeit(lambda: [d.__setitem__(k, True) for k in keys], number=1) / n
+    t_get = timeit.timeit(lambda: [d.get(k) for k in keys], number=1) / n
+    t_in = timeit.timeit(lambda: [k in d for k in keys], number=1) / n
+    return t_set, t_get, t_in
+
+
+def bench_leftover(cls, n=200000, ttl=1.0):
+    d = cls(ttl)
+    for i in range(n // 2):
+        d["msg_%d" % i] = True
+    time.sleep(ttl * 2)
+    for i in range(n // 2, n):
+        d["msg_%d" % i] = True
+    return dict.__len__(d) if isinstance(d, dict) else len(d._data)
+
+
+def main():
+    for name, cls in (("legacy", LegacyExpiredDict), ("heap", ExpiredDict)):
+        t_set, t_get, t_in = bench_ops(cls)
+        leftover = bench_leftover(cls)
+        print(
+            "{:<7} set={:.2f}us get={:.2f}us in={:.2f}us  stored keys after half expired={}".format(
+                name, t_set * 1e6, t_get * 1e6, t_in * 1e6, leftover
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
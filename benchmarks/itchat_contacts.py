@@ -0,0 +1,110 @@
+"""
+itchat联系人存储基准测试，与旧实现(线性查找 + deepcopy)对比
+
+- 200个群、每个群500个成员时produce_msg的吞吐
+- search_chatrooms/search_friends按UserName查找的单次耗时
+
+用法(在项目根目录执行):
+    python -m benchmarks.itchat_contacts
+"""
+
+import copy
+import random
+import time
+import timeit
+
+from lib import itchat
+from lib.itchat.components.messages import produce_msg
+from lib.itchat.storage import Storage
+
+
+class LegacyStorage(Storage):
+    """旧实现: 持锁线性查找，返回deepcopy"""
+
+    def search_friends(self, name=None, userName=None, remarkName=None, nickName=None, wechatAccount=None):
+        with self.updateLock:
+            for m in self.memberList:
+                if m["UserName"] == userName:
+                    return copy.deepcopy(m)
+
+    def search_chatrooms(self, name=None, userName=None):
+        with self.updateLock:
+            for m in self.chatroomList:
+                if m["UserName"] == userName:
+                    return copy.deepcopy(m)
+
+    def search_mps(self, name=None, userName=None):
+        with self.updateLock:
+            for m in self.mpList:
+                if m["UserName"] == userName:
+                    return copy.deepcopy(m)
+
+
+def build_core(storage_cls, groups, members, friends):
+    core = itchat.Core()
+    storage = storage_cls(core)
+    core.storageClass = storage
+    core.memberList, core.mpList, core.chatroomList = storage.memberList, storage.mpList, storage.chatroomList
+    storage.userName, storage.nickName = "@self", "bot"
+    storage.memberList.append({"UserName": "@self", "NickName": "bot"})
+    for i in range(friends):
+        storage.memberList.append({"UserName": "@friend%d" % i, "NickName": "friend%d" % i, "RemarkName": "", "Alias": ""})
+    for g in range(groups):
+        storage.chatroomList.append(
+            {
+                "UserName": "@@group%d" % g,
+                "NickName": "group%d" % g,
+                "Self": {"UserName": "@self", "NickName": "bot", "DisplayName": ""},
+                "MemberList": [{"UserName": "@member%d" % m, "NickName": "member%d" % m, "DisplayName": ""} for m in range(members)],
+            }
+        )
+    return core
+
+
+def build_msgs(n, groups, members):
+    rnd = random.Random(0)
+    msgs = []
+    for _ in range(n):
+        msgs.append(
+            {
+                "FromUserName": "@@group%d" % rnd.randrange(groups),
+                "ToUserName": "@self",
+                "Content": "@member%d:<br/>@bot 你好" % rnd.randrange(members),
+                "MsgType": 1,
+                "Url": "",
+            }
+        )
+    return msgs
+
+
+def bench_produce(storage_cls, n, groups=200, members=500):
+    core = build_core(storage_cls, groups, members, friends=1000)
+    msgs = build_msgs(n, groups, members)
+    start = time.perf_counter()
+    for m in msgs:
+        produce_msg(core, [dict(m)])
+    return n / (time.perf_counter() - start)
+
+
+def bench_search(storage_cls, groups=200, members=500, friends=1000, n=2000):
+    core = build_core(storage_cls, groups, members, friends)
+    storage = core.storageClass
+    chatrooms = ["@@group%d" % random.randrange(groups) for _ in range(n)]
+    friend_names = ["@friend%d" % random.randrange(friends) for _ in range(n)]
+    t_chatroom = timeit.timeit(lambda: [storage.search_chatrooms(userName=u) for u in chatrooms], number=1) / n
+    t_friend = timeit.timeit(lambda: [storage.search_friends(userName=u) for u in friend_names], number=1) / n
+    return t_chatroom, t_friend
+
+
+def main():
+    print("produce_msg吞吐(200个群 x 500个成员):")
+    for name, cls, n in [("legacy", LegacyStorage, 500), ("indexed", Storage, 20000)]:
+        print("  {:<8} {:>10.0f} msg/s".format(name, bench_produce(cls, n)))
+    print("按UserName查找(单次耗时):")
+    for name, cls in [("legacy", LegacyStorage), ("indexed", Storage)]:
+        t_chatroom, t_friend = bench_search(cls)
+        print("  {:<8} search_chatrooms {:>10.2f}us  search_friends {:>8.2f}us".format(name, t_chatroom * 1e6, t_friend * 1e6))
+
+
+if __name__ == "__main__":
+    main()
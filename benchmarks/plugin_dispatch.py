@@ -0,0 +1,99 @@
+"""
+PluginManager.emit_event基准测试，对比逐个调用所有插件(由插件自己判断context类型)的旧实现与按事件和context类型预生成的分发表
+
+- 模拟内置插件的数量和优先级，每个插件在处理函数开头判断context类型和前缀，不符合时直接返回
+- 分别统计文本、图片、语音消息，以及以插件触发前缀开头的文本
+
+用法(在项目根目录执行):
+    python -m benchmarks.plugin_dispatch
+"""
+
+import time
+
+from bridge.context import Context, ContextType
+from common.log import logger
+from config import conf
+from plugins import Event, EventAction, EventContext, Plugin, PluginManager
+
+TEXT_ONLY = [ContextType.TEXT]
+# (插件名, 优先级, context类型, 触发前缀)，与内置插件的声明相同
+PLUGINS = [
+    ("Godcmd", 999, None, None),
+    ("Keyword", 900, TEXT_ONLY, None),
+    ("Banwords", 100, [ContextType.TEXT, ContextType.IMAGE_CREATE], None),
+    ("linkai", 99, [ContextType.TEXT, ContextType.IMAGE, ContextType.IMAGE_CREATE, ContextType.FILE, ContextType.SHARING], None),
+    ("agent", 1, TEXT_ONLY, ["{trigger_prefix}agent "]),
+    ("Role", 0, TEXT_ONLY, None),
+    ("Dungeon", 0, TEXT_ONLY, None),
+    ("tool", 0, TEXT_ONLY, ["{trigger_prefix}tool"]),
+    ("BDunit", 0, TEXT_ONLY, None),
+    ("Hello", -1, [ContextType.TEXT, ContextType.JOIN_GROUP, ContextType.PATPAT, ContextType.EXIT_GROUP], None),
+    ("Finish", -999, TEXT_ONLY, ["{trigger_prefix}"]),
+]
+
+
+def make_plugin(manager, name, priority, context_types, trigger_prefixes):
+    @manager.register(name=name, desire_priority=priority, context_types=context_types, trigger_prefixes=trigger_prefixes)
+    class BenchPlugin(Plugin):
+        def __init__(self):
+            super().__init__()
+            self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+
+        def on_handle_context(self, e_context: EventContext):
+            # 与内置插件一样在开头自行过滤
+            context = e_context["context"]
+            if context_types is not None and context.type not in context_types:
+                return
+            if trigger_prefixes is not None:
+                trigger_prefix = conf().get("plugin_trigger_prefix", "$")
+                if not any(context.content.startswith(prefix.replace("{trigger_prefix}", trigger_prefix)) for prefix in trigger_prefixes):
+                    return
+
+
+def legacy_emit_event(manager, e_context, *args, **kwargs):
+    if e_context.event in manager.listening_plugins:
+        for name in manager.listening_plugins[e_context.event]:
+            if manager.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
+                logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
+                instance = manager.instances[name]
+                instance.handlers[e_context.event](e_context, *args, **kwargs)
+                if e_context.is_break():
+                    e_context["breaked_by"] = name
+                    logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
+    return e_context
+
+
+def bench(emit, ctype, content, n):
+    context = Context(ctype, content, {"session_id": "user", "isgroup": False})
+    start = time.perf_counter()
+    for _ in range(n):
+        emit(EventContext(Event.ON_HANDLE_CONTEXT, {"channel": None, "context": context, "reply": None}))
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    manager = PluginManager()
+    manager.current_plugin_path = "./plugins"
+    for plugin in PLUGINS:
+        make_plugin(manager, *plugin)
+    manager.current_plugin_path = None
+    manager.activate_plugins()
+    n = 100000
+    cases = [
+        ("文本", ContextType.TEXT, "今天天气怎么样"),
+        ("$tool文本", ContextType.TEXT, "$tool 查询天气"),
+        ("图片", ContextType.IMAGE, "/tmp/image.png"),
+        ("语音", ContextType.VOICE, "/tmp/voice.mp3"),
+    ]
+    print("{}个插件监听ON_HANDLE_CONTEXT:".format(len(PLUGINS)))
+    for label, ctype, content in cases:
+        legacy = bench(lambda e: legacy_emit_event(manager, e), ctype, content, n)
+        table = bench(manager.emit_event, ctype, content, n)
+        print("  {:<10} 旧实现 {:>8.0f}次/s  分发表 {:>8.0f}次/s".format(label, legacy, table))
+    print("插件耗时统计:")
+    for name, stats in manager.plugin_stats().items():
+        print("  {:<10} 调用{:>7}  p50 {:.2f}us  p99 {:.2f}us".format(name, stats["calls"], stats["p50"] * 1e6, stats["p99"] * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+会话历史紧凑存储基准测试，对比空闲会话每个占用的内存
+
+- 旧布局: 展开的消息列表(每条消息一个dict) + token_cache(id -> (消息, token数))
+- 紧凑: SessionHistory，角色编码 + 内容字符串 + token数数组
+- 紧凑+zlib: 最近--keep条之前的消息压缩保存
+- 每轮对话前展开消息列表(materialize)的耗时
+
+用法(在项目根目录执行):
+    python -m benchmarks.session_history --sessions 20000 --rounds 5 --keep 4
+未安装tiktoken时使用按字符数估算的模型(wenxin)
+"""
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession
+from common.log import logger
+from config import conf
+
+QUESTIONS = [
+    "今天天气怎么样？我下午要出门，需要带伞吗",
+    "帮我写一段关于春天的短文，两百字左右，要有画面感",
+    "Python里面列表和元组有什么区别，分别适合什么场景",
+    "推荐几本适合初学者入门的经济学书籍，并简单说明理由",
+    "明天要去面试产品经理，有哪些常见问题需要准备",
+]
+ANSWERS = [
+    "根据天气预报，今天下午有小雨，气温在18到22度之间，建议出门时带一把伞，并穿一件薄外套。",
+    "春天来了，河边的柳树抽出嫩绿的新芽，桃花在枝头绽放，空气里弥漫着泥土和青草的气息，孩子们在田野里放风筝。",
+    "列表是可变的，可以增删改元素，适合保存需要修改的数据；元组不可变，可以作为字典的键，适合保存固定的记录。",
+    "可以从《经济学原理》开始，它讲解清晰、例子丰富；之后可以读《国富论》的导读版本，以及《魔鬼经济学》这类通俗读物。",
+    "常见问题包括：介绍一个你负责过的产品、如何做需求优先级排序、如何和开发沟通分歧、如何衡量一个功能是否成功。",
+]
+
+
+class LegacySession(ChatGPTSession):
+    """一轮对话结束后不存回紧凑存储，保持旧的内存布局"""
+
+    def compact(self):
+        pass
+
+
+def build_sessions(cls, n, rounds):
+    rng = random.Random(42)
+    sessions = []
+    for i in range(n):
+        session = cls("user_%d" % i, model="wenxin")
+        for r in range(rounds):
+            # 每条消息都是新的字符串，与真实会话一致
+            session.add_query("{}（{}-{}）".format(rng.choice(QUESTIONS), i, r))
+            session.calc_tokens()
+            session.add_reply("{}（{}-{}）".format(rng.choice(ANSWERS), i, r))
+            session.calc_tokens()
+            session.compact()
+        sessions.append(session)
+    return sessions
+
+
+def bench_layout(name, cls, n, rounds, keep):
+    conf()["history_compress_keep"] = keep
+    gc.collect()
+    tracemalloc.start()
+    sessions = build_sessions(cls, n, rounds)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for session in sessions:
+        assert len(session.messages) == rounds * 2 + 1
+        session.compact()
+    elapsed = time.perf_counter() - start
+    print("  {:<10} 每个会话 {:>7.0f}B  总计 {:>7.1f}MB  展开+存回 {:>6.1f}us".format(name, size / n, size / 1024 / 1024, elapsed / n * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--keep", type=int, default=4)
+    args = parser.parse_args()
+    logger.disabled = True
+    print("{}个会话，每个{}轮对话:".format(args.sessions, args.rounds))
+    bench_layout("旧布局", LegacySession, args.sessions, args.rounds, 0)
+    bench_layout("紧凑", ChatGPTSession, args.sessions, args.rounds, 0)
+    bench_layout("紧凑+zlib", ChatGPTSession, args.sessions, args.rounds, args.keep)
+
+
+if __name__ == "__main__":
+    main()
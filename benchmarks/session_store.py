@@ -0,0 +1,95 @@
+"""
+SessionManager会话存储基准测试，对比纯内存与sqlite持久化存储
+
+- 10万个会话、每个会话10条消息时进程内会话占用的内存
+- 写入后重启(新建SessionManager)的耗时和首次访问会话的耗时
+- session_query + session_reply的吞吐(包含从存储加载冷会话)
+
+用法(在项目根目录执行):
+    python -m benchmarks.session_store --sessions 100000
+"""
+
+import argparse
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from bot.session_manager import Session, SessionManager
+from common.log import logger
+from config import conf
+
+
+class BenchSession(Session):
+    def __init__(self, session_id, system_prompt=None, model="gpt-3.5-turbo"):
+        super().__init__(session_id, system_prompt)
+        self.model = model
+        self.reset()
+
+    def discard_exceeding(self, max_tokens=None, cur_tokens=None):
+        return 0
+
+
+def populate(manager, n, rounds=5):
+    for i in range(n):
+        session_id = "user_%d" % i
+        for r in range(rounds):
+            manager.session_query("第%d个问题，今天天气怎么样？帮我写一段关于春天的短文" % r, session_id)
+            manager.session_reply("好的，这是第%d段回复：春天来了，万物复苏，到处都是生机勃勃的景象。" % r, session_id)
+
+
+def bench_mode(store, n, path):
+    conf()["session_store"] = store
+    conf()["session_store_path"] = path
+    gc.collect()
+    tracemalloc.start()
+    manager = SessionManager(BenchSession)
+    start = time.perf_counter()
+    populate(manager, n)
+    manager.flush()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("  {:<8} 写入{}个会话 {:>6.2f}s  内存 {:>8.1f}MB".format(store, n, elapsed, size / 1024 / 1024))
+    return manager
+
+
+def bench_restart(n, path):
+    start = time.perf_counter()
+    manager = SessionManager(BenchSession)
+    startup = time.perf_counter() - start
+    ids = ["user_%d" % random.randrange(n) for _ in range(2000)]
+    start = time.perf_counter()
+    for session_id in ids:
+        assert len(manager.build_session(session_id).messages) == 11
+    cold = (time.perf_counter() - start) / len(ids)
+    start = time.perf_counter()
+    for session_id in ids:
+        manager.session_query("继续", session_id)
+        manager.session_reply("好的", session_id)
+    ops = len(ids) / (time.perf_counter() - start)
+    print("  重启 {:.3f}s  首次访问(从存储加载) {:.1f}us  query+reply {:.0f}次/s".format(startup, cold * 1e6, ops))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--cache-size", type=int, default=1000)
+    args = parser.parse_args()
+    logger.disabled = True
+    conf()["expires_in_seconds"] = 3600
+    conf()["session_cache_size"] = args.cache_size
+    conf()["session_flush_interval"] = 1
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    print("{}个会话(sqlite内存缓存{}个):".format(args.sessions, args.cache_size))
+    bench_mode("memory", args.sessions, path)
+    bench_mode("sqlite", args.sessions, path)
+    print("  数据库文件 {:.1f}MB".format(os.path.getsize(path) / 1024 / 1024))
+    bench_restart(args.sessions, path)
+
+
+if __name__ == "__main__":
+    main()
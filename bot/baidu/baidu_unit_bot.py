@@ -4,6 +4,7 @@ import requests
 
 from bot.bot import Bot
 from bridge.reply import Reply, ReplyType
+from common.token_cache import baidu_access_token
 
 
 # Baidu Unit对话接口 (可用, 但能力较弱)
@@ -29,8 +30,4 @@ class BaiduUnitBot(Bot):
     def get_token(self):
         access_key = "YOUR_ACCESS_KEY"
         secret_key = "YOUR_SECRET_KEY"
-        host = "https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id=" + access_key + "&client_secret=" + secret_key
-        response = requests.get(host)
-        if response:
-            print(response.json())
-            return response.json()["access_token"]
+        return baidu_access_token(access_key, secret_key)
@@ -1,8 +1,8 @@
 # encoding:utf-8
 
-import requests
 import json
-from common import const
+from common import const, http_client
+from common.token_cache import baidu_access_token
 from bot.bot import Bot
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
@@ -78,7 +78,7 @@ class BaiduWenxinBot(Bot):
         try:
             logger.info("[BAIDU] model={}".format(session.model))
             access_token = self.get_access_token()
-            if access_token == 'None':
+            if not access_token:
                 logger.warn("[BAIDU] access token 获取失败")
                 return {
                     "total_tokens": 0,
@@ -90,7 +90,7 @@ class BaiduWenxinBot(Bot):
                 'Content-Type': 'application/json'
             }
             payload = {'messages': session.messages, 'system': self.prompt} if self.prompt_enabled else {'messages': session.messages}
-            response = requests.request("POST", url, headers=headers, data=json.dumps(payload))
+            response = http_client.post(url, headers=headers, data=json.dumps(payload), retries=2)
             response_text = json.loads(response.text)
             logger.info(f"[BAIDU] response text={response_text}")
             res_content = response_text["result"]
@@ -112,9 +112,11 @@ class BaiduWenxinBot(Bot):
 
     def get_access_token(self):
         """
-        使用 AK，SK 生成鉴权签名（Access Token）
+        使用 AK，SK 生成鉴权签名（Access Token），有效期内复用缓存
         :return: access_token，或是None(如果错误)
         """
-        url = "https://aip.baidubce.com/oauth/2.0/token"
-        params = {"grant_type": "client_credentials", "client_id": BAIDU_API_KEY, "client_secret": BAIDU_SECRET_KEY}
-        return str(requests.post(url, params=params).json().get("access_token"))
+        try:
+            return baidu_access_token(BAIDU_API_KEY, BAIDU_SECRET_KEY)
+        except Exception as e:
+            logger.error("[BAIDU] get access token failed: {}".format(e))
+            return None
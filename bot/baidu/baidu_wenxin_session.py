@@ -1,5 +1,6 @@
 from bot.session_manager import Session
 from common.log import logger
+from common.tokenizer import num_tokens_by_character
 
 """
     e.g.  [
@@ -40,14 +41,6 @@ class BaiduWenxinSession(Session):
         return cur_tokens
 
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
-
-
-def num_tokens_from_messages(messages, model):
-    """Returns the number of tokens used by a list of messages."""
-    tokens = 0
-    for msg in messages:
         # 官方token计算规则暂不明确： "大约为 token数为 "中文字 + 其他语种单词数 x 1.3"
         # 这里先直接根据字数粗略估算吧，暂不影响正常使用，仅在判断是否丢弃历史会话的时候会有偏差
-        tokens += len(msg["content"])
-    return tokens
+        return num_tokens_by_character(self.messages)
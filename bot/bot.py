@@ -5,6 +5,7 @@ Auto-replay chat robot abstract class
 
 from bridge.context import Context
 from bridge.reply import Reply
+from common.async_utils import run_sync
 
 
 class Bot(object):
@@ -15,3 +16,20 @@ class Bot(object):
         :return: reply content
         """
         raise NotImplementedError
+
+    async def areply(self, query, context: Context = None) -> Reply:
+        """
+        async version of reply, the default implementation runs reply in a worker thread
+        :param req: received message
+        :return: reply content
+        """
+        return await run_sync(self.reply, query, context)
+
+    def reply_stream(self, query, context: Context = None):
+        """
+        bot auto-reply content in stream
+        yields text deltas, a Reply may be yielded instead (e.g. commands, errors, images) and will be sent as a normal reply
+        the default implementation yields the whole reply at once
+        :param req: received message
+        """
+        yield self.reply(query, context)
@@ -1,5 +1,8 @@
 # encoding:utf-8
 
+import asyncio
+import math
+import threading
 import time
 
 import openai
@@ -12,8 +15,9 @@ from bot.openai.open_ai_image import OpenAIImage
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common import async_http
 from common.log import logger
-from common.token_bucket import TokenBucket
+from common.token_bucket import KeyedTokenBucket, TokenBucket
 from config import conf, load_config
 from bot.baidu.baidu_wenxin_session import BaiduWenxinSession
 
@@ -30,6 +34,9 @@ class ChatGPTBot(Bot, OpenAIImage):
             openai.proxy = proxy
         if conf().get("rate_limit_chatgpt"):
             self.tb4chatgpt = TokenBucket(conf().get("rate_limit_chatgpt", 20))
+        # 按api key区分，每分钟允许提交的prompt token数，第一次用到时按当时的配置创建，支持#reconf后开启或修改
+        self.tb4prompt = None
+        self.tb4prompt_lock = threading.Lock()
         conf_model = conf().get("model") or "gpt-3.5-turbo"
         self.sessions = SessionManager(ChatGPTSession, model=conf().get("model") or "gpt-3.5-turbo")
         # o1相关模型不支持system prompt，暂时用文心模型的session
@@ -58,50 +65,16 @@ class ChatGPTBot(Bot, OpenAIImage):
             logger.info("[CHATGPT] query={}".format(query[:100]))
 
             session_id = context["session_id"]
-            reply = None
-            clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
-            if query in clear_memory_commands:
-                self.sessions.clear_session(session_id)
-                reply = Reply(ReplyType.INFO, "记忆已清除")
-            elif query == "#清除所有":
-                self.sessions.clear_all_session()
-                reply = Reply(ReplyType.INFO, "所有人记忆已清除")
-            elif query == "#更新配置":
-                load_config()
-                reply = Reply(ReplyType.INFO, "配置已更新")
+            reply = self._reply_command(query, session_id)
             if reply:
                 return reply
             session = self.sessions.session_query(query, session_id)
             logger.debug("[CHATGPT] session query={}".format(session.messages))
 
             api_key = context.get("openai_api_key")
-            model = context.get("gpt_model")
-            new_args = None
-            if model:
-                new_args = self.args.copy()
-                new_args["model"] = model
-            # if context.get('stream'):
-            #     # reply in stream
-            #     return self.reply_text_stream(query, new_query, session_id)
-
+            new_args = self._context_args(context)
             reply_content = self.reply_text(session, api_key, args=new_args)
-            logger.debug(
-                "[CHATGPT] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
-                    session.messages,
-                    session_id,
-                    reply_content["content"],
-                    reply_content["completion_tokens"],
-                )
-            )
-            if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
-                reply = Reply(ReplyType.ERROR, reply_content["content"])
-            elif reply_content["completion_tokens"] > 0:
-                self.sessions.session_reply(reply_content["content"], session_id, reply_content["total_tokens"])
-                reply = Reply(ReplyType.TEXT, reply_content["content"])
-            else:
-                reply = Reply(ReplyType.ERROR, reply_content["content"])
-                logger.debug("[CHATGPT] reply {} used 0 tokens.".format(reply_content))
-            return reply
+            return self._build_reply(session, reply_content)
 
         elif context.type == ContextType.IMAGE_CREATE:
             ok, retstring = self.create_img(query, 0)
@@ -115,6 +88,100 @@ class ChatGPTBot(Bot, OpenAIImage):
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
+    async def areply(self, query, context=None):
+        if context.type != ContextType.TEXT:
+            return await super().areply(query, context)
+        logger.info("[CHATGPT] query={}".format(query[:100]))
+        session_id = context["session_id"]
+        reply = self._reply_command(query, session_id)
+        if reply:
+            return reply
+        session = self.sessions.session_query(query, session_id)
+        logger.debug("[CHATGPT] session query={}".format(session.messages))
+        reply_content = await self.areply_text(session, context.get("openai_api_key"), args=self._context_args(context))
+        return self._build_reply(session, reply_content)
+
+    def reply_stream(self, query, context=None):
+        if context.type != ContextType.TEXT:
+            yield self.reply(query, context)
+            return
+        logger.info("[CHATGPT] stream query={}".format(query[:100]))
+        session_id = context["session_id"]
+        reply = self._reply_command(query, session_id)
+        if reply:
+            yield reply
+            return
+        session = self.sessions.session_query(query, session_id)
+        logger.debug("[CHATGPT] session query={}".format(session.messages))
+        api_key = context.get("openai_api_key")
+        args = self._context_args(context) or self.args
+        parts = []
+        try:
+            if conf().get("rate_limit_chatgpt") and not self.tb4chatgpt.get_token():
+                raise openai.error.RateLimitError("RateLimitError: rate limit exceeded")
+            limited = self._check_prompt_tokens(session, api_key)
+            if limited:
+                yield self._build_reply(session, limited)
+                return
+            response = openai.ChatCompletion.create(api_key=api_key, messages=session.messages, stream=True, **args)
+            for chunk in response:
+                if not chunk["choices"]:
+                    continue
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            if not parts:  # 还没有收到内容时按普通回复的方式返回错误提示，流式请求不重试
+                result, _ = self._handle_error(e, session, 2)
+                yield self._build_reply(session, result)
+                return
+            logger.warn("[CHATGPT] stream interrupted: {}".format(e))
+        content = "".join(parts)
+        logger.info("[ChatGPT] stream reply={}".format(content))
+        self.sessions.session_reply(content, session_id)
+
+    def _reply_command(self, query, session_id):
+        reply = None
+        clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
+        if query in clear_memory_commands:
+            self.sessions.clear_session(session_id)
+            reply = Reply(ReplyType.INFO, "记忆已清除")
+        elif query == "#清除所有":
+            self.sessions.clear_all_session()
+            reply = Reply(ReplyType.INFO, "所有人记忆已清除")
+        elif query == "#更新配置":
+            load_config()
+            reply = Reply(ReplyType.INFO, "配置已更新")
+        return reply
+
+    def _context_args(self, context):
+        model = context.get("gpt_model")
+        new_args = None
+        if model:
+            new_args = self.args.copy()
+            new_args["model"] = model
+        return new_args
+
+    def _build_reply(self, session, reply_content) -> Reply:
+        logger.debug(
+            "[CHATGPT] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
+                session.messages,
+                session.session_id,
+                reply_content["content"],
+                reply_content["completion_tokens"],
+            )
+        )
+        if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
+            reply = Reply(ReplyType.ERROR, reply_content["content"])
+        elif reply_content["completion_tokens"] > 0:
+            self.sessions.session_reply(reply_content["content"], session.session_id, reply_content["total_tokens"])
+            reply = Reply(ReplyType.TEXT, reply_content["content"])
+        else:
+            reply = Reply(ReplyType.ERROR, reply_content["content"])
+            logger.debug("[CHATGPT] reply {} used 0 tokens.".format(reply_content))
+        return reply
+
     def reply_text(self, session: ChatGPTSession, api_key=None, args=None, retry_count=0) -> dict:
         """
         call openai's ChatCompletion to get the answer
@@ -126,6 +193,9 @@ class ChatGPTBot(Bot, OpenAIImage):
         try:
             if conf().get("rate_limit_chatgpt") and not self.tb4chatgpt.get_token():
                 raise openai.error.RateLimitError("RateLimitError: rate limit exceeded")
+            limited = self._check_prompt_tokens(session, api_key)
+            if limited:
+                return limited
             # if api_key == None, the default openai.api_key will be used
             if args is None:
                 args = self.args
@@ -138,39 +208,96 @@ class ChatGPTBot(Bot, OpenAIImage):
                 "content": response.choices[0]["message"]["content"],
             }
         except Exception as e:
-            need_retry = retry_count < 2
-            result = {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
-            if isinstance(e, openai.error.RateLimitError):
-                logger.warn("[CHATGPT] RateLimitError: {}".format(e))
-                result["content"] = "提问太快啦，请休息一下再问我吧"
-                if need_retry:
-                    time.sleep(20)
-            elif isinstance(e, openai.error.Timeout):
-                logger.warn("[CHATGPT] Timeout: {}".format(e))
-                result["content"] = "我没有收到你的消息"
-                if need_retry:
-                    time.sleep(5)
-            elif isinstance(e, openai.error.APIError):
-                logger.warn("[CHATGPT] Bad Gateway: {}".format(e))
-                result["content"] = "请再问我一次"
-                if need_retry:
-                    time.sleep(10)
-            elif isinstance(e, openai.error.APIConnectionError):
-                logger.warn("[CHATGPT] APIConnectionError: {}".format(e))
-                result["content"] = "我连接不到你的网络"
-                if need_retry:
-                    time.sleep(5)
+            result, retry_delay = self._handle_error(e, session, retry_count)
+            if retry_delay is not None:
+                time.sleep(retry_delay)
+                logger.warn("[CHATGPT] 第{}次重试".format(retry_count + 1))
+                return self.reply_text(session, api_key, args, retry_count + 1)
             else:
-                logger.exception("[CHATGPT] Exception: {}".format(e))
-                need_retry = False
-                self.sessions.clear_session(session.session_id)
+                return result
 
-            if need_retry:
+    async def areply_text(self, session: ChatGPTSession, api_key=None, args=None, retry_count=0) -> dict:
+        """
+        async version of reply_text, shares the aiohttp client with other async bots
+        """
+        try:
+            if conf().get("rate_limit_chatgpt") and not await self.tb4chatgpt.aacquire(1, self.tb4chatgpt.timeout):
+                raise openai.error.RateLimitError("RateLimitError: rate limit exceeded")
+            limited = self._check_prompt_tokens(session, api_key)
+            if limited:
+                return limited
+            if args is None:
+                args = self.args
+            openai.aiosession.set(await async_http.get_session())
+            response = await openai.ChatCompletion.acreate(api_key=api_key, messages=session.messages, **args)
+            logger.info("[ChatGPT] reply={}, total_tokens={}".format(response.choices[0]['message']['content'], response["usage"]["total_tokens"]))
+            return {
+                "total_tokens": response["usage"]["total_tokens"],
+                "completion_tokens": response["usage"]["completion_tokens"],
+                "content": response.choices[0]["message"]["content"],
+            }
+        except Exception as e:
+            result, retry_delay = self._handle_error(e, session, retry_count)
+            if retry_delay is not None:
+                await asyncio.sleep(retry_delay)
                 logger.warn("[CHATGPT] 第{}次重试".format(retry_count + 1))
-                return self.reply_text(session, api_key, args, retry_count + 1)
+                return await self.areply_text(session, api_key, args, retry_count + 1)
             else:
                 return result
 
+    def _check_prompt_tokens(self, session, api_key):
+        """
+        按prompt的token数限流，超出时返回提示等待时间的错误回复，不重试
+        """
+        tpm = conf().get("rate_limit_chatgpt_tokens", 0)
+        if not tpm:
+            return None
+        tb4prompt = self.tb4prompt
+        if tb4prompt is None or tb4prompt.tpm != tpm:
+            with self.tb4prompt_lock:
+                tb4prompt = self.tb4prompt
+                if tb4prompt is None or tb4prompt.tpm != tpm:
+                    tb4prompt = self.tb4prompt = KeyedTokenBucket(tpm)
+        try:
+            prompt_tokens = session.calc_tokens()
+        except Exception as e:
+            logger.debug("[CHATGPT] calc prompt tokens failed: {}".format(e))
+            return None
+        wait = tb4prompt.try_acquire(api_key or "default", prompt_tokens)
+        if wait <= 0:
+            return None
+        logger.warn("[CHATGPT] prompt token rate limit exceeded, prompt_tokens={}, wait={:.1f}s".format(prompt_tokens, wait))
+        return {"completion_tokens": 0, "content": "提问太快啦，请{}秒后再问我吧".format(math.ceil(wait))}
+
+    def _handle_error(self, e, session, retry_count):
+        """
+        :return: (错误回复, 重试前等待的秒数)，不需要重试时等待秒数为None
+        """
+        need_retry = retry_count < 2
+        result = {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
+        retry_delay = None
+        if isinstance(e, openai.error.RateLimitError):
+            logger.warn("[CHATGPT] RateLimitError: {}".format(e))
+            result["content"] = "提问太快啦，请休息一下再问我吧"
+            retry_delay = 20
+        elif isinstance(e, openai.error.Timeout):
+            logger.warn("[CHATGPT] Timeout: {}".format(e))
+            result["content"] = "我没有收到你的消息"
+            retry_delay = 5
+        elif isinstance(e, openai.error.APIError):
+            logger.warn("[CHATGPT] Bad Gateway: {}".format(e))
+            result["content"] = "请再问我一次"
+            retry_delay = 10
+        elif isinstance(e, openai.error.APIConnectionError):
+            logger.warn("[CHATGPT] APIConnectionError: {}".format(e))
+            result["content"] = "我连接不到你的网络"
+            retry_delay = 5
+        else:
+            logger.exception("[CHATGPT] Exception: {}".format(e))
+            need_retry = False
+            self.sessions.clear_session(session.session_id)
+        return result, retry_delay if need_retry else None
+
 
 class AzureChatGPTBot(ChatGPTBot):
     def __init__(self):
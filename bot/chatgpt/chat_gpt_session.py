@@ -1,6 +1,6 @@
 from bot.session_manager import Session
 from common.log import logger
-from common import const
+from common.tokenizer import get_tokenizer, num_tokens_by_character, num_tokens_from_messages  # noqa: F401
 
 """
     e.g.  [
@@ -13,9 +13,12 @@ from common import const
 
 
 class ChatGPTSession(Session):
+    transient_attrs = ("token_cache",)
+
     def __init__(self, session_id, system_prompt=None, model="gpt-3.5-turbo"):
         super().__init__(session_id, system_prompt)
         self.model = model
+        self.token_cache = {}  # id(message) -> (message, tokens)，每条消息只计算一次token
         self.reset()
 
     def discard_exceeding(self, max_tokens, cur_tokens=None):
@@ -29,11 +32,11 @@ class ChatGPTSession(Session):
             logger.debug("Exception when counting tokens precisely for query: {}".format(e))
         while cur_tokens > max_tokens:
             if len(self.messages) > 2:
-                self.messages.pop(1)
+                removed_tokens = self._discard_message(1)
             elif len(self.messages) == 2 and self.messages[1]["role"] == "assistant":
-                self.messages.pop(1)
+                removed_tokens = self._discard_message(1)
                 if precise:
-                    cur_tokens = self.calc_tokens()
+                    cur_tokens = cur_tokens - removed_tokens
                 else:
                     cur_tokens = cur_tokens - max_tokens
                 break
@@ -44,61 +47,46 @@ class ChatGPTSession(Session):
                 logger.debug("max_tokens={}, total_tokens={}, len(messages)={}".format(max_tokens, cur_tokens, len(self.messages)))
                 break
             if precise:
-                cur_tokens = self.calc_tokens()
+                cur_tokens = cur_tokens - removed_tokens
             else:
                 cur_tokens = cur_tokens - max_tokens
         return cur_tokens
 
-    def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
-
-
-# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-def num_tokens_from_messages(messages, model):
-    """Returns the number of tokens used by a list of messages."""
+    def compact(self):
+        super().compact()
+        self.token_cache = {}  # token数已经存入history，不再引用展开的消息
 
-    if model in ["wenxin", "xunfei"] or model.startswith(const.GEMINI):
-        return num_tokens_by_character(messages)
+    def _message_tokens(self, message):
+        cached = self.token_cache.get(id(message))
+        return cached[1] if cached is not None and cached[0] is message else -1
 
-    import tiktoken
+    def _restore_tokens(self, messages, tokens):
+        self.token_cache = {id(message): (message, count) for message, count in zip(messages, tokens) if count >= 0}
 
-    if model in ["gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106", "moonshot", const.LINKAI_35]:
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    elif model in ["gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
-                   "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
-                   "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
-                   const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO, const.GPT_5, const.GPT_5_MINI, const.GPT_5_NANO]:
-        return num_tokens_from_messages(messages, model="gpt-4")
-    elif model.startswith("claude-3"):
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.debug("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
-    elif model == "gpt-4":
-        tokens_per_message = 3
-        tokens_per_name = 1
-    else:
-        logger.debug(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+    def _discard_message(self, index):
+        """丢弃一条消息，返回它占用的token数(未计算过时返回0)"""
+        message = self.messages.pop(index)
+        cached = self.token_cache.pop(id(message), None)
+        return cached[1] if cached is not None and cached[0] is message else 0
 
-
-def num_tokens_by_character(messages):
-    """Returns the number of tokens used by a list of messages."""
-    tokens = 0
-    for msg in messages:
-        tokens += len(msg["content"])
-    return tokens
+    def calc_tokens(self):
+        """
+        计算当前会话的token数，已经计算过的消息直接使用缓存的结果
+        messages可能被插件等外部代码直接修改，所以按消息对象而不是下标缓存
+        """
+        tokenizer = get_tokenizer(self.model)
+        token_cache = {}
+        uncached = []
+        total = tokenizer.priming_tokens
+        for message in self.messages:
+            cached = self.token_cache.get(id(message))
+            if cached is not None and cached[0] is message:
+                token_cache[id(message)] = cached
+                total += cached[1]
+            else:
+                uncached.append(message)
+        for message, tokens in zip(uncached, tokenizer.count_many(uncached)):
+            token_cache[id(message)] = (message, tokens)
+            total += tokens
+        self.token_cache = token_cache
+        return total
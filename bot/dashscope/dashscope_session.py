@@ -1,5 +1,6 @@
 from bot.session_manager import Session
 from common.log import logger
+from common.tokenizer import num_tokens_by_character
 
 
 class DashscopeSession(Session):
@@ -40,12 +41,5 @@ class DashscopeSession(Session):
         return cur_tokens
 
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages)
-
-
-def num_tokens_from_messages(messages):
-    # 只是大概，具体计算规则：https://help.aliyun.com/zh/dashscope/developer-reference/token-api?spm=a2c4g.11186623.0.0.4d8b12b0BkP3K9
-    tokens = 0
-    for msg in messages:
-        tokens += len(msg["content"])
-    return tokens
+        # 只是大概，具体计算规则：https://help.aliyun.com/zh/dashscope/developer-reference/token-api?spm=a2c4g.11186623.0.0.4d8b12b0BkP3K9
+        return num_tokens_by_character(self.messages)
@@ -3,7 +3,6 @@
 
 import re
 import time
-import requests
 import config
 from bot.bot import Bot
 from bot.chatgpt.chat_gpt_session import ChatGPTSession
@@ -13,7 +12,7 @@ from bridge.reply import Reply, ReplyType
 from common.log import logger
 from config import conf, pconf
 import threading
-from common import memory, utils
+from common import http_client, memory, utils
 import base64
 import os
 
@@ -44,19 +43,13 @@ class LinkAIBot(Bot):
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
-    def _chat(self, query, context, retry_count=0) -> Reply:
+    def _chat(self, query, context) -> Reply:
         """
         发起对话请求
         :param query: 请求提示词
         :param context: 对话上下文
-        :param retry_count: 当前递归重试次数
         :return: 回复
         """
-        if retry_count > 2:
-            # exit from retry 2 times
-            logger.warn("[LINKAI] failed after maximum number of retry times")
-            return Reply(ReplyType.TEXT, "请再问我一次吧")
-
         try:
             # load config
             if context.get("generate_breaked_by"):
@@ -123,8 +116,7 @@ class LinkAIBot(Bot):
 
             # do http request
             base_url = conf().get("linkai_api_base", "https://api.link-ai.tech")
-            res = requests.post(url=base_url + "/v1/chat/completions", json=body, headers=headers,
-                                timeout=conf().get("request_timeout", 180))
+            res = http_client.post(base_url + "/v1/chat/completions", json=body, headers=headers, retries=2, backoff=2, retry_status=http_client.SERVER_ERROR_STATUS)
             if res.status_code == 200:
                 # execute success
                 response = res.json()
@@ -159,10 +151,8 @@ class LinkAIBot(Bot):
                              f"msg={error.get('message')}, type={error.get('type')}")
 
                 if res.status_code >= 500:
-                    # server error, need retry
-                    time.sleep(2)
-                    logger.warn(f"[LINKAI] do retry, times={retry_count}")
-                    return self._chat(query, context, retry_count + 1)
+                    # 重试后仍然是服务端错误
+                    return Reply(ReplyType.TEXT, "请再问我一次吧")
 
                 error_reply = "提问太快啦，请休息一下再问我吧"
                 if res.status_code == 409:
@@ -171,10 +161,7 @@ class LinkAIBot(Bot):
 
         except Exception as e:
             logger.exception(e)
-            # retry
-            time.sleep(2)
-            logger.warn(f"[LINKAI] do retry, times={retry_count}")
-            return self._chat(query, context, retry_count + 1)
+            return Reply(ReplyType.TEXT, "请再问我一次吧")
 
     def _process_image_msg(self, app_code: str, session_id: str, query:str, img_cache: dict):
         try:
@@ -236,16 +223,7 @@ class LinkAIBot(Bot):
         except Exception as e:
             logger.exception(e)
 
-    def reply_text(self, session: ChatGPTSession, app_code="", retry_count=0) -> dict:
-        if retry_count >= 2:
-            # exit from retry 2 times
-            logger.warn("[LINKAI] failed after maximum number of retry times")
-            return {
-                "total_tokens": 0,
-                "completion_tokens": 0,
-                "content": "请再问我一次吧"
-            }
-
+    def reply_text(self, session: ChatGPTSession, app_code="") -> dict:
         try:
             body = {
                 "app_code": app_code,
@@ -262,8 +240,7 @@ class LinkAIBot(Bot):
 
             # do http request
             base_url = conf().get("linkai_api_base", "https://api.link-ai.tech")
-            res = requests.post(url=base_url + "/v1/chat/completions", json=body, headers=headers,
-                                timeout=conf().get("request_timeout", 180))
+            res = http_client.post(base_url + "/v1/chat/completions", json=body, headers=headers, retries=2, backoff=2, retry_status=http_client.SERVER_ERROR_STATUS)
             if res.status_code == 200:
                 # execute success
                 response = res.json()
@@ -283,10 +260,12 @@ class LinkAIBot(Bot):
                              f"msg={error.get('message')}, type={error.get('type')}")
 
                 if res.status_code >= 500:
-                    # server error, need retry
-                    time.sleep(2)
-                    logger.warn(f"[LINKAI] do retry, times={retry_count}")
-                    return self.reply_text(session, app_code, retry_count + 1)
+                    # 重试后仍然是服务端错误
+                    return {
+                        "total_tokens": 0,
+                        "completion_tokens": 0,
+                        "content": "请再问我一次吧"
+                    }
 
                 return {
                     "total_tokens": 0,
@@ -296,17 +275,18 @@ class LinkAIBot(Bot):
 
         except Exception as e:
             logger.exception(e)
-            # retry
-            time.sleep(2)
-            logger.warn(f"[LINKAI] do retry, times={retry_count}")
-            return self.reply_text(session, app_code, retry_count + 1)
+            return {
+                "total_tokens": 0,
+                "completion_tokens": 0,
+                "content": "请再问我一次吧"
+            }
 
     def _fetch_app_info(self, app_code: str):
         headers = {"Authorization": "Bearer " + conf().get("linkai_api_key")}
         # do http request
         base_url = conf().get("linkai_api_base", "https://api.link-ai.tech")
         params = {"app_code": app_code}
-        res = requests.get(url=base_url + "/v1/app/info", params=params, headers=headers, timeout=(5, 10))
+        res = http_client.get(base_url + "/v1/app/info", params=params, headers=headers, timeout=(5, 10))
         if res.status_code == 200:
             return res.json()
         else:
@@ -327,7 +307,7 @@ class LinkAIBot(Bot):
                 "img_proxy": conf().get("image_proxy")
             }
             url = conf().get("linkai_api_base", "https://api.link-ai.tech") + "/v1/images/generations"
-            res = requests.post(url, headers=headers, json=data, timeout=(5, 90))
+            res = http_client.post(url, headers=headers, json=data, timeout=(5, 90))
             t2 = time.time()
             image_url = res.json()["data"][0]["url"]
             logger.info("[OPEN_AI] image_url={}".format(image_url))
@@ -430,7 +410,7 @@ def _download_file(url: str):
             os.makedirs(file_path)
         file_name = url.split("/")[-1]  # 获取文件名
         file_path = os.path.join(file_path, file_name)
-        response = requests.get(url)
+        response = http_client.get(url)
         with open(file_path, "wb") as f:
             f.write(response.content)
         return file_path
@@ -441,6 +421,7 @@ def _download_file(url: str):
 class LinkAISessionManager(SessionManager):
     def session_msg_query(self, query, session_id):
         session = self.build_session(session_id)
+        session.begin_request()
         messages = session.messages + [{"role": "user", "content": query}]
         return messages
 
@@ -455,6 +436,8 @@ class LinkAISessionManager(SessionManager):
             logger.debug(f"[LinkAI] chat history, before tokens={total_tokens}, now tokens={tokens_cnt}")
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for session: {}".format(str(e)))
+        self._mark_dirty(session_id, session)
+        session.finish_request()
         return session
 
 
@@ -1,6 +1,6 @@
 # encoding:utf-8
 
-import time
+import asyncio
 
 import openai
 import openai.error
@@ -9,10 +9,10 @@ from bot.minimax.minimax_session import MinimaxSession
 from bot.session_manager import SessionManager
 from bridge.context import Context, ContextType
 from bridge.reply import Reply, ReplyType
+from common import async_http, http_client
 from common.log import logger
 from config import conf, load_config
 from bot.chatgpt.chat_gpt_session import ChatGPTSession
-import requests
 from common import const
 
 
@@ -48,52 +48,76 @@ class MinimaxBot(Bot):
         logger.info("[Minimax_AI] query={}".format(query))
         if context.type == ContextType.TEXT:
             session_id = context["session_id"]
-            reply = None
-            clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
-            if query in clear_memory_commands:
-                self.sessions.clear_session(session_id)
-                reply = Reply(ReplyType.INFO, "记忆已清除")
-            elif query == "#清除所有":
-                self.sessions.clear_all_session()
-                reply = Reply(ReplyType.INFO, "所有人记忆已清除")
-            elif query == "#更新配置":
-                load_config()
-                reply = Reply(ReplyType.INFO, "配置已更新")
+            reply = self._reply_command(query, session_id)
             if reply:
                 return reply
             session = self.sessions.session_query(query, session_id)
             logger.debug("[Minimax_AI] session query={}".format(session))
 
-            model = context.get("Minimax_model")
-            new_args = self.args.copy()
-            if model:
-                new_args["model"] = model
+            new_args = self._context_args(context)
             # if context.get('stream'):
             #     # reply in stream
             #     return self.reply_text_stream(query, new_query, session_id)
 
             reply_content = self.reply_text(session, args=new_args)
-            logger.debug(
-                "[Minimax_AI] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
-                    session.messages,
-                    session_id,
-                    reply_content["content"],
-                    reply_content["completion_tokens"],
-                )
-            )
-            if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
-                reply = Reply(ReplyType.ERROR, reply_content["content"])
-            elif reply_content["completion_tokens"] > 0:
-                self.sessions.session_reply(reply_content["content"], session_id, reply_content["total_tokens"])
-                reply = Reply(ReplyType.TEXT, reply_content["content"])
-            else:
-                reply = Reply(ReplyType.ERROR, reply_content["content"])
-                logger.debug("[Minimax_AI] reply {} used 0 tokens.".format(reply_content))
-            return reply
+            return self._build_reply(session, reply_content)
         else:
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
+    async def areply(self, query, context: Context = None) -> Reply:
+        if context.type != ContextType.TEXT:
+            return await super().areply(query, context)
+        logger.info("[Minimax_AI] query={}".format(query))
+        session_id = context["session_id"]
+        reply = self._reply_command(query, session_id)
+        if reply:
+            return reply
+        session = self.sessions.session_query(query, session_id)
+        logger.debug("[Minimax_AI] session query={}".format(session))
+        reply_content = await self.areply_text(session, args=self._context_args(context))
+        return self._build_reply(session, reply_content)
+
+    def _reply_command(self, query, session_id):
+        reply = None
+        clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
+        if query in clear_memory_commands:
+            self.sessions.clear_session(session_id)
+            reply = Reply(ReplyType.INFO, "记忆已清除")
+        elif query == "#清除所有":
+            self.sessions.clear_all_session()
+            reply = Reply(ReplyType.INFO, "所有人记忆已清除")
+        elif query == "#更新配置":
+            load_config()
+            reply = Reply(ReplyType.INFO, "配置已更新")
+        return reply
+
+    def _context_args(self, context):
+        model = context.get("Minimax_model")
+        new_args = self.args.copy()
+        if model:
+            new_args["model"] = model
+        return new_args
+
+    def _build_reply(self, session, reply_content) -> Reply:
+        logger.debug(
+            "[Minimax_AI] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
+                session.messages,
+                session.session_id,
+                reply_content["content"],
+                reply_content["completion_tokens"],
+            )
+        )
+        if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
+            reply = Reply(ReplyType.ERROR, reply_content["content"])
+        elif reply_content["completion_tokens"] > 0:
+            self.sessions.session_reply(reply_content["content"], session.session_id, reply_content["total_tokens"])
+            reply = Reply(ReplyType.TEXT, reply_content["content"])
+        else:
+            reply = Reply(ReplyType.ERROR, reply_content["content"])
+            logger.debug("[Minimax_AI] reply {} used 0 tokens.".format(reply_content))
+        return reply
+
     def reply_text(self, session: MinimaxSession, args=None, retry_count=0) -> dict:
         """
         call openai's ChatCompletion to get the answer
@@ -107,38 +131,35 @@ class MinimaxBot(Bot):
             self.request_body["messages"].extend(session.messages)
             logger.info("[Minimax_AI] request_body={}".format(self.request_body))
             # logger.info("[Minimax_AI] reply={}, total_tokens={}".format(response.choices[0]['message']['content'], response["usage"]["total_tokens"]))
-            res = requests.post(self.base_url, headers=headers, json=self.request_body)
+            res = http_client.post(self.base_url, headers=headers, json=self.request_body, retries=2, backoff=3)
 
             # self.request_body["messages"].extend(response.json()["choices"][0]["messages"])
             if res.status_code == 200:
-                response = res.json()
-                return {
-                    "total_tokens": response["usage"]["total_tokens"],
-                    "completion_tokens": response["usage"]["total_tokens"],
-                    "content": response["reply"],
-                }
+                return self._parse_response(res.json())
             else:
-                response = res.json()
-                error = response.get("error")
-                logger.error(f"[Minimax_AI] chat failed, status_code={res.status_code}, " f"msg={error.get('message')}, type={error.get('type')}")
-
-                result = {"completion_tokens": 0, "content": "提问太快啦，请休息一下再问我吧"}
-                need_retry = False
-                if res.status_code >= 500:
-                    # server error, need retry
-                    logger.warn(f"[Minimax_AI] do retry, times={retry_count}")
-                    need_retry = retry_count < 2
-                elif res.status_code == 401:
-                    result["content"] = "授权失败，请检查API Key是否正确"
-                elif res.status_code == 429:
-                    result["content"] = "请求过于频繁，请稍后再试"
-                    need_retry = retry_count < 2
-                else:
-                    need_retry = False
+                result, _ = self._handle_error_response(res.status_code, res.json(), retry_count)
+                return result
+        except Exception as e:
+            logger.exception(e)
+            return {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
 
+    async def areply_text(self, session: MinimaxSession, args=None, retry_count=0) -> dict:
+        """
+        async version of reply_text, shares the aiohttp client with other async bots
+        """
+        try:
+            headers = {"Content-Type": "application/json", "Authorization": "Bearer " + self.api_key}
+            # 不修改共享的request_body，避免并发请求之间互相串消息
+            body = dict(self.request_body)
+            body["messages"] = list(session.messages)
+            status_code, response = await async_http.post_json(self.base_url, headers=headers, body=body)
+            if status_code == 200:
+                return self._parse_response(response)
+            else:
+                result, need_retry = self._handle_error_response(status_code, response, retry_count)
                 if need_retry:
-                    time.sleep(3)
-                    return self.reply_text(session, args, retry_count + 1)
+                    await asyncio.sleep(3)
+                    return await self.areply_text(session, args, retry_count + 1)
                 else:
                     return result
         except Exception as e:
@@ -146,6 +167,33 @@ class MinimaxBot(Bot):
             need_retry = retry_count < 2
             result = {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
             if need_retry:
-                return self.reply_text(session, args, retry_count + 1)
+                return await self.areply_text(session, args, retry_count + 1)
             else:
                 return result
+
+    def _parse_response(self, response) -> dict:
+        return {
+            "total_tokens": response["usage"]["total_tokens"],
+            "completion_tokens": response["usage"]["total_tokens"],
+            "content": response["reply"],
+        }
+
+    def _handle_error_response(self, status_code, response, retry_count):
+        """
+        :return: (错误回复, 是否需要重试)
+        """
+        error = response.get("error")
+        logger.error(f"[Minimax_AI] chat failed, status_code={status_code}, " f"msg={error.get('message')}, type={error.get('type')}")
+
+        result = {"completion_tokens": 0, "content": "提问太快啦，请休息一下再问我吧"}
+        need_retry = False
+        if status_code >= 500:
+            # server error, need retry
+            logger.warn(f"[Minimax_AI] do retry, times={retry_count}")
+            need_retry = retry_count < 2
+        elif status_code == 401:
+            result["content"] = "授权失败，请检查API Key是否正确"
+        elif status_code == 429:
+            result["content"] = "请求过于频繁，请稍后再试"
+            need_retry = retry_count < 2
+        return result, need_retry
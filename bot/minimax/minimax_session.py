@@ -1,5 +1,6 @@
 from bot.session_manager import Session
 from common.log import logger
+from common.tokenizer import num_tokens_by_character
 
 """
     e.g.
@@ -58,15 +59,7 @@ class MinimaxSession(Session):
         return cur_tokens
 
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
-
-
-def num_tokens_from_messages(messages, model):
-    """Returns the number of tokens used by a list of messages."""
-    # 官方token计算规则："对于中文文本来说，1个token通常对应一个汉字；对于英文文本来说，1个token通常对应3至4个字母或1个单词"
-    # 详情请产看文档：https://help.aliyun.com/document_detail/2586397.html
-    # 目前根据字符串长度粗略估计token数，不影响正常使用
-    tokens = 0
-    for msg in messages:
-        tokens += len(msg["text"])
-    return tokens
+        # 官方token计算规则："对于中文文本来说，1个token通常对应一个汉字；对于英文文本来说，1个token通常对应3至4个字母或1个单词"
+        # 详情请产看文档：https://help.aliyun.com/document_detail/2586397.html
+        # 目前根据字符串长度粗略估计token数，不影响正常使用
+        return num_tokens_by_character(self.messages, key="text")
@@ -1,6 +1,6 @@
 # encoding:utf-8
 
-import time
+import asyncio
 import json
 import openai
 import openai.error
@@ -8,10 +8,11 @@ from bot.bot import Bot
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common import async_http, http_client
+from common.async_utils import run_sync
 from common.log import logger
 from config import conf, load_config
 from .modelscope_session import ModelScopeSession
-import requests
 
 
 # ModelScope对话模型API
@@ -40,53 +41,18 @@ class ModelScopeBot(Bot):
             logger.info("[MODELSCOPE_AI] query={}".format(query))
 
             session_id = context["session_id"]
-            reply = None
-            clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
-            if query in clear_memory_commands:
-                self.sessions.clear_session(session_id)
-                reply = Reply(ReplyType.INFO, "记忆已清除")
-            elif query == "#清除所有":
-                self.sessions.clear_all_session()
-                reply = Reply(ReplyType.INFO, "所有人记忆已清除")
-            elif query == "#更新配置":
-                load_config()
-                reply = Reply(ReplyType.INFO, "配置已更新")
+            reply = self._reply_command(query, session_id)
             if reply:
                 return reply
             session = self.sessions.session_query(query, session_id)
             logger.debug("[MODELSCOPE_AI] session query={}".format(session.messages))
 
-            model = context.get("modelscope_model")
-            new_args = self.args.copy()
-            if model:
-                new_args["model"] = model
-
+            new_args = self._context_args(context)
             if new_args["model"] == "Qwen/QwQ-32B":
                 reply_content = self.reply_text_stream(session, args=new_args)
             else:
                 reply_content = self.reply_text(session, args=new_args)
-
-            logger.debug(
-                "[MODELSCOPE_AI] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
-                    session.messages,
-                    session_id,
-                    reply_content["content"],
-                    reply_content["completion_tokens"],
-                )
-            )
-            if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
-                # 只有当 content 为空且 completion_tokens 为 0 时才标记为错误
-                if len(reply_content["content"]) == 0:
-                    reply = Reply(ReplyType.ERROR, reply_content["content"])
-                else:
-                    reply = Reply(ReplyType.TEXT, reply_content["content"])
-            elif reply_content["completion_tokens"] > 0:
-                self.sessions.session_reply(reply_content["content"], session_id, reply_content["total_tokens"])
-                reply = Reply(ReplyType.TEXT, reply_content["content"])
-            else:
-                reply = Reply(ReplyType.ERROR, reply_content["content"])
-                logger.debug("[MODELSCOPE_AI] reply {} used 0 tokens.".format(reply_content))
-            return reply
+            return self._build_reply(session, reply_content)
         elif context.type == ContextType.IMAGE_CREATE:
             ok, retstring = self.create_img(query, 0)
             reply = None
@@ -99,6 +65,104 @@ class ModelScopeBot(Bot):
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
+    async def areply(self, query, context=None):
+        if context.type != ContextType.TEXT:
+            return await super().areply(query, context)
+        logger.info("[MODELSCOPE_AI] query={}".format(query))
+        session_id = context["session_id"]
+        reply = self._reply_command(query, session_id)
+        if reply:
+            return reply
+        session = self.sessions.session_query(query, session_id)
+        logger.debug("[MODELSCOPE_AI] session query={}".format(session.messages))
+        new_args = self._context_args(context)
+        if new_args["model"] == "Qwen/QwQ-32B":
+            reply_content = await run_sync(self.reply_text_stream, session, args=new_args)
+        else:
+            reply_content = await self.areply_text(session, args=new_args)
+        return self._build_reply(session, reply_content)
+
+    def reply_stream(self, query, context=None):
+        if context.type != ContextType.TEXT:
+            yield self.reply(query, context)
+            return
+        logger.info("[MODELSCOPE_AI] stream query={}".format(query))
+        session_id = context["session_id"]
+        reply = self._reply_command(query, session_id)
+        if reply:
+            yield reply
+            return
+        session = self.sessions.session_query(query, session_id)
+        logger.debug("[MODELSCOPE_AI] session query={}".format(session.messages))
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer " + self.api_key
+        }
+        body = self._context_args(context)
+        body["messages"] = session.messages
+        body["stream"] = True
+        parts = []
+        try:
+            res = http_client.post(self.base_url, headers=headers, data=json.dumps(body), stream=True, retries=2, backoff=3)
+            if res.status_code != 200:
+                result, _ = self._handle_error_response(res.status_code, res.json(), 2)
+                yield self._build_reply(session, result)
+                return
+            for delta in self._iter_stream(res):
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            if not parts:
+                logger.exception(e)
+                yield self._build_reply(session, {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"})
+                return
+            logger.warn("[MODELSCOPE_AI] stream interrupted: {}".format(e))
+        self.sessions.session_reply("".join(parts), session_id)
+
+    def _reply_command(self, query, session_id):
+        reply = None
+        clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
+        if query in clear_memory_commands:
+            self.sessions.clear_session(session_id)
+            reply = Reply(ReplyType.INFO, "记忆已清除")
+        elif query == "#清除所有":
+            self.sessions.clear_all_session()
+            reply = Reply(ReplyType.INFO, "所有人记忆已清除")
+        elif query == "#更新配置":
+            load_config()
+            reply = Reply(ReplyType.INFO, "配置已更新")
+        return reply
+
+    def _context_args(self, context):
+        model = context.get("modelscope_model")
+        new_args = self.args.copy()
+        if model:
+            new_args["model"] = model
+        return new_args
+
+    def _build_reply(self, session, reply_content) -> Reply:
+        logger.debug(
+            "[MODELSCOPE_AI] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
+                session.messages,
+                session.session_id,
+                reply_content["content"],
+                reply_content["completion_tokens"],
+            )
+        )
+        if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
+            # 只有当 content 为空且 completion_tokens 为 0 时才标记为错误
+            if len(reply_content["content"]) == 0:
+                reply = Reply(ReplyType.ERROR, reply_content["content"])
+            else:
+                reply = Reply(ReplyType.TEXT, reply_content["content"])
+        elif reply_content["completion_tokens"] > 0:
+            self.sessions.session_reply(reply_content["content"], session.session_id, reply_content["total_tokens"])
+            reply = Reply(ReplyType.TEXT, reply_content["content"])
+        else:
+            reply = Reply(ReplyType.ERROR, reply_content["content"])
+            logger.debug("[MODELSCOPE_AI] reply {} used 0 tokens.".format(reply_content))
+        return reply
+
     def reply_text(self, session: ModelScopeSession, args=None, retry_count=0) -> dict:
         """
         call openai's ChatCompletion to get the answer
@@ -115,47 +179,36 @@ class ModelScopeBot(Bot):
             
             body = args
             body["messages"] = session.messages
-            res = requests.post(
-                self.base_url,
-                headers=headers,
-                data=json.dumps(body)
-            )
+            res = http_client.post(self.base_url, headers=headers, data=json.dumps(body), retries=2, backoff=3)
 
             if res.status_code == 200:
-                response = res.json()
-                return {
-                    "total_tokens": response["usage"]["total_tokens"],
-                    "completion_tokens": response["usage"]["completion_tokens"],
-                    "content": response["choices"][0]["message"]["content"]
-                }
+                return self._parse_response(res.json())
             else:
-                response = res.json()
-                if "errors" in response:
-                    error = response.get("errors")
-                elif "error" in response:
-                    error = response.get("error")
-                else:
-                    error = "Unknown error"
-                logger.error(f"[MODELSCOPE_AI] chat failed, status_code={res.status_code}, "
-                             f"msg={error.get('message')}, type={error.get('type')}")
-
-                result = {"completion_tokens": 0, "content": "提问太快啦，请休息一下再问我吧"}
-                need_retry = False
-                if res.status_code >= 500:
-                    # server error, need retry
-                    logger.warn(f"[MODELSCOPE_AI] do retry, times={retry_count}")
-                    need_retry = retry_count < 2
-                elif res.status_code == 401:
-                    result["content"] = "授权失败，请检查API Key是否正确"
-                elif res.status_code == 429:
-                    result["content"] = "请求过于频繁，请稍后再试"
-                    need_retry = retry_count < 2
-                else:
-                    need_retry = False
+                result, _ = self._handle_error_response(res.status_code, res.json(), retry_count)
+                return result
+        except Exception as e:
+            logger.exception(e)
+            return {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
 
+    async def areply_text(self, session: ModelScopeSession, args=None, retry_count=0) -> dict:
+        """
+        async version of reply_text, shares the aiohttp client with other async bots
+        """
+        try:
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": "Bearer " + self.api_key
+            }
+            body = args
+            body["messages"] = session.messages
+            status_code, response = await async_http.post_json(self.base_url, headers=headers, body=body)
+            if status_code == 200:
+                return self._parse_response(response)
+            else:
+                result, need_retry = self._handle_error_response(status_code, response, retry_count)
                 if need_retry:
-                    time.sleep(3)
-                    return self.reply_text(session, args, retry_count + 1)
+                    await asyncio.sleep(3)
+                    return await self.areply_text(session, args, retry_count + 1)
                 else:
                     return result
         except Exception as e:
@@ -163,10 +216,59 @@ class ModelScopeBot(Bot):
             need_retry = retry_count < 2
             result = {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
             if need_retry:
-                return self.reply_text(session, args, retry_count + 1)
+                return await self.areply_text(session, args, retry_count + 1)
             else:
                 return result
 
+    def _parse_response(self, response) -> dict:
+        return {
+            "total_tokens": response["usage"]["total_tokens"],
+            "completion_tokens": response["usage"]["completion_tokens"],
+            "content": response["choices"][0]["message"]["content"]
+        }
+
+    def _handle_error_response(self, status_code, response, retry_count):
+        """
+        :return: (错误回复, 是否需要重试)
+        """
+        if "errors" in response:
+            error = response.get("errors")
+        elif "error" in response:
+            error = response.get("error")
+        else:
+            error = "Unknown error"
+        logger.error(f"[MODELSCOPE_AI] chat failed, status_code={status_code}, "
+                     f"msg={error.get('message')}, type={error.get('type')}")
+
+        result = {"completion_tokens": 0, "content": "提问太快啦，请休息一下再问我吧"}
+        need_retry = False
+        if status_code >= 500:
+            # server error, need retry
+            logger.warn(f"[MODELSCOPE_AI] do retry, times={retry_count}")
+            need_retry = retry_count < 2
+        elif status_code == 401:
+            result["content"] = "授权失败，请检查API Key是否正确"
+        elif status_code == 429:
+            result["content"] = "请求过于频繁，请稍后再试"
+            need_retry = retry_count < 2
+        return result, need_retry
+
+    def _iter_stream(self, res):
+        """
+        解析SSE流式响应，逐个返回增量文本
+        """
+        for line in res.iter_lines():
+            if line:
+                decoded_line = line.decode('utf-8')
+                if decoded_line.startswith("data: "):
+                    try:
+                        json_data = json.loads(decoded_line[6:])
+                    except json.JSONDecodeError as e:
+                        continue
+                    delta_content = json_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                    if delta_content:
+                        yield delta_content
+
     def reply_text_stream(self, session: ModelScopeSession, args=None, retry_count=0) -> dict:
         """
         call ModelScope's ChatCompletion to get the answer with stream response
@@ -185,25 +287,9 @@ class ModelScopeBot(Bot):
             body["messages"] = session.messages
             body["stream"] = True  # 启用流式响应
 
-            res = requests.post(
-                self.base_url,
-                headers=headers,
-                data=json.dumps(body),
-                stream=True
-            )
+            res = http_client.post(self.base_url, headers=headers, data=json.dumps(body), stream=True, retries=2, backoff=3)
             if res.status_code == 200:
-                content = ""
-                for line in res.iter_lines():
-                    if line:
-                        decoded_line = line.decode('utf-8')
-                        if decoded_line.startswith("data: "):
-                            try:
-                                json_data = json.loads(decoded_line[6:])
-                                delta_content = json_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                                if delta_content:
-                                    content += delta_content
-                            except json.JSONDecodeError as e:
-                                pass
+                content = "".join(self._iter_stream(res))
                 return {
                     "total_tokens": 1,  # 流式响应通常不返回token使用情况
                     "completion_tokens": 1,
@@ -221,32 +307,14 @@ class ModelScopeBot(Bot):
                              f"msg={error.get('message')}, type={error.get('type')}")
 
                 result = {"completion_tokens": 0, "content": "提问太快啦，请休息一下再问我吧"}
-                need_retry = False
-                if res.status_code >= 500:
-                    # server error, need retry
-                    logger.warn(f"[MODELSCOPE_AI] do retry, times={retry_count}")
-                    need_retry = retry_count < 2
-                elif res.status_code == 401:
+                if res.status_code == 401:
                     result["content"] = "授权失败，请检查API Key是否正确"
                 elif res.status_code == 429:
                     result["content"] = "请求过于频繁，请稍后再试"
-                    need_retry = retry_count < 2
-                else:
-                    need_retry = False
-
-                if need_retry:
-                    time.sleep(3)
-                    return self.reply_text_stream(session, args, retry_count + 1)
-                else:
-                    return result
+                return result
         except Exception as e:
             logger.exception(e)
-            need_retry = retry_count < 2
-            result = {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
-            if need_retry:
-                return self.reply_text_stream(session, args, retry_count + 1)
-            else:
-                return result
+            return {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
     def create_img(self, query, retry_count=0):
         try:
             logger.info("[ModelScopeImage] image_query={}".format(query))
@@ -265,7 +333,7 @@ class ModelScopeBot(Bot):
             json_payload = json.dumps(payload, ensure_ascii=False).encode('utf-8')
             
             # 使用 data 参数发送原始字符串（requests 会自动处理编码）
-            res = requests.post(url, headers=headers, data=json_payload)
+            res = http_client.post(url, headers=headers, data=json_payload)
             
             response_data = res.json()
             image_url = response_data['images'][0]['url']
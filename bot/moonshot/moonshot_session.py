@@ -1,5 +1,6 @@
 from bot.session_manager import Session
 from common.log import logger
+from common.tokenizer import num_tokens_by_character
 
 
 class MoonshotSession(Session):
@@ -41,11 +42,4 @@ class MoonshotSession(Session):
         return cur_tokens
 
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
-
-
-def num_tokens_from_messages(messages, model):
-    tokens = 0
-    for msg in messages:
-        tokens += len(msg["content"])
-    return tokens
+        return num_tokens_by_character(self.messages)
@@ -1,5 +1,6 @@
 from bot.session_manager import Session
 from common.log import logger
+from common.tokenizer import num_tokens_from_string
 
 
 class OpenAISession(Session):
@@ -61,13 +62,3 @@ class OpenAISession(Session):
 
     def calc_tokens(self):
         return num_tokens_from_string(str(self), self.model)
-
-
-# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-def num_tokens_from_string(string: str, model: str) -> int:
-    """Returns the number of tokens in a text string."""
-    import tiktoken
-
-    encoding = tiktoken.encoding_for_model(model)
-    num_tokens = len(encoding.encode(string, disallowed_special=()))
-    return num_tokens
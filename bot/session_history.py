@@ -0,0 +1,66 @@
+"""
+会话历史的紧凑存储
+
+- 角色存为一个字节的编码，内容只保存字符串本身，不再为每条消息保留一个dict
+- 每条消息缓存token数，-1表示还没有计算过
+- 不是{"role", "content": str}格式的消息(如minimax、多模态内容)原样保存
+- 可以把最近N条之前的消息用zlib压缩保存
+"""
+
+import pickle
+import zlib
+from array import array
+
+ROLES = ("system", "user", "assistant")
+ROLE_CODES = {role: i for i, role in enumerate(ROLES)}
+RAW = 255  # 原样保存的消息
+
+
+class SessionHistory(object):
+    __slots__ = ("roles", "contents", "tokens", "packed", "packed_count")
+
+    def __init__(self):
+        self.roles = bytearray()
+        self.contents = []
+        self.tokens = array("i")
+        self.packed = None  # 压缩保存的较早的消息
+        self.packed_count = 0
+
+    def __len__(self):
+        return self.packed_count + len(self.contents)
+
+    @classmethod
+    def from_messages(cls, messages, tokens=None, keep_recent=0) -> "SessionHistory":
+        """
+        :param tokens: 每条消息的token数，-1表示未知
+        :param keep_recent: 大于0时，最近keep_recent条之前的消息压缩保存
+        """
+        history = cls()
+        roles, contents = history.roles, history.contents
+        for message in messages:
+            code = ROLE_CODES.get(message.get("role")) if type(message) is dict and len(message) == 2 else None
+            content = message.get("content") if code is not None else None
+            if type(content) is str:
+                roles.append(code)
+                contents.append(content)
+            else:
+                roles.append(RAW)
+                contents.append(message)
+        history.tokens = array("i", tokens) if tokens is not None else array("i", [-1]) * len(contents)
+        if 0 < keep_recent < len(contents):
+            n = len(contents) - keep_recent
+            history.packed = zlib.compress(pickle.dumps((bytes(roles[:n]), contents[:n], history.tokens[:n].tobytes()), pickle.HIGHEST_PROTOCOL))
+            history.packed_count = n
+            del roles[:n], contents[:n], history.tokens[:n]
+        return history
+
+    def materialize(self):
+        """返回(messages, tokens)，messages是新建的消息列表，可以直接用于请求"""
+        roles, contents, tokens = self.roles, self.contents, self.tokens
+        if self.packed is not None:
+            packed_roles, packed_contents, packed_tokens = pickle.loads(zlib.decompress(self.packed))
+            roles = packed_roles + roles
+            contents = packed_contents + contents
+            tokens = array("i", packed_tokens) + tokens
+        messages = [{"role": ROLES[code], "content": content} if code != RAW else content for code, content in zip(roles, contents)]
+        return messages, tokens
@@ -1,17 +1,83 @@
+import os
+import pickle
+import threading
+import time
+
+from bot.session_history import SessionHistory
+from bot.session_store import get_session_store
 from common.expired_dict import ExpiredDict
 from common.log import logger
-from config import conf
+from config import conf, get_appdata_dir
 
 
 class Session(object):
+    # 持久化时不保存的属性，如可以重新计算的缓存
+    transient_attrs = ()
+    # 进行中请求的记录，只在运行时有效
+    runtime_attrs = ("_request_lock", "_requests")
+
     def __init__(self, session_id, system_prompt=None):
         self.session_id = session_id
-        self.messages = []
+        self.history = SessionHistory()  # 空闲时消息保存在紧凑存储中
+        self._messages = []  # 展开的消息列表，compact()后为None
+        self._request_lock = threading.Lock()
+        self._requests = []  # 进行中请求的开始时间，有请求在处理时不存回紧凑存储
         if system_prompt is None:
             self.system_prompt = conf().get("character_desc", "")
         else:
             self.system_prompt = system_prompt
 
+    @property
+    def messages(self) -> list:
+        """请求时使用的消息列表，第一次访问时从紧凑存储展开，可以直接修改，compact()时存回"""
+        messages = self._messages
+        if messages is None:
+            messages, tokens = self.history.materialize()
+            self._restore_tokens(messages, tokens)
+            self._messages = messages
+        return messages
+
+    @messages.setter
+    def messages(self, messages):
+        self._messages = messages
+
+    def compact(self):
+        """把展开的消息列表存回紧凑存储，一轮对话结束后调用"""
+        messages = self._messages
+        if messages is not None:
+            self.history = self._build_history(messages)
+            self._messages = None
+
+    def begin_request(self):
+        """一轮对话开始，需要在读取或修改messages之前调用"""
+        with self._request_lock:
+            self._requests.append(time.monotonic())
+
+    def finish_request(self):
+        """
+        一轮对话结束，没有其他进行中的请求时才存回紧凑存储
+        同一会话的其他请求(concurrency_in_session)可能还持有展开的消息列表，这时存回会丢失它们之后的修改
+        出错没有调用finish_request的请求，超过request_timeout后不再计入
+        """
+        with self._request_lock:
+            expired = time.monotonic() - (conf().get("request_timeout", 180) or 180)
+            self._requests = [start for start in self._requests if start > expired]
+            if self._requests:
+                self._requests.pop(0)
+            if not self._requests:
+                self.compact()
+
+    def _build_history(self, messages) -> SessionHistory:
+        return SessionHistory.from_messages(messages, [self._message_tokens(m) for m in messages], conf().get("history_compress_keep", 0))
+
+    def _message_tokens(self, message) -> int:
+        """已经计算过的消息token数，没有时返回-1，由缓存了token数的子类实现"""
+        return -1
+
+    def _restore_tokens(self, messages, tokens):
+        """展开消息后恢复每条消息的token数缓存"""
+        pass
+
     # 重置会话
     def reset(self):
         system_item = {"role": "system", "content": self.system_prompt}
@@ -35,16 +101,47 @@ class Session(object):
     def calc_tokens(self):
         raise NotImplementedError
 
+    def dump_state(self) -> dict:
+        """持久化的会话状态，子类新增的属性会一起保存"""
+        state = {k: v for k, v in self.__dict__.items() if k not in self.transient_attrs and k not in self.runtime_attrs}
+        if state.get("_messages") is not None:  # 可能在其他线程中处理，不修改会话本身
+            state["history"] = self._build_history(state["_messages"])
+            state["_messages"] = None
+        return state
+
+    def load_state(self, state: dict):
+        messages = state.pop("messages", None)  # 旧版本保存的是展开的消息列表
+        self.__dict__.update(state)
+        if messages is not None:
+            self.messages = messages
+
 
 class SessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
         self.sessioncls = sessioncls
         self.session_args = session_args
+        self.store = None
+        if conf().get("session_store", "memory") == "sqlite":
+            self._init_store()
+        elif conf().get("expires_in_seconds"):
+            self.sessions = ExpiredDict(conf().get("expires_in_seconds"))
+        else:
+            self.sessions = dict()
+
+    def _init_store(self):
+        """
+        持久化存储: 内存中只缓存最近使用的会话，其余的在首次访问时从存储加载
+        访问过的会话记为脏数据，由存储的后台线程定期批量写入，不阻塞消息处理
+        """
+        path = conf().get("session_store_path") or os.path.join(get_appdata_dir(), "sessions.db")
+        self.namespace = self.sessioncls.__name__
+        self.expires_in_seconds = conf().get("expires_in_seconds", 0)
+        self.sessions = ExpiredDict(self.expires_in_seconds, max_size=conf().get("session_cache_size", 1000))
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # 保证写入和清空存储不交错，清空后不会再写回旧数据
+        self.dirty = {}  # session_id -> 待写入的session，None表示待删除
+        self.flushing = {}  # 正在写入的dirty，写完之前加载会话时优先使用
+        self.store = get_session_store(path, self)
 
     def build_session(self, session_id, system_prompt=None):
         """
@@ -54,15 +151,69 @@ class SessionManager(object):
         if session_id is None:
             return self.sessioncls(session_id, system_prompt, **self.session_args)
 
-        if session_id not in self.sessions:
-            self.sessions[session_id] = self.sessioncls(session_id, system_prompt, **self.session_args)
+        session = self.sessions.get(session_id)
+        if session is None and self.store is not None:
+            session = self._load_session(session_id)
+        if session is None:
+            session = self.sessioncls(session_id, system_prompt, **self.session_args)
+            self.sessions[session_id] = session
         elif system_prompt is not None:  # 如果有新的system_prompt，更新并重置session
-            self.sessions[session_id].set_system_prompt(system_prompt)
-        session = self.sessions[session_id]
+            session.set_system_prompt(system_prompt)
+        self._mark_dirty(session_id, session)
         return session
 
+    def _load_session(self, session_id):
+        with self.lock:
+            session = self.sessions.peek(session_id)
+            if session is not None:
+                return session
+            if session_id in self.dirty or session_id in self.flushing:
+                # 还没有写入存储，存储中的是旧数据
+                session = self.dirty[session_id] if session_id in self.dirty else self.flushing[session_id]
+            else:
+                row = self.store.load(self.namespace, session_id)
+                if row is not None and (not self.expires_in_seconds or row[1] + self.expires_in_seconds > time.time()):
+                    session = self.sessioncls(session_id, None, **self.session_args)
+                    session.load_state(pickle.loads(row[0]))
+            if session is not None:
+                self.sessions[session_id] = session
+            return session
+
+    def _mark_dirty(self, session_id, session):
+        if self.store is not None and session_id is not None:
+            with self.lock:
+                self.dirty[session_id] = session
+
+    def flush(self):
+        """把修改过的会话写入存储"""
+        if self.store is None:
+            return
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                self.flushing, self.dirty = self.dirty, {}
+            flushing = self.flushing
+            saves, deletes = [], []
+            try:
+                for session_id, session in flushing.items():
+                    if session is None:
+                        deletes.append(session_id)
+                    else:
+                        saves.append((session_id, pickle.dumps(session.dump_state(), pickle.HIGHEST_PROTOCOL)))
+                self.store.write(self.namespace, saves, deletes, time.time())
+            except Exception as e:
+                logger.error("[SessionManager] flush {} sessions failed: {}".format(len(flushing), e))
+                with self.lock:
+                    for session_id, session in flushing.items():
+                        self.dirty.setdefault(session_id, session)
+            finally:
+                with self.lock:
+                    self.flushing = {}
+
     def session_query(self, query, session_id):
         session = self.build_session(session_id)
+        session.begin_request()
         session.add_query(query)
         try:
             max_tokens = conf().get("conversation_max_tokens", 1000)
@@ -70,6 +221,7 @@ class SessionManager(object):
             logger.debug("prompt tokens used={}".format(total_tokens))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for prompt: {}".format(str(e)))
+        self._mark_dirty(session_id, session)  # 修改后再标记一次，避免修改前已经被写入
         return session
 
     def session_reply(self, reply, session_id, total_tokens=None):
@@ -81,11 +233,22 @@ class SessionManager(object):
             logger.debug("raw total_tokens={}, savesession tokens={}".format(total_tokens, tokens_cnt))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for session: {}".format(str(e)))
+        self._mark_dirty(session_id, session)
+        session.finish_request()
         return session
 
     def clear_session(self, session_id):
         if session_id in self.sessions:
             del self.sessions[session_id]
+        if self.store is not None:
+            with self.lock:
+                self.dirty[session_id] = None
 
     def clear_all_session(self):
         self.sessions.clear()
+        if self.store is not None:
+            # 等待进行中的写入完成后再清空，避免写入的旧会话在清空后重新出现
+            with self.flush_lock:
+                with self.lock:
+                    self.dirty.clear()
+                    self.store.clear(self.namespace)
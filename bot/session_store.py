@@ -0,0 +1,152 @@
+"""
+会话的持久化存储
+
+- SessionStore定义存储后端的接口，按(namespace, session_id)保存序列化后的会话状态和最后更新时间
+- SqliteSessionStore使用WAL模式的sqlite，读写互不阻塞，一次flush的所有写入在同一个事务中
+- 启动时不读取全部会话，由SessionManager按需加载
+- 每个存储只有一个SessionFlusher后台线程，定期把所有使用该存储的SessionManager的修改写入
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from common.log import logger
+from config import conf
+
+
+class SessionStore(object):
+    def load(self, namespace, session_id):
+        """返回(data, updated_at)，不存在时返回None"""
+        raise NotImplementedError
+
+    def write(self, namespace, saves, deletes, updated_at):
+        """
+        批量写入
+        :param saves: [(session_id, data)]
+        :param deletes: [session_id]
+        """
+        raise NotImplementedError
+
+    def clear(self, namespace):
+        raise NotImplementedError
+
+    def purge(self, before):
+        """删除最后更新时间早于before的会话，返回删除的数量"""
+        raise NotImplementedError
+
+    def count(self, namespace) -> int:
+        raise NotImplementedError
+
+
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # WAL模式下NORMAL不会损坏数据库，断电时只可能丢失最后的事务
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (namespace TEXT NOT NULL, session_id TEXT NOT NULL, data BLOB NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (namespace, session_id)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        logger.info("[SessionStore] sqlite session store opened: {}".format(path))
+
+    def load(self, namespace, session_id):
+        with self.lock:
+            return self.conn.execute("SELECT data, updated_at FROM sessions WHERE namespace=? AND session_id=?", (namespace, session_id)).fetchone()
+
+    def write(self, namespace, saves, deletes, updated_at):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                if saves:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO sessions (namespace, session_id, data, updated_at) VALUES (?, ?, ?, ?)",
+                        [(namespace, session_id, data, updated_at) for session_id, data in saves],
+                    )
+                if deletes:
+                    self.conn.executemany("DELETE FROM sessions WHERE namespace=? AND session_id=?", [(namespace, session_id) for session_id in deletes])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def clear(self, namespace):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE namespace=?", (namespace,))
+
+    def purge(self, before):
+        with self.lock:
+            return self.conn.execute("DELETE FROM sessions WHERE updated_at<?", (before,)).rowcount
+
+    def count(self, namespace) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions WHERE namespace=?", (namespace,)).fetchone()[0]
+
+
+class SessionFlusher(object):
+    """定期调用使用同一个存储的所有SessionManager的flush，并清理存储中过期的会话"""
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+        self.lock = threading.Lock()
+        self.managers = weakref.WeakSet()  # 不阻止被替换的SessionManager(如切换模型时)被回收
+        self.last_purge = 0
+        threading.Thread(target=self._loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def register(self, manager):
+        with self.lock:
+            self.managers.add(manager)
+
+    def flush(self):
+        with self.lock:
+            managers = list(self.managers)
+        for manager in managers:
+            try:
+                manager.flush()
+            except Exception as e:
+                logger.error("[SessionStore] flush {} failed: {}".format(manager.namespace, e))
+
+    def _loop(self):
+        while True:
+            time.sleep(conf().get("session_flush_interval", 1))
+            try:
+                self.flush()
+                # 存储中过期的会话每10分钟清理一次
+                expires_in_seconds = conf().get("expires_in_seconds", 0)
+                if expires_in_seconds and time.time() - self.last_purge > 600:
+                    self.last_purge = time.time()
+                    count = self.store.purge(self.last_purge - expires_in_seconds)
+                    if count:
+                        logger.info("[SessionStore] purged {} expired sessions".format(count))
+            except Exception as e:
+                logger.error("[SessionStore] flush loop error: {}".format(e))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_session_store(path, manager=None) -> SessionStore:
+    """
+    同一个文件只打开一次，多个SessionManager共用存储和后台写入线程
+    :param manager: 需要定期写入的SessionManager
+    """
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SqliteSessionStore(path)
+            store.flusher = SessionFlusher(store)
+    if manager is not None:
+        store.flusher.register(manager)
+    return store
@@ -1,5 +1,6 @@
 # encoding:utf-8
 
+import asyncio
 import time
 
 import openai
@@ -10,6 +11,7 @@ from bot.zhipuai.zhipu_ai_image import ZhipuAIImage
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common import async_http
 from common.log import logger
 from config import conf, load_config
 from zhipuai import ZhipuAI
@@ -33,50 +35,20 @@ class ZHIPUAIBot(Bot, ZhipuAIImage):
             logger.info("[ZHIPU_AI] query={}".format(query))
 
             session_id = context["session_id"]
-            reply = None
-            clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
-            if query in clear_memory_commands:
-                self.sessions.clear_session(session_id)
-                reply = Reply(ReplyType.INFO, "记忆已清除")
-            elif query == "#清除所有":
-                self.sessions.clear_all_session()
-                reply = Reply(ReplyType.INFO, "所有人记忆已清除")
-            elif query == "#更新配置":
-                load_config()
-                reply = Reply(ReplyType.INFO, "配置已更新")
+            reply = self._reply_command(query, session_id)
             if reply:
                 return reply
             session = self.sessions.session_query(query, session_id)
             logger.debug("[ZHIPU_AI] session query={}".format(session.messages))
 
             api_key = context.get("openai_api_key") or openai.api_key
-            model = context.get("gpt_model")
-            new_args = None
-            if model:
-                new_args = self.args.copy()
-                new_args["model"] = model
+            new_args = self._context_args(context)
             # if context.get('stream'):
             #     # reply in stream
             #     return self.reply_text_stream(query, new_query, session_id)
 
             reply_content = self.reply_text(session, api_key, args=new_args)
-            logger.debug(
-                "[ZHIPU_AI] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
-                    session.messages,
-                    session_id,
-                    reply_content["content"],
-                    reply_content["completion_tokens"],
-                )
-            )
-            if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
-                reply = Reply(ReplyType.ERROR, reply_content["content"])
-            elif reply_content["completion_tokens"] > 0:
-                self.sessions.session_reply(reply_content["content"], session_id, reply_content["total_tokens"])
-                reply = Reply(ReplyType.TEXT, reply_content["content"])
-            else:
-                reply = Reply(ReplyType.ERROR, reply_content["content"])
-                logger.debug("[ZHIPU_AI] reply {} used 0 tokens.".format(reply_content))
-            return reply
+            return self._build_reply(session, reply_content)
         elif context.type == ContextType.IMAGE_CREATE:
             ok, retstring = self.create_img(query, 0)
             reply = None
@@ -90,6 +62,104 @@ class ZHIPUAIBot(Bot, ZhipuAIImage):
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
+    async def areply(self, query, context=None):
+        if context.type != ContextType.TEXT:
+            return await super().areply(query, context)
+        logger.info("[ZHIPU_AI] query={}".format(query))
+        session_id = context["session_id"]
+        reply = self._reply_command(query, session_id)
+        if reply:
+            return reply
+        session = self.sessions.session_query(query, session_id)
+        logger.debug("[ZHIPU_AI] session query={}".format(session.messages))
+        reply_content = await self.areply_text(session, args=self._context_args(context))
+        return self._build_reply(session, reply_content)
+
+    def _reply_command(self, query, session_id):
+        reply = None
+        clear_memory_commands = conf().get("clear_memory_commands", ["#清除记忆"])
+        if query in clear_memory_commands:
+            self.sessions.clear_session(session_id)
+            reply = Reply(ReplyType.INFO, "记忆已清除")
+        elif query == "#清除所有":
+            self.sessions.clear_all_session()
+            reply = Reply(ReplyType.INFO, "所有人记忆已清除")
+        elif query == "#更新配置":
+            load_config()
+            reply = Reply(ReplyType.INFO, "配置已更新")
+        return reply
+
+    def _context_args(self, context):
+        model = context.get("gpt_model")
+        new_args = None
+        if model:
+            new_args = self.args.copy()
+            new_args["model"] = model
+        return new_args
+
+    def _build_reply(self, session, reply_content) -> Reply:
+        logger.debug(
+            "[ZHIPU_AI] new_query={}, session_id={}, reply_cont={}, completion_tokens={}".format(
+                session.messages,
+                session.session_id,
+                reply_content["content"],
+                reply_content["completion_tokens"],
+            )
+        )
+        if reply_content["completion_tokens"] == 0 and len(reply_content["content"]) > 0:
+            reply = Reply(ReplyType.ERROR, reply_content["content"])
+        elif reply_content["completion_tokens"] > 0:
+            self.sessions.session_reply(reply_content["content"], session.session_id, reply_content["total_tokens"])
+            reply = Reply(ReplyType.TEXT, reply_content["content"])
+        else:
+            reply = Reply(ReplyType.ERROR, reply_content["content"])
+            logger.debug("[ZHIPU_AI] reply {} used 0 tokens.".format(reply_content))
+        return reply
+
+    async def areply_text(self, session: ZhipuAISession, args=None, retry_count=0) -> dict:
+        """
+        async version of reply_text, calls the OpenAI compatible http api with the shared aiohttp client
+        """
+        try:
+            if args is None:
+                args = self.args
+            url = conf().get("zhipu_ai_api_base", "https://open.bigmodel.cn/api/paas/v4").rstrip("/") + "/chat/completions"
+            headers = {"Content-Type": "application/json", "Authorization": "Bearer " + conf().get("zhipu_ai_api_key", "")}
+            body = dict(args)
+            body["messages"] = session.messages
+            status_code, response = await async_http.post_json(url, headers=headers, body=body)
+            if status_code == 200:
+                return {
+                    "total_tokens": response["usage"]["total_tokens"],
+                    "completion_tokens": response["usage"]["completion_tokens"],
+                    "content": response["choices"][0]["message"]["content"],
+                }
+            error = (response or {}).get("error", {})
+            logger.error(f"[ZHIPU_AI] chat failed, status_code={status_code}, msg={error.get('message')}, code={error.get('code')}")
+            result = {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
+            need_retry = False
+            if status_code >= 500:
+                result["content"] = "请再问我一次"
+                need_retry = retry_count < 2
+            elif status_code == 401:
+                result["content"] = "授权失败，请检查API Key是否正确"
+            elif status_code == 429:
+                result["content"] = "提问太快啦，请休息一下再问我吧"
+                need_retry = retry_count < 2
+            if need_retry:
+                await asyncio.sleep(20 if status_code == 429 else 10)
+                logger.warn("[ZHIPU_AI] 第{}次重试".format(retry_count + 1))
+                return await self.areply_text(session, args, retry_count + 1)
+            return result
+        except Exception as e:
+            logger.exception("[ZHIPU_AI] Exception: {}".format(e))
+            need_retry = retry_count < 2
+            if need_retry:
+                await asyncio.sleep(5)
+                logger.warn("[ZHIPU_AI] 第{}次重试".format(retry_count + 1))
+                return await self.areply_text(session, args, retry_count + 1)
+            return {"completion_tokens": 0, "content": "我连接不到你的网络"}
+
     def reply_text(self, session: ZhipuAISession, api_key=None, args=None, retry_count=0) -> dict:
         """
         call openai's ChatCompletion to get the answer
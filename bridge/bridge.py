@@ -1,6 +1,9 @@
+import threading
+
 from bot.bot_factory import create_bot
 from bridge.context import Context
 from bridge.reply import Reply
+from bridge.reply_cache import reply_cache
 from common import const
 from common.log import logger
 from common.singleton import singleton
@@ -64,26 +67,44 @@ class Bridge(object):
 
         self.bots = {}
         self.chat_bots = {}
+        self.lock = threading.Lock()  # 启动预热和第一条消息可能同时创建bot
 
     # 模型对应的接口
     def get_bot(self, typename):
         if self.bots.get(typename) is None:
-            logger.info("create bot {} for {}".format(self.btype[typename], typename))
-            if typename == "text_to_voice":
-                self.bots[typename] = create_voice(self.btype[typename])
-            elif typename == "voice_to_text":
-                self.bots[typename] = create_voice(self.btype[typename])
-            elif typename == "chat":
-                self.bots[typename] = create_bot(self.btype[typename])
-            elif typename == "translate":
-                self.bots[typename] = create_translator(self.btype[typename])
+            with self.lock:
+                if self.bots.get(typename) is None:
+                    logger.info("create bot {} for {}".format(self.btype[typename], typename))
+                    if typename == "text_to_voice":
+                        self.bots[typename] = create_voice(self.btype[typename])
+                    elif typename == "voice_to_text":
+                        self.bots[typename] = create_voice(self.btype[typename])
+                    elif typename == "chat":
+                        self.bots[typename] = create_bot(self.btype[typename])
+                    elif typename == "translate":
+                        self.bots[typename] = create_translator(self.btype[typename])
         return self.bots[typename]
 
     def get_bot_type(self, typename):
         return self.btype[typename]
 
     def fetch_reply_content(self, query, context: Context) -> Reply:
-        return self.get_bot("chat").reply(query, context)
+        bot = self.get_bot("chat")
+        key = reply_cache.make_key(self.btype["chat"], bot, query, context)
+        if key is None:
+            return bot.reply(query, context)
+        # 相同的请求合并为一次调用，成功的回复缓存一段时间
+        return reply_cache.fetch(key, bot, query, context, lambda: bot.reply(query, context))
+
+    async def afetch_reply_content(self, query, context: Context) -> Reply:
+        bot = self.get_bot("chat")
+        key = reply_cache.make_key(self.btype["chat"], bot, query, context)
+        if key is None:
+            return await bot.areply(query, context)
+        return await reply_cache.afetch(key, bot, query, context, lambda: bot.areply(query, context))
+
+    def fetch_reply_stream(self, query, context: Context):
+        return self.get_bot("chat").reply_stream(query, context)
 
     def fetch_voice_to_text(self, voiceFile) -> Reply:
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
@@ -24,10 +24,13 @@ class ContextType(Enum):
 
 
 class Context:
-    def __init__(self, type: ContextType = None, content=None, kwargs=dict()):
+    # 排队等待处理的消息很多时，省去每个实例的__dict__
+    __slots__ = ("type", "content", "kwargs")
+
+    def __init__(self, type: ContextType = None, content=None, kwargs=None):
         self.type = type
         self.content = content
-        self.kwargs = kwargs
+        self.kwargs = kwargs if kwargs is not None else {}  # 不使用可变的默认参数，否则未传kwargs的context会共用同一个dict
 
     def __contains__(self, key):
         if key == "type":
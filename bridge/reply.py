@@ -23,6 +23,8 @@ class ReplyType(Enum):
 
 
 class Reply:
+    __slots__ = ("type", "content")
+
     def __init__(self, type: ReplyType = None, content=None):
         self.type = type
         self.content = content
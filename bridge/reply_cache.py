@@ -0,0 +1,191 @@
+"""
+相同请求的合并与回复缓存
+
+- 按(bot类型, 模型, system prompt, 规范化后的全部历史消息和当前问题)生成key，只有上下文完全相同的请求才会共用回复
+- 同一时间相同key的请求只调用一次bot，其余请求等待并共用结果(single-flight)
+- 成功的文本回复按TTL和条数上限缓存，命中时照常写入各自的会话记录
+- 按bot类型(reply_cache_bot_types)和会话模式(reply_cache_session_modes)显式开启，默认不开启
+"""
+
+import asyncio
+import hashlib
+import re
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from config import conf
+
+# 会话模式
+SINGLE = "single"  # 私聊
+GROUP = "group"  # 群聊，每个成员一个会话
+GROUP_SHARED = "group_shared"  # group_chat_in_one_session中的群，全群共用一个会话
+
+_SPACES = re.compile(r"\s+")
+_TRAILING = "?？!！。.~～ "
+
+
+def normalize(text) -> str:
+    """合并空白、去掉结尾的标点并统一大小写，"今天天气？"和"今天天气"视为相同"""
+    return _SPACES.sub(" ", str(text)).strip().rstrip(_TRAILING).casefold()
+
+
+def session_mode(context: Context) -> str:
+    if not context.get("isgroup", False):
+        return SINGLE
+    if context.get("session_id") == context.get("receiver"):
+        return GROUP_SHARED
+    return GROUP
+
+
+class ReplyCache(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}  # key -> (Future, 调用bot的session_id)，Future的结果为回复内容，调用失败时为None
+        self.cache = None
+        self.cache_config = None  # (ttl, max_size)，配置变化时重建缓存
+        self.hits = 0  # 命中缓存
+        self.shared = 0  # 等待并共用同时进行中的请求
+        self.misses = 0  # 实际调用bot
+
+    def make_key(self, bot_type, bot, query, context: Context):
+        """返回请求的key，不适合合并或缓存时返回None"""
+        if context.type != ContextType.TEXT or not query or query.startswith("#"):  # 清除记忆等指令由bot处理
+            return None
+        if bot_type not in conf().get("reply_cache_bot_types", []):
+            return None
+        if session_mode(context) not in conf().get("reply_cache_session_modes", []):
+            return None
+        if context.get("openai_api_key"):  # 使用用户自己api key的请求不和其他人共用
+            return None
+        sessions = getattr(bot, "sessions", None)
+        if sessions is None:  # 看不到会话历史，无法判断上下文是否相同
+            return None
+        session = sessions.build_session(context["session_id"])
+        # key包含全部历史消息，"继续"、"为什么"这类追问只会和上下文相同的请求共用回复
+        history = hashlib.sha1()
+        for message in session.messages:
+            if message.get("role") != "system":
+                history.update("{}\0{}\0".format(message.get("role"), normalize(message.get("content", ""))).encode("utf-8"))
+        model = context.get("gpt_model") or conf().get("model")
+        return bot_type, model, session.system_prompt, history.digest(), normalize(query)
+
+    def _get_cache(self) -> ExpiredDict:
+        config = (conf().get("reply_cache_ttl", 300), conf().get("reply_cache_max_size", 1000))
+        if config != self.cache_config:
+            self.cache = ExpiredDict(config[0], config[1])
+            self.cache_config = config
+        return self.cache
+
+    def _join(self, key, session_id):
+        """返回(缓存的回复内容, 进行中的Future, 是否由自己调用bot, 进行中的调用是否属于同一个会话)"""
+        with self.lock:
+            # peek不刷新过期时间，缓存的回复从生成起最多保留ttl秒
+            content = self._get_cache().peek(key)
+            if content is not None:
+                self.hits += 1
+                return content, None, False, False
+            inflight = self.inflight.get(key)
+            if inflight is not None:
+                return None, inflight[0], False, inflight[1] == session_id
+            future = Future()
+            self.inflight[key] = (future, session_id)
+            self.misses += 1
+            return None, future, True, False
+
+    def _finish(self, key, future, reply):
+        content = None
+        if reply is not None and reply.type == ReplyType.TEXT and reply.content:
+            content = reply.content
+        with self.lock:
+            if content is not None:
+                self._get_cache()[key] = content
+            self.inflight.pop(key, None)
+        future.set_result(content)
+
+    def _replay(self, bot, query, context, content, record=True) -> Reply:
+        """
+        用合并或缓存的结果回复，同时写入本次请求的会话记录
+        record为False时不写入: 和进行中的调用属于同一个会话(如group_shared)，bot已经写入过这一轮对话
+        """
+        sessions = getattr(bot, "sessions", None)
+        if record and sessions is not None:
+            session_id = context["session_id"]
+            sessions.session_query(query, session_id)
+            sessions.session_reply(content, session_id)
+        logger.debug("[ReplyCache] reuse reply for session_id={}, query={}".format(context.get("session_id"), query[:100]))
+        return Reply(ReplyType.TEXT, content)
+
+    def _wait_timeout(self):
+        """等待进行中调用的最长时间，与bot的请求超时一致，超时后自己调用bot"""
+        return conf().get("request_timeout", 180) or 180
+
+    def _count_shared(self, content):
+        with self.lock:
+            if content is not None:
+                self.shared += 1
+            else:
+                self.misses += 1
+
+    def fetch(self, key, bot, query, context: Context, call) -> Reply:
+        """call()调用bot获取回复"""
+        content, future, leader, same_session = self._join(key, context["session_id"])
+        if content is not None:
+            return self._replay(bot, query, context, content)
+        if not leader:
+            try:
+                content = future.result(timeout=self._wait_timeout())
+            except TimeoutError:
+                logger.warn("[ReplyCache] in-flight request timed out, calling bot directly, query={}".format(query[:100]))
+                content = None
+            self._count_shared(content)
+            if content is not None:
+                return self._replay(bot, query, context, content, record=not same_session)
+            return call()  # 进行中的请求失败或超时，自己重新调用
+        reply = None
+        try:
+            reply = call()
+            return reply
+        finally:
+            self._finish(key, future, reply)
+
+    async def afetch(self, key, bot, query, context: Context, acall) -> Reply:
+        """fetch的异步版本，acall()返回bot回复的协程，与同步请求共用进行中的调用"""
+        content, future, leader, same_session = self._join(key, context["session_id"])
+        if content is not None:
+            return self._replay(bot, query, context, content)
+        if not leader:
+            try:
+                # shield避免超时取消进行中调用的Future，其他等待者仍然可以使用结果
+                content = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self._wait_timeout())
+            except asyncio.TimeoutError:
+                logger.warn("[ReplyCache] in-flight request timed out, calling bot directly, query={}".format(query[:100]))
+                content = None
+            self._count_shared(content)
+            if content is not None:
+                return self._replay(bot, query, context, content, record=not same_session)
+            return await acall()
+        reply = None
+        try:
+            reply = await acall()
+            return reply
+        finally:
+            self._finish(key, future, reply)
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.shared + self.misses
+            return {
+                "hits": self.hits,
+                "shared": self.shared,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared) / total if total else 0,
+                "size": len(self.cache) if self.cache is not None else 0,
+                "inflight": len(self.inflight),
+            }
+
+
+reply_cache = ReplyCache()
@@ -10,6 +10,7 @@ from bridge.reply import *
 class Channel(object):
     channel_type = ""
     NOT_SUPPORT_REPLYTYPE = [ReplyType.VOICE, ReplyType.IMAGE]
+    STREAM_EDITABLE = False  # 是否支持流式回复时编辑已发送的消息，支持时需要实现send_stream
 
     def startup(self):
         """
@@ -34,9 +35,24 @@ class Channel(object):
         """
         raise NotImplementedError
 
+    def send_stream(self, reply: Reply, context: Context, state: dict, finished: bool):
+        """
+        send or update a streaming text reply, only called when STREAM_EDITABLE is True
+        :param reply: text reply, content is the whole text received so far
+        :param state: per-reply dict to keep things like the sent message id between calls
+        :param finished: whether this is the last update
+        """
+        raise NotImplementedError
+
     def build_reply_content(self, query, context: Context = None) -> Reply:
         return Bridge().fetch_reply_content(query, context)
 
+    async def abuild_reply_content(self, query, context: Context = None) -> Reply:
+        return await Bridge().afetch_reply_content(query, context)
+
+    def build_reply_stream(self, query, context: Context = None):
+        return Bridge().fetch_reply_stream(query, context)
+
     def build_voice_to_text(self, voice_file) -> Reply:
         return Bridge().fetch_voice_to_text(voice_file)
 
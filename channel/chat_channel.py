@@ -1,23 +1,26 @@
+import math
 import os
-import re
 import threading
 import time
 from asyncio import CancelledError
-from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import Future
 
 from bridge.context import *
 from bridge.reply import *
 from channel.channel import Channel
+from channel.stream_reply import StreamSegmenter, stream_stats
+from channel.trigger_matcher import mention_pattern, trigger_matcher
 from common.dequeue import Dequeue
-from common import memory
+from common import async_utils, memory
+from common.handler_pool import LANE_LONG, LANE_SHORT, HandlerPool
+from common.rate_limiter import ChannelRateLimiter
 from plugins import *
+from voice.audio_convert import any_to_wav
 
-try:
-    from voice.audio_convert import any_to_wav
-except Exception as e:
-    pass
-
-handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
+handler_pool = HandlerPool()  # 处理消息的线程池，按任务类型分lane
+rate_limiter = ChannelRateLimiter()  # 消息入口限流
+STREAM_FILTERED_TEXT = "[该回复已被过滤]"  # 流式回复的完整内容被插件过滤时，用来覆盖已经发出的中间结果
 
 
 # 抽象类, 它包含了与消息通道无关的通用处理逻辑
@@ -27,6 +30,9 @@ class ChatChannel(Channel):
     futures = {}  # 记录每个session_id提交到线程池的future对象, 用于重置会话时把没执行的future取消掉，正在执行的不会被取消
     sessions = {}  # 用于控制并发，每个session_id同时只能有一个context在处理
     lock = threading.Lock()  # 用于控制对sessions的访问
+    ready_queue = deque()  # 就绪队列，存放有待处理消息或需要回收的session_id
+    ready_set = set()  # 就绪队列中的session_id，避免重复入队
+    ready_cond = threading.Condition(lock)  # 就绪队列非空时唤醒consume线程
 
     def __init__(self):
         _thread = threading.Thread(target=self.consume)
@@ -45,47 +51,39 @@ class ChatChannel(Channel):
         # context首次传入时，receiver是None，根据类型设置receiver
         first_in = "receiver" not in context
         # 群名匹配过程，设置session_id和receiver
+        matcher = trigger_matcher()
         if first_in:  # context首次传入时，receiver是None，根据类型设置receiver
-            config = conf()
             cmsg = context["msg"]
-            user_data = conf().get_user_data(cmsg.from_user_id)
-            context["openai_api_key"] = user_data.get("openai_api_key")
-            context["gpt_model"] = user_data.get("gpt_model")
             if context.get("isgroup", False):
                 group_name = cmsg.other_user_nickname
                 group_id = cmsg.other_user_id
 
-                group_name_white_list = config.get("group_name_white_list", [])
-                group_name_keyword_white_list = config.get("group_name_keyword_white_list", [])
-                if any(
-                    [
-                        group_name in group_name_white_list,
-                        "ALL_GROUP" in group_name_white_list,
-                        check_contain(group_name, group_name_keyword_white_list),
-                    ]
-                ):
-                    group_chat_in_one_session = conf().get("group_chat_in_one_session", [])
+                if matcher.group_enabled(group_name):
                     session_id = cmsg.actual_user_id
-                    if any(
-                        [
-                            group_name in group_chat_in_one_session,
-                            "ALL_GROUP" in group_chat_in_one_session,
-                        ]
-                    ):
+                    if matcher.group_in_one_session(group_name):
                         session_id = group_id
                 else:
                     logger.debug(f"No need reply, groupName not in whitelist, group_name={group_name}")
                     return None
                 context["session_id"] = session_id
                 context["receiver"] = group_id
+                triggered = ctype != ContextType.TEXT or matcher.group_triggered(cmsg, content)
+                # 大部分群消息不会触发机器人，在分发插件和读取用户数据之前先丢弃
+                if not triggered and not PluginManager().has_untriggered_listener():
+                    return None
             else:
                 context["session_id"] = cmsg.other_user_id
                 context["receiver"] = cmsg.other_user_id
+            # 限流在分发插件之前执行，超过限流的消息不再产生插件和LLM的开销
+            # 只有会让机器人回复的消息计入限流，图片、文件、拍一拍、进群通知等不计入，也不会收到限流提示
+            if self._rate_chargeable(context, ctype, content) and self._rate_limited(context):
+                return None
+            context["rate_checked"] = True
             e_context = PluginManager().emit_event(EventContext(Event.ON_RECEIVE_MESSAGE, {"channel": self, "context": context}))
             context = e_context["context"]
             if e_context.is_pass() or context is None:
-                return context
-            if cmsg.from_user_id == self.user_id and not config.get("trigger_by_self", True):
+                return self._attach_user_data(context)
+            if cmsg.from_user_id == self.user_id and not matcher.trigger_by_self:
                 logger.debug("[chat_channel]self message skipped")
                 return None
 
@@ -96,38 +94,33 @@ class ChatChannel(Channel):
                 logger.debug("[chat_channel]reference query skipped")
                 return None
 
-            nick_name_black_list = conf().get("nick_name_black_list", [])
             if context.get("isgroup", False):  # 群聊
                 # 校验关键字
-                match_prefix = check_prefix(content, conf().get("group_chat_prefix"))
-                match_contain = check_contain(content, conf().get("group_chat_keyword"))
+                match_prefix = matcher.match_prefix(matcher.group_chat_prefix, content)
                 flag = False
                 if context["msg"].to_user_id != context["msg"].actual_user_id:
-                    if match_prefix is not None or match_contain is not None:
+                    if match_prefix is not None or matcher.contains(matcher.group_chat_keyword, content):
                         flag = True
                         if match_prefix:
                             content = content.replace(match_prefix, "", 1).strip()
                     if context["msg"].is_at:
                         nick_name = context["msg"].actual_user_nickname
-                        if nick_name and nick_name in nick_name_black_list:
+                        if matcher.nick_name_blocked(nick_name):
                             # 黑名单过滤
                             logger.warning(f"[chat_channel] Nickname {nick_name} in In BlackList, ignore")
                             return None
 
                         logger.info("[chat_channel]receive group at")
-                        if not conf().get("group_at_off", False):
+                        if not matcher.group_at_off:
                             flag = True
                         self.name = self.name if self.name is not None else ""  # 部分渠道self.name可能没有赋值
-                        pattern = f"@{re.escape(self.name)}(\u2005|\u0020)"
-                        subtract_res = re.sub(pattern, r"", content)
+                        subtract_res = mention_pattern(self.name).sub("", content)
                         if isinstance(context["msg"].at_list, list):
                             for at in context["msg"].at_list:
-                                pattern = f"@{re.escape(at)}(\u2005|\u0020)"
-                                subtract_res = re.sub(pattern, r"", subtract_res)
+                                subtract_res = mention_pattern(at).sub("", subtract_res)
                         if subtract_res == content and context["msg"].self_display_name:
                             # 前缀移除后没有变化，使用群昵称再次移除
-                            pattern = f"@{re.escape(context['msg'].self_display_name)}(\u2005|\u0020)"
-                            subtract_res = re.sub(pattern, r"", content)
+                            subtract_res = mention_pattern(context["msg"].self_display_name).sub("", content)
                         content = subtract_res
                 if not flag:
                     if context["origin_ctype"] == ContextType.VOICE:
@@ -135,12 +128,12 @@ class ChatChannel(Channel):
                     return None
             else:  # 单聊
                 nick_name = context["msg"].from_user_nickname
-                if nick_name and nick_name in nick_name_black_list:
+                if matcher.nick_name_blocked(nick_name):
                     # 黑名单过滤
                     logger.warning(f"[chat_channel] Nickname '{nick_name}' in In BlackList, ignore")
                     return None
 
-                match_prefix = check_prefix(content, conf().get("single_chat_prefix", [""]))
+                match_prefix = matcher.match_prefix(matcher.single_chat_prefix, content)
                 if match_prefix is not None:  # 判断如果匹配到自定义前缀，则返回过滤掉前缀+空格后的内容
                     content = content.replace(match_prefix, "", 1).strip()
                 elif context["origin_ctype"] == ContextType.VOICE:  # 如果源消息是私聊的语音消息，允许不匹配前缀，放宽条件
@@ -149,18 +142,28 @@ class ChatChannel(Channel):
                     logger.info("[chat_channel]receive single chat msg, but checkprefix didn't match")
                     return None
             content = content.strip()
-            img_match_prefix = check_prefix(content, conf().get("image_create_prefix",[""]))
+            img_match_prefix = matcher.match_prefix(matcher.image_create_prefix, content)
             if img_match_prefix:
                 content = content.replace(img_match_prefix, "", 1)
                 context.type = ContextType.IMAGE_CREATE
             else:
                 context.type = ContextType.TEXT
             context.content = content.strip()
-            if "desire_rtype" not in context and conf().get("always_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and matcher.always_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
         elif context.type == ContextType.VOICE:
-            if "desire_rtype" not in context and conf().get("voice_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and matcher.voice_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
+        if first_in:
+            self._attach_user_data(context)
+        return context
+
+    # 用户数据只在确定要处理的context上读取
+    def _attach_user_data(self, context: Context):
+        if context is not None:
+            user_data = conf().peek_user_data(context["msg"].from_user_id)
+            context["openai_api_key"] = user_data.get("openai_api_key")
+            context["gpt_model"] = user_data.get("gpt_model")
         return context
 
     def _handle(self, context: Context):
@@ -179,7 +182,9 @@ class ChatChannel(Channel):
             # reply的发送步骤
             self._send_reply(context, reply)
 
-    def _generate_reply(self, context: Context, reply: Reply = Reply()) -> Reply:
+    def _generate_reply(self, context: Context, reply: Reply = None) -> Reply:
+        if reply is None:
+            reply = Reply()  # 每次新建，插件修改传入的reply时不会影响之后的消息
         e_context = PluginManager().emit_event(
             EventContext(
                 Event.ON_HANDLE_CONTEXT,
@@ -191,28 +196,12 @@ class ChatChannel(Channel):
             logger.debug("[chat_channel] ready to handle context: type={}, content={}".format(context.type, context.content))
             if context.type == ContextType.TEXT or context.type == ContextType.IMAGE_CREATE:  # 文字和图片消息
                 context["channel"] = e_context["channel"]
-                reply = super().build_reply_content(context.content, context)
+                if self._stream_enabled(context):
+                    reply = self._stream_reply(context)
+                else:
+                    reply = super().build_reply_content(context.content, context)
             elif context.type == ContextType.VOICE:  # 语音消息
-                cmsg = context["msg"]
-                cmsg.prepare()
-                file_path = context.content
-                wav_path = os.path.splitext(file_path)[0] + ".wav"
-                try:
-                    any_to_wav(file_path, wav_path)
-                except Exception as e:  # 转换失败，直接使用mp3，对于某些api，mp3也可以识别
-                    logger.warning("[chat_channel]any to wav error, use raw path. " + str(e))
-                    wav_path = file_path
-                # 语音识别
-                reply = super().build_voice_to_text(wav_path)
-                # 删除临时文件
-                try:
-                    os.remove(file_path)
-                    if wav_path != file_path:
-                        os.remove(wav_path)
-                except Exception as e:
-                    pass
-                    # logger.warning("[chat_channel]delete temp file error: " + str(e))
-
+                reply = self._voice_to_text(context)
                 if reply.type == ReplyType.TEXT:
                     new_context = self._compose_context(ContextType.TEXT, reply.content, **context.kwargs)
                     if new_context:
@@ -233,7 +222,169 @@ class ChatChannel(Channel):
                 return
         return reply
 
-    def _decorate_reply(self, context: Context, reply: Reply) -> Reply:
+    # 下载语音文件并转换为文字
+    def _voice_to_text(self, context: Context) -> Reply:
+        cmsg = context["msg"]
+        cmsg.prepare()
+        file_path = context.content
+        wav_path = os.path.splitext(file_path)[0] + ".wav"
+        try:
+            any_to_wav(file_path, wav_path)
+        except Exception as e:  # 转换失败，直接使用mp3，对于某些api，mp3也可以识别
+            logger.warning("[chat_channel]any to wav error, use raw path. " + str(e))
+            wav_path = file_path
+        # 语音识别
+        reply = super().build_voice_to_text(wav_path)
+        # 删除临时文件
+        try:
+            os.remove(file_path)
+            if wav_path != file_path:
+                os.remove(wav_path)
+        except Exception as e:
+            pass
+            # logger.warning("[chat_channel]delete temp file error: " + str(e))
+        return reply
+
+    def _stream_enabled(self, context: Context):
+        return context.type == ContextType.TEXT and conf().get("stream_reply", False) and context.get("desire_rtype") != ReplyType.VOICE
+
+    def _stream_editable(self, context: Context):
+        return self.STREAM_EDITABLE
+
+    # 流式获取bot的回复并边收边发，发送完成后返回None
+    # bot返回的是Reply(指令、错误、图片等)时返回该Reply，由正常流程装饰和发送
+    def _stream_reply(self, context: Context) -> Reply:
+        editable = self._stream_editable(context)
+        segmenter = StreamSegmenter(
+            editable,
+            update_interval=conf().get("stream_update_interval", 1.0),
+            chunk_chars=conf().get("stream_chunk_chars", 300),
+        )
+        state = {}
+        start = time.monotonic()
+        ttfb = first_send = None
+        result = None
+        for delta in super().build_reply_stream(context.content, context):
+            if isinstance(delta, Reply):
+                result = delta
+                break
+            if not delta:
+                continue
+            if ttfb is None:
+                ttfb = time.monotonic() - start
+            content = segmenter.feed(delta)
+            if content:
+                self._send_stream_segment(context, content, state, editable, False)
+                if first_send is None:
+                    first_send = time.monotonic() - start
+        if not segmenter.text:
+            return result
+        content = segmenter.finish()
+        if content or (not editable and state.get("started")):  # 不能编辑消息时没有剩余内容也要补发后缀
+            self._send_stream_segment(context, content or "", state, editable, True)
+            if first_send is None:
+                first_send = time.monotonic() - start
+        total = time.monotonic() - start
+        stream_stats.record(ttfb, first_send, total, interrupted=result is not None)
+        logger.info("[chat_channel] stream reply finished, ttfb={:.2f}s, first_send={:.2f}s, total={:.2f}s, segments={}".format(ttfb, first_send or 0, total, segmenter.segments))
+        return result
+
+    # 每次发送前都经过ON_DECORATE_REPLY插件(如Banwords)，被过滤的内容不会发出
+    # 群聊的@和前缀只加在第一段，后缀只加在最后一段
+    def _send_stream_segment(self, context: Context, content, state, editable, finished):
+        if state.get("blocked") and not (editable and finished):  # 已被过滤，只在最后用完整内容再检查一次
+            return
+        if not editable:  # 不能编辑消息的channel，每段作为一条普通消息发送
+            reply = self._decorate_reply(context, Reply(ReplyType.TEXT, content), first=not state.get("started"), last=finished)
+            if reply is None:  # 被插件过滤时不再发送之后的分段
+                state["blocked"] = True
+                return
+            if reply.type != ReplyType.TEXT or reply.content:
+                state["started"] = True
+                self._send_reply(context, reply)
+            return
+        reply = self._decorate_reply(context, Reply(ReplyType.TEXT, content), last=finished)
+        if reply and reply.type == ReplyType.TEXT:
+            self._send_stream(reply, context, state, finished)
+            state["started"] = True
+            return
+        state["blocked"] = True
+        if not finished:
+            return
+        # 完整的回复被过滤或替换，覆盖已经发出的内容，不能把之前的中间结果作为最终结果
+        if state.get("started"):
+            if reply and reply.type in [ReplyType.INFO, ReplyType.ERROR]:
+                self._send_stream(Reply(ReplyType.TEXT, reply.content), context, state, True)
+                return
+            self._send_stream(Reply(ReplyType.TEXT, STREAM_FILTERED_TEXT), context, state, True)
+        self._send_reply(context, reply)
+
+    def _send_stream(self, reply: Reply, context: Context, state, finished):
+        try:
+            self.send_stream(reply, context, state, finished)
+        except Exception as e:
+            logger.error("[chat_channel] send stream error: {}".format(str(e)))
+            if finished:  # 最后一次更新失败时，作为普通消息发送完整内容
+                self._send(reply, context)
+
+    # 以下为_handle/_generate_reply/_send_reply的异步版本，开启async_pipeline后耗时任务在事件循环中处理
+    # LLM请求使用异步HTTP客户端，同步的插件、语音处理和发送函数通过run_sync放到线程中执行
+    async def _ahandle(self, context: Context):
+        if context is None or not context.content:
+            return
+        logger.debug("[chat_channel] ready to handle context async: {}".format(context))
+        reply = await self._agenerate_reply(context)
+
+        logger.debug("[chat_channel] ready to decorate reply: {}".format(reply))
+
+        if reply and reply.content:
+            reply = await async_utils.run_sync(self._decorate_reply, context, reply)
+            await self._asend_reply(context, reply)
+
+    async def _agenerate_reply(self, context: Context, reply: Reply = None) -> Reply:
+        if reply is None:
+            reply = Reply()
+        e_context = await async_utils.run_sync(
+            PluginManager().emit_event,
+            EventContext(
+                Event.ON_HANDLE_CONTEXT,
+                {"channel": self, "context": context, "reply": reply},
+            ),
+        )
+        reply = e_context["reply"]
+        if not e_context.is_pass():
+            logger.debug("[chat_channel] ready to handle context: type={}, content={}".format(context.type, context.content))
+            if context.type == ContextType.TEXT or context.type == ContextType.IMAGE_CREATE:  # 文字和图片消息
+                context["channel"] = e_context["channel"]
+                if self._stream_enabled(context):
+                    reply = await async_utils.run_sync(self._stream_reply, context)
+                else:
+                    reply = await super().abuild_reply_content(context.content, context)
+            elif context.type == ContextType.VOICE:  # 语音消息
+                reply = await async_utils.run_sync(self._voice_to_text, context)
+                if reply.type == ReplyType.TEXT:
+                    new_context = self._compose_context(ContextType.TEXT, reply.content, **context.kwargs)
+                    if new_context:
+                        reply = await self._agenerate_reply(new_context)
+                    else:
+                        return
+            elif context.type == ContextType.IMAGE:  # 图片消息，当前仅做下载保存到本地的逻辑
+                memory.USER_IMAGE_CACHE[context["session_id"]] = {
+                    "path": context.content,
+                    "msg": context.get("msg")
+                }
+            elif context.type in [ContextType.SHARING, ContextType.FUNCTION, ContextType.FILE]:  # 当前无默认逻辑
+                pass
+            else:
+                logger.warning("[chat_channel] unknown context type: {}".format(context.type))
+                return
+        return reply
+
+    async def _asend_reply(self, context: Context, reply: Reply):
+        await async_utils.run_sync(self._send_reply, context, reply)
+
+    # first/last: 流式回复分段发送时是否为第一段/最后一段，群聊的@和前缀只加在第一段，后缀只加在最后一段
+    def _decorate_reply(self, context: Context, reply: Reply, first=True, last=True) -> Reply:
         if reply and reply.type:
             e_context = PluginManager().emit_event(
                 EventContext(
@@ -255,11 +406,12 @@ class ChatChannel(Channel):
                         reply = super().build_text_to_voice(reply.content)
                         return self._decorate_reply(context, reply)
                     if context.get("isgroup", False):
-                        if not context.get("no_need_at", False):
+                        if first and not context.get("no_need_at", False):
                             reply_text = "@" + context["msg"].actual_user_nickname + "\n" + reply_text.strip()
-                        reply_text = conf().get("group_chat_reply_prefix", "") + reply_text + conf().get("group_chat_reply_suffix", "")
+                        prefix, suffix = conf().get("group_chat_reply_prefix", ""), conf().get("group_chat_reply_suffix", "")
                     else:
-                        reply_text = conf().get("single_chat_reply_prefix", "") + reply_text + conf().get("single_chat_reply_suffix", "")
+                        prefix, suffix = conf().get("single_chat_reply_prefix", ""), conf().get("single_chat_reply_suffix", "")
+                    reply_text = (prefix if first else "") + reply_text + (suffix if last else "")
                     reply.content = reply_text
                 elif reply.type == ReplyType.ERROR or reply.type == ReplyType.INFO:
                     reply.content = "[" + str(reply.type) + "]\n" + reply.content
@@ -317,11 +469,85 @@ class ChatChannel(Channel):
                 logger.exception("Worker raise exception: {}".format(e))
             with self.lock:
                 self.sessions[session_id][1].release()
+                self._mark_ready(session_id)  # 释放了信号量，该会话可以继续处理下一条消息或被回收
 
         return func
 
+    # 将session_id放入就绪队列并唤醒consume线程，调用方需持有self.lock
+    def _mark_ready(self, session_id):
+        if session_id not in self.ready_set:
+            self.ready_set.add(session_id)
+            self.ready_queue.append(session_id)
+            self.ready_cond.notify()
+
+    # 根据context判断提交到哪条lane，指令类消息走短任务lane，不被耗时的LLM调用阻塞
+    def _select_lane(self, context: Context):
+        if context.type == ContextType.TEXT:
+            content = context.content
+            if content.startswith("#") or content.startswith(conf().get("plugin_trigger_prefix", "$")):
+                return LANE_SHORT
+            return LANE_LONG
+        if context.type in [ContextType.VOICE, ContextType.IMAGE_CREATE]:
+            return LANE_LONG
+        return LANE_SHORT
+
+    # 排队过多时拒绝消息，回复繁忙提示
+    def _reject(self, context: Context, lane):
+        handler_pool.reject(lane)
+        logger.warning("[chat_channel] lane {} is full, reject context: {}".format(lane, context))
+        busy_reply = conf().get("handler_pool_busy_reply", "当前提问的人太多啦，请稍后再试")
+        if busy_reply and lane != LANE_SHORT and not handler_pool.is_full(LANE_SHORT):
+            handler_pool.submit(LANE_SHORT, self._send_busy_reply, context, busy_reply)
+
+    def _send_busy_reply(self, context: Context, content):
+        reply = self._decorate_reply(context, Reply(ReplyType.INFO, content))
+        self._send_reply(context, reply)
+
+    def _rate_limit_keys(self, context: Context):
+        cmsg = context.get("msg")
+        keys = {"session": context["session_id"]}
+        if context.get("isgroup", False):
+            keys["group"] = context.get("receiver")
+            if cmsg:
+                keys["user"] = cmsg.actual_user_id
+        elif cmsg:
+            keys["user"] = cmsg.from_user_id
+        return keys
+
+    # 是否计入限流: 触发了机器人的文本(包括画图指令)和开启了语音识别的语音
+    def _rate_chargeable(self, context: Context, ctype, content):
+        isgroup = context.get("isgroup", False)
+        if ctype == ContextType.TEXT:
+            matcher = trigger_matcher()
+            if isgroup:
+                return matcher.group_triggered(context["msg"], content)
+            return matcher.match_prefix(matcher.single_chat_prefix, content) is not None
+        if ctype == ContextType.VOICE:
+            return conf().get("group_speech_recognition" if isgroup else "speech_recognition", False)
+        return False
+
+    # 超过限流的消息在插件处理和排队之前直接丢弃
+    def _rate_limited(self, context: Context):
+        keys = self._rate_limit_keys(context)
+        limited = rate_limiter.admit(keys)
+        if limited is None:
+            return False
+        dimension, wait = limited
+        logger.warning("[chat_channel] rate limited by {}={}, wait={:.1f}s".format(dimension, keys[dimension], wait))
+        limit_reply = conf().get("rate_limit_reply", "消息太频繁啦，请{}秒后再试")
+        if limit_reply and rate_limiter.should_notify(dimension, keys[dimension]) and not handler_pool.is_full(LANE_SHORT):
+            handler_pool.submit(LANE_SHORT, self._send_busy_reply, context, limit_reply.format(math.ceil(wait)))
+        return True
+
     def produce(self, context: Context):
         session_id = context["session_id"]
+        # 没有经过ChatChannel._compose_context的消息(如自己构造context的channel)在这里限流
+        if not context.get("rate_checked", False) and self._rate_limited(context):
+            return
+        lane = self._select_lane(context)
+        if lane != LANE_SHORT and handler_pool.is_full(lane):
+            self._reject(context, lane)
+            return
         with self.lock:
             if session_id not in self.sessions:
                 self.sessions[session_id] = [
@@ -332,39 +558,50 @@ class ChatChannel(Channel):
                 self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
             else:
                 self.sessions[session_id][0].put(context)
+            self._mark_ready(session_id)
 
-    # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    # 消费者函数，单独线程，等待就绪队列中的session_id并将其消息提交到线程池处理
+    # 只有收到新消息或者有任务结束的会话才会被唤醒，空闲会话不产生任何开销
     def consume(self):
         while True:
+            with self.ready_cond:
+                while not self.ready_queue:
+                    self.ready_cond.wait()
+                session_id = self.ready_queue.popleft()
+                self.ready_set.discard(session_id)
+                if session_id not in self.sessions:
+                    continue
+                context_queue, semaphore = self.sessions[session_id]
+                if context_queue.empty():
+                    if semaphore._initial_value == semaphore._value:  # 没有排队的消息，也没有处理中的任务，回收该会话
+                        self.futures[session_id] = [t for t in self.futures.get(session_id, []) if not t.done()]
+                        assert len(self.futures[session_id]) == 0, "thread pool error"
+                        del self.futures[session_id]
+                        del self.sessions[session_id]
+                    continue
+                if not semaphore.acquire(blocking=False):  # 并发已满，等任务结束的回调再次唤醒
+                    continue
+                context = context_queue.get()
+                if not context_queue.empty():  # 还有排队的消息，尝试继续利用剩余的并发额度
+                    self._mark_ready(session_id)
+            # 提交任务和注册回调不能持有锁，回调可能在当前线程中立即执行
+            logger.debug("[chat_channel] consume context: {}".format(context))
+            lane = self._select_lane(context)
+            if lane == LANE_LONG and conf().get("async_pipeline", False):
+                future: Future = handler_pool.submit_coroutine(lane, self._ahandle(context))
+            else:
+                future: Future = handler_pool.submit(lane, self._handle, context)
             with self.lock:
-                session_ids = list(self.sessions.keys())
-            for session_id in session_ids:
-                with self.lock:
-                    context_queue, semaphore = self.sessions[session_id]
-                if semaphore.acquire(blocking=False):  # 等线程处理完毕才能删除
-                    if not context_queue.empty():
-                        context = context_queue.get()
-                        logger.debug("[chat_channel] consume context: {}".format(context))
-                        future: Future = handler_pool.submit(self._handle, context)
-                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                        with self.lock:
-                            if session_id not in self.futures:
-                                self.futures[session_id] = []
-                            self.futures[session_id].append(future)
-                    elif semaphore._initial_value == semaphore._value + 1:  # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕
-                        with self.lock:
-                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
-                            assert len(self.futures[session_id]) == 0, "thread pool error"
-                            del self.sessions[session_id]
-                    else:
-                        semaphore.release()
-            time.sleep(0.2)
+                if session_id not in self.futures:
+                    self.futures[session_id] = []
+                self.futures[session_id].append(future)
+            future.add_done_callback(self._thread_pool_callback(session_id, context=context))
 
     # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
     def cancel_session(self, session_id):
         with self.lock:
             if session_id in self.sessions:
-                for future in self.futures[session_id]:
+                for future in self.futures.get(session_id, []):
                     future.cancel()
                 cnt = self.sessions[session_id][0].qsize()
                 if cnt > 0:
@@ -374,7 +611,7 @@ class ChatChannel(Channel):
     def cancel_all_session(self):
         with self.lock:
             for session_id in self.sessions:
-                for future in self.futures[session_id]:
+                for future in self.futures.get(session_id, []):
                     future.cancel()
                 cnt = self.sessions[session_id][0].qsize()
                 if cnt > 0:
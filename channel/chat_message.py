@@ -33,35 +33,48 @@ _rawmsg: 原始消息对象
 """
 
 
+# 字段及其默认值
+_DEFAULTS = {
+    "msg_id": None,
+    "create_time": None,
+    "ctype": None,
+    "content": None,
+    "from_user_id": None,
+    "from_user_nickname": None,
+    "to_user_id": None,
+    "to_user_nickname": None,
+    "other_user_id": None,
+    "other_user_nickname": None,
+    "my_msg": False,
+    "self_display_name": None,
+    "is_group": False,
+    "is_at": False,
+    "actual_user_id": None,
+    "actual_user_nickname": None,
+    "at_list": None,
+    "_prepare_fn": None,
+    "_prepared": False,
+    "_rawmsg": None,
+}
+
+
 class ChatMessage(object):
-    msg_id = None
-    create_time = None
-
-    ctype = None
-    content = None
-
-    from_user_id = None
-    from_user_nickname = None
-    to_user_id = None
-    to_user_nickname = None
-    other_user_id = None
-    other_user_nickname = None
-    my_msg = False
-    self_display_name = None
-
-    is_group = False
-    is_at = False
-    actual_user_id = None
-    actual_user_nickname = None
-    at_list = None
-
-    _prepare_fn = None
-    _prepared = False
-    _rawmsg = None
+    # 排队等待处理的消息很多时，省去每个实例的__dict__，子类新增的属性也需要声明在子类的__slots__中
+    # 未声明__slots__的子类(如第三方channel)仍然有__dict__，可以设置任意属性
+    __slots__ = tuple(_DEFAULTS)
 
     def __init__(self, _rawmsg):
+        for name, value in _DEFAULTS.items():
+            setattr(self, name, value)
         self._rawmsg = _rawmsg
 
+    def __getattr__(self, name):
+        # 没有调用ChatMessage.__init__的子类，未赋值的字段返回默认值
+        try:
+            return _DEFAULTS[name]
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name)) from None
+
     def prepare(self):
         if self._prepare_fn and not self._prepared:
             self._prepared = True
@@ -200,6 +200,23 @@ class DingTalkChanel(ChatChannel, dingtalk_stream.ChatbotHandler):
             self.reply_text(reply.content, incoming_message)
 
 
+    def _stream_editable(self, context: Context):
+        # 开启AI卡片时流式更新卡片内容，否则按段落分条发送
+        return bool(conf().get("dingtalk_card_enabled"))
+
+    def send_stream(self, reply: Reply, context: Context, state: dict, finished: bool):
+        incoming_message = context.kwargs['msg'].incoming_message
+        card = state.get("card")
+        if card is None:
+            card = self.ai_markdown_card_start(incoming_message)
+            state["card"] = card
+        if finished:
+            card.ai_finish(markdown=reply.content)
+            if context.kwargs['msg'].is_group:
+                self.reply_text("📢 您有一条新的消息，请查看。", incoming_message)
+        else:
+            card.ai_streaming(markdown=reply.content, append=False)
+
     def generate_button_markdown_content(self, context, reply):
         image_url = context.kwargs.get("image_url")
         promptEn = context.kwargs.get("promptEn")
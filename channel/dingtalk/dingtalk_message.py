@@ -11,6 +11,8 @@ from common.tmp_dir import TmpDir
 
 
 class DingTalkMessage(ChatMessage):
+    __slots__ = ("image_download_handler", "message_type", "incoming_message", "sender_staff_id", "image_content", "rich_text_content")
+
     def __init__(self, event: ChatbotMessage, image_download_handler):
         super().__init__(event)
         self.image_download_handler = image_download_handler
@@ -8,12 +8,13 @@
 # -*- coding=utf-8 -*-
 import uuid
 
-import requests
 import web
 from channel.feishu.feishu_message import FeishuMessage
 from bridge.context import Context
 from bridge.reply import Reply, ReplyType
+from common import http_client
 from common.log import logger
+from common.token_cache import token_cache
 from common.singleton import singleton
 from config import conf
 from common.expired_dict import ExpiredDict
@@ -28,6 +29,7 @@ URL_VERIFICATION = "url_verification"
 
 @singleton
 class FeiShuChanel(ChatChannel):
+    STREAM_EDITABLE = True
     feishu_app_id = conf().get('feishu_app_id')
     feishu_app_secret = conf().get('feishu_app_secret')
     feishu_token = conf().get('feishu_token')
@@ -51,18 +53,10 @@ class FeiShuChanel(ChatChannel):
         web.httpserver.runsimple(app.wsgifunc(), ("0.0.0.0", port))
 
     def send(self, reply: Reply, context: Context):
-        msg = context.get("msg")
-        is_group = context["isgroup"]
-        if msg:
-            access_token = msg.access_token
-        else:
-            access_token = self.fetch_access_token()
-        headers = {
-            "Authorization": "Bearer " + access_token,
-            "Content-Type": "application/json",
-        }
-        msg_type = "text"
         logger.info(f"[FeiShu] start send reply message, type={context.type}, content={reply.content}")
+        access_token = self._access_token(context)
+        headers = self._headers(access_token)
+        msg_type = "text"
         reply_content = reply.content
         content_key = "text"
         if reply.type == ReplyType.IMAGE_URL:
@@ -73,31 +67,75 @@ class FeiShuChanel(ChatChannel):
                 return
             msg_type = "image"
             content_key = "image_key"
-        if is_group:
+        res = self._post_message(context, headers, msg_type, json.dumps({content_key: reply_content}))
+        if res.get("code") == 0:
+            logger.info(f"[FeiShu] send message success")
+        else:
+            logger.error(f"[FeiShu] send message failed, code={res.get('code')}, msg={res.get('msg')}")
+
+    def send_stream(self, reply: Reply, context: Context, state: dict, finished: bool):
+        # 流式回复使用消息卡片，先发送卡片再更新卡片内容
+        headers = self._headers(self._access_token(context))
+        card = {
+            "config": {"wide_screen_mode": True, "update_multi": True},
+            "elements": [{"tag": "markdown", "content": reply.content}],
+        }
+        message_id = state.get("message_id")
+        if message_id is None:
+            res = self._post_message(context, headers, "interactive", json.dumps(card))
+            if res.get("code") != 0:
+                raise Exception(f"send card failed, code={res.get('code')}, msg={res.get('msg')}")
+            state["message_id"] = res["data"]["message_id"]
+        else:
+            url = f"https://open.feishu.cn/open-apis/im/v1/messages/{message_id}"
+            res = http_client.request("PATCH", url, headers=headers, json={"content": json.dumps(card)}, timeout=(5, 10)).json()
+            if res.get("code") != 0:
+                raise Exception(f"update card failed, code={res.get('code')}, msg={res.get('msg')}")
+        if finished:
+            logger.info(f"[FeiShu] send stream message success")
+
+    def _access_token(self, context: Context):
+        msg = context.get("msg")
+        if msg:
+            return msg.access_token
+        return self.fetch_access_token()
+
+    def _headers(self, access_token):
+        return {
+            "Authorization": "Bearer " + access_token,
+            "Content-Type": "application/json",
+        }
+
+    def _post_message(self, context: Context, headers, msg_type, content) -> dict:
+        if context["isgroup"]:
             # 群聊中直接回复
-            url = f"https://open.feishu.cn/open-apis/im/v1/messages/{msg.msg_id}/reply"
+            url = f"https://open.feishu.cn/open-apis/im/v1/messages/{context.get('msg').msg_id}/reply"
             data = {
                 "msg_type": msg_type,
-                "content": json.dumps({content_key: reply_content})
+                "content": content
             }
-            res = requests.post(url=url, headers=headers, json=data, timeout=(5, 10))
+            res = http_client.post(url, headers=headers, json=data, timeout=(5, 10))
         else:
             url = "https://open.feishu.cn/open-apis/im/v1/messages"
             params = {"receive_id_type": context.get("receive_id_type") or "open_id"}
             data = {
                 "receive_id": context.get("receiver"),
                 "msg_type": msg_type,
-                "content": json.dumps({content_key: reply_content})
+                "content": content
             }
-            res = requests.post(url=url, headers=headers, params=params, json=data, timeout=(5, 10))
-        res = res.json()
-        if res.get("code") == 0:
-            logger.info(f"[FeiShu] send message success")
-        else:
-            logger.error(f"[FeiShu] send message failed, code={res.get('code')}, msg={res.get('msg')}")
+            res = http_client.post(url, headers=headers, params=params, json=data, timeout=(5, 10))
+        return res.json()
 
 
     def fetch_access_token(self) -> str:
+        # tenant_access_token有效期2小时，有效期内复用缓存
+        try:
+            return token_cache.get(("feishu", self.feishu_app_id, self.feishu_app_secret), self._fetch_tenant_access_token)
+        except Exception as e:
+            logger.error(f"[FeiShu] fetch token error, {e}")
+            return ""
+
+    def _fetch_tenant_access_token(self):
         url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal/"
         headers = {
             "Content-Type": "application/json"
@@ -107,21 +145,18 @@ class FeiShuChanel(ChatChannel):
             "app_secret": self.feishu_app_secret
         }
         data = bytes(json.dumps(req_body), encoding='utf8')
-        response = requests.post(url=url, data=data, headers=headers)
-        if response.status_code == 200:
-            res = response.json()
-            if res.get("code") != 0:
-                logger.error(f"[FeiShu] get tenant_access_token error, code={res.get('code')}, msg={res.get('msg')}")
-                return ""
-            else:
-                return res.get("tenant_access_token")
-        else:
-            logger.error(f"[FeiShu] fetch token error, res={response}")
+        response = http_client.post(url, data=data, headers=headers)
+        if response.status_code != 200:
+            raise Exception(f"res={response}")
+        res = response.json()
+        if res.get("code") != 0:
+            raise Exception(f"get tenant_access_token error, code={res.get('code')}, msg={res.get('msg')}")
+        return res.get("tenant_access_token"), res.get("expire")
 
 
     def _upload_image_url(self, img_url, access_token):
         logger.debug(f"[WX] start download image, img_url={img_url}")
-        response = requests.get(img_url)
+        response = http_client.get(img_url, retries=2)
         suffix = utils.get_path_suffix(img_url)
         temp_name = str(uuid.uuid4()) + "." + suffix
         if response.status_code == 200:
@@ -138,7 +173,7 @@ class FeiShuChanel(ChatChannel):
             'Authorization': f'Bearer {access_token}',
         }
         with open(temp_name, "rb") as file:
-            upload_response = requests.post(upload_url, files={"image": file}, data=data, headers=headers)
+            upload_response = http_client.post(upload_url, files={"image": file}, data=data, headers=headers)
             logger.info(f"[FeiShu] upload file, res={upload_response.content}")
             os.remove(temp_name)
             return upload_response.json().get("data").get("image_key")
@@ -8,6 +8,8 @@ from common import utils
 
 
 class FeishuMessage(ChatMessage):
+    __slots__ = ("access_token",)
+
     def __init__(self, event: dict, is_group=False, access_token=None):
         super().__init__(event)
         msg = event.get("message")
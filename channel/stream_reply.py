@@ -0,0 +1,145 @@
+"""
+流式回复的分段与统计
+
+- 可以编辑消息的channel(web、飞书卡片、钉钉AI卡片)按时间间隔更新同一条消息，内容为截至当前的全部文本
+- 其他channel在段落边界分段发送，第一段尽早发出，之后的内容攒够一定长度再发，避免刷屏
+- 分段时不会切断markdown代码块
+"""
+
+import threading
+import time
+from collections import deque
+
+SENTENCE_ENDS = "。！？；!?;\n"
+
+
+def _in_code_block(text, end):
+    return text.count("```", 0, end) % 2 == 1
+
+
+def find_sentence_end(text, start=0):
+    """返回text中最后一个句子边界之后的位置，没有时返回-1"""
+    for i in range(len(text) - 1, start - 1, -1):
+        ch = text[i]
+        if ch in SENTENCE_ENDS or (ch == "." and i + 1 < len(text) and text[i + 1] == " "):
+            if not _in_code_block(text, i + 1):
+                return i + 1
+    return -1
+
+
+def find_paragraph_end(text, min_chars):
+    """返回text中长度不小于min_chars的最后一个段落边界之后的位置，没有时返回-1"""
+    pos = text.rfind("\n\n")
+    while pos >= min_chars:
+        if not _in_code_block(text, pos):
+            return pos + 2
+        pos = text.rfind("\n\n", 0, pos)
+    return -1
+
+
+class StreamSegmenter:
+    """
+    将bot返回的增量文本拆分为待发送的分段
+    :param editable: channel是否支持编辑已发送的消息
+    """
+
+    def __init__(self, editable, update_interval=1.0, first_chars=20, chunk_chars=300):
+        self.editable = editable
+        self.update_interval = update_interval
+        self.first_chars = first_chars
+        self.chunk_chars = chunk_chars
+        self.text = ""
+        self.sent = 0  # 已发送(或已更新到消息中)的字符数
+        self.segments = 0
+        self.last_flush = 0
+
+    def feed(self, delta) -> str:
+        """
+        追加增量文本，返回本次需要发送的内容，不需要发送时返回None
+        可编辑的channel返回截至当前的全部文本，其他channel返回新的分段
+        """
+        self.text += delta
+        if self.editable:
+            now = time.monotonic()
+            if now - self.last_flush < self.update_interval:
+                return None
+            end = find_sentence_end(self.text, self.sent)
+            if end <= self.sent:
+                if len(self.text) - self.sent < self.chunk_chars:
+                    return None
+                end = len(self.text)  # 长时间没有句子边界时也更新
+            self.last_flush = now
+            return self._take(end)
+        min_chars = self.first_chars if self.segments == 0 else self.chunk_chars
+        end = find_paragraph_end(self.text[self.sent:], min_chars)
+        if end < 0:
+            return None
+        return self._take(self.sent + end)
+
+    def finish(self) -> str:
+        """
+        返回最后需要发送的内容
+        可编辑的channel总是返回全部文本，用于把消息标记为完成；其他channel没有剩余内容时返回None
+        """
+        if self.editable:
+            return self._take(len(self.text))
+        segment = self._take(len(self.text))
+        return segment or None
+
+    def _take(self, end):
+        if self.editable:
+            segment = self.text[:end]
+        else:
+            segment = self.text[self.sent: end].strip()
+        self.sent = end
+        self.segments += 1
+        return segment
+
+
+class StreamStats:
+    """
+    流式回复的统计，ttfb为从请求bot到收到第一段文本的时间，first_send为到第一次发送给用户的时间
+    """
+
+    def __init__(self, window=200):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.interrupted = 0
+        self.ttfb = deque(maxlen=window)
+        self.first_send = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+
+    def record(self, ttfb, first_send, total, interrupted=False):
+        with self.lock:
+            self.count += 1
+            if interrupted:
+                self.interrupted += 1
+            if ttfb is not None:
+                self.ttfb.append(ttfb)
+            if first_send is not None:
+                self.first_send.append(first_send)
+            self.total.append(total)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {"p50": 0, "p90": 0, "max": 0}
+        values = sorted(values)
+        return {
+            "p50": values[len(values) // 2],
+            "p90": values[min(len(values) - 1, int(len(values) * 0.9))],
+            "max": values[-1],
+        }
+
+    def stats(self):
+        with self.lock:
+            return {
+                "count": self.count,
+                "interrupted": self.interrupted,
+                "ttfb": self._percentiles(self.ttfb),
+                "first_send": self._percentiles(self.first_send),
+                "total": self._percentiles(self.total),
+            }
+
+
+stream_stats = StreamStats()
@@ -9,6 +9,8 @@ from config import conf
 
 
 class TerminalMessage(ChatMessage):
+    __slots__ = ()
+
     def __init__(
         self,
         msg_id,
@@ -18,6 +20,7 @@ class TerminalMessage(ChatMessage):
         to_user_id="Chatgpt",
         other_user_id="Chatgpt",
     ):
+        super().__init__(None)
         self.msg_id = msg_id
         self.ctype = ctype
         self.content = content
@@ -0,0 +1,102 @@
+"""
+由配置编译出的消息触发匹配器
+
+- 群名白名单、群会话、昵称黑名单用集合判断，前缀和关键词列表各编译为一个正则
+- 配置被重新加载或修改时整体重建，替换是一次赋值，处理中的消息继续用旧的匹配器
+- @的移除正则按名字缓存
+"""
+
+import re
+import threading
+from functools import lru_cache
+
+from config import conf
+
+
+def _prefix_regex(prefix_list):
+    """返回的正则match结果与check_prefix相同: 按列表顺序第一个匹配的前缀"""
+    if not prefix_list:
+        return None
+    return re.compile("|".join(re.escape(prefix) for prefix in prefix_list))
+
+
+def _keyword_regex(keyword_list):
+    if not keyword_list:
+        return None
+    return re.compile("|".join(re.escape(keyword) for keyword in keyword_list))
+
+
+@lru_cache(maxsize=4096)
+def mention_pattern(name):
+    """移除"@name "的正则"""
+    return re.compile(f"@{re.escape(name)}(\u2005|\u0020)")
+
+
+class TriggerMatcher:
+    def __init__(self, config):
+        self.config = config
+        self.version = config.version  # 先记下版本，构建期间配置被修改时下次会再重建
+        group_name_white_list = config.get("group_name_white_list", []) or []
+        self.group_names = set(group_name_white_list)
+        self.all_groups = "ALL_GROUP" in self.group_names
+        self.group_name_keyword = _keyword_regex(config.get("group_name_keyword_white_list", []))
+        group_chat_in_one_session = config.get("group_chat_in_one_session", []) or []
+        self.one_session_groups = set(group_chat_in_one_session)
+        self.all_one_session = "ALL_GROUP" in self.one_session_groups
+        self.nick_name_black_list = set(config.get("nick_name_black_list", []) or [])
+        self.group_chat_prefix = _prefix_regex(config.get("group_chat_prefix"))
+        self.group_chat_keyword = _keyword_regex(config.get("group_chat_keyword"))
+        self.group_at_off = config.get("group_at_off", False)
+        self.single_chat_prefix = _prefix_regex(config.get("single_chat_prefix", [""]))
+        self.image_create_prefix = _prefix_regex(config.get("image_create_prefix", [""]))
+        self.trigger_by_self = config.get("trigger_by_self", True)
+        self.always_reply_voice = config.get("always_reply_voice")
+        self.voice_reply_voice = config.get("voice_reply_voice")
+
+    def group_enabled(self, group_name) -> bool:
+        if self.all_groups or group_name in self.group_names:
+            return True
+        return bool(self.group_name_keyword and group_name and self.group_name_keyword.search(group_name))
+
+    def group_in_one_session(self, group_name) -> bool:
+        return self.all_one_session or group_name in self.one_session_groups
+
+    def nick_name_blocked(self, nick_name) -> bool:
+        return bool(nick_name) and nick_name in self.nick_name_black_list
+
+    def group_triggered(self, cmsg, content) -> bool:
+        """只根据@、前缀和关键词判断群文本消息是否可能触发机器人，不可能触发时可以在分发插件之前丢弃"""
+        if cmsg.to_user_id == cmsg.actual_user_id:
+            return False
+        if cmsg.is_at and not self.group_at_off:
+            return True
+        return self.match_prefix(self.group_chat_prefix, content) is not None or self.contains(self.group_chat_keyword, content)
+
+    @staticmethod
+    def match_prefix(regex, content):
+        """与check_prefix相同，没有匹配时返回None"""
+        if regex is None:
+            return None
+        m = regex.match(content)
+        return m.group() if m else None
+
+    @staticmethod
+    def contains(regex, content) -> bool:
+        return regex is not None and regex.search(content) is not None
+
+
+_matcher = None
+_lock = threading.Lock()
+
+
+def trigger_matcher() -> TriggerMatcher:
+    """返回与当前配置对应的匹配器，配置变化后第一次调用时重建"""
+    global _matcher
+    config = conf()
+    matcher = _matcher
+    if matcher is None or matcher.config is not config or matcher.version != config.version:
+        with _lock:
+            matcher = _matcher
+            if matcher is None or matcher.config is not config or matcher.version != config.version:
+                matcher = _matcher = TriggerMatcher(config)
+    return matcher
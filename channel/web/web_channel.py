@@ -17,6 +17,8 @@ import threading
 import logging
 
 class WebMessage(ChatMessage):
+    __slots__ = ()
+
     def __init__(
         self,
         msg_id,
@@ -26,6 +28,7 @@ class WebMessage(ChatMessage):
         to_user_id="Chatgpt",
         other_user_id="Chatgpt",
     ):
+        super().__init__(None)
         self.msg_id = msg_id
         self.ctype = ctype
         self.content = content
@@ -37,6 +40,7 @@ class WebMessage(ChatMessage):
 @singleton
 class WebChannel(ChatChannel):
     NOT_SUPPORT_REPLYTYPE = [ReplyType.VOICE]
+    STREAM_EDITABLE = True
     _instance = None
     
     # def __new__(cls):
@@ -62,6 +66,21 @@ class WebChannel(ChatChannel):
         """生成唯一的请求ID"""
         return str(uuid.uuid4())
 
+    def send_stream(self, reply: Reply, context: Context, state: dict, finished: bool):
+        request_id = context.get("request_id", None)
+        session_id = self.request_to_session.get(request_id)
+        if session_id not in self.session_queues:
+            logger.warning(f"No response queue found for request {request_id}, stream response dropped")
+            return
+        self.session_queues[session_id].put({
+            "type": str(reply.type),
+            "content": reply.content,
+            "timestamp": time.time(),
+            "request_id": request_id,
+            "stream": True,
+            "finished": finished
+        })
+
     def send(self, reply: Reply, context: Context):
         try:
             if reply.type in self.NOT_SUPPORT_REPLYTYPE:
@@ -163,7 +182,13 @@ class WebChannel(ChatChannel):
             # 尝试从队列获取响应，不等待
             try:
                 # 使用peek而不是get，这样如果前端没有成功处理，下次还能获取到
-                response = self.session_queues[session_id].get(block=False)
+                queue = self.session_queues[session_id]
+                response = queue.get(block=False)
+                # 同一个请求连续的流式更新只需要返回最新的一条
+                if response.get("stream"):
+                    with queue.mutex:
+                        while queue.queue and queue.queue[0].get("stream") and queue.queue[0]["request_id"] == response["request_id"]:
+                            response = queue.queue.popleft()
                 
                 # 返回响应，包含请求ID以区分不同请求
                 return json.dumps({
@@ -171,7 +196,9 @@ class WebChannel(ChatChannel):
                     "has_content": True,
                     "content": response["content"],
                     "request_id": response["request_id"],
-                    "timestamp": response["timestamp"]
+                    "timestamp": response["timestamp"],
+                    "stream": response.get("stream", False),
+                    "finished": response.get("finished", True)
                 })
                 
             except Empty:
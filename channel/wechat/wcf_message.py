@@ -15,6 +15,8 @@ class WechatfMessage(ChatMessage):
     微信消息封装类
     """
 
+    __slots__ = ("wxid", "name", "room_id")
+
     def __init__(self, channel, wcf_msg: WxMsg, is_group=False):
         """
         初始化消息对象
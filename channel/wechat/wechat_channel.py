@@ -157,7 +157,7 @@ class WechatChannel(ChatChannel):
                 time.sleep(2)
                 self.auto_login_times += 1
                 if self.auto_login_times < 100:
-                    chat_channel.handler_pool._shutdown = False
+                    chat_channel.handler_pool.reset_shutdown()
                     self.startup()
         except Exception as e:
             pass
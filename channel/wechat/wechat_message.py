@@ -8,6 +8,8 @@ from lib import itchat
 from lib.itchat.content import *
 
 class WechatMessage(ChatMessage):
+    __slots__ = ()
+
     def __init__(self, itchat_msg, is_group=False):
         super().__init__(itchat_msg)
         self.msg_id = itchat_msg["MsgId"]
@@ -122,3 +124,15 @@ class WechatMessage(ChatMessage):
             self.actual_user_id = itchat_msg["ActualUserName"]
             if self.ctype not in [ContextType.JOIN_GROUP, ContextType.PATPAT, ContextType.EXIT_GROUP]:
                 self.actual_user_nickname = itchat_msg["ActualNickName"]
+            elif self.ctype in [ContextType.JOIN_GROUP, ContextType.EXIT_GROUP]:
+                self._apply_member_changes()
+
+    def _apply_member_changes(self):
+        # 优先使用群成员列表的变化，可以拿到准确的成员id；没有记录到变化时保留从通知文本中解析出的昵称
+        kind = "Added" if self.ctype == ContextType.JOIN_GROUP else "Removed"
+        members = itchat.instance.storageClass.pop_member_changes(self.other_user_id, kind)
+        if not members:
+            return
+        self.actual_user_nickname = "、".join(member.get("DisplayName") or member.get("NickName", "") for member in members)
+        if len(members) == 1:
+            self.actual_user_id = members[0]["UserName"]
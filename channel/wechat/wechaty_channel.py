@@ -16,7 +16,7 @@ from wechaty_puppet import FileBox
 from bridge.context import *
 from bridge.context import Context
 from bridge.reply import *
-from channel.chat_channel import ChatChannel
+from channel.chat_channel import ChatChannel, handler_pool
 from channel.wechat.wechaty_message import WechatyMessage
 from common.log import logger
 from common.singleton import singleton
@@ -44,7 +44,7 @@ class WechatyChannel(ChatChannel):
     async def main(self):
         loop = asyncio.get_event_loop()
         # 将asyncio的loop传入处理线程
-        self.handler_pool._initializer = lambda: asyncio.set_event_loop(loop)
+        handler_pool.set_initializer(lambda: asyncio.set_event_loop(loop))
         self.bot = Wechaty()
         self.bot.on("login", self.on_login)
         self.bot.on("message", self.on_message)
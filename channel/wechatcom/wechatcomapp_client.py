@@ -1,43 +1,32 @@
 # wechatcomapp_client.py
-import threading
 import time
 from wechatpy.enterprise import WeChatClient
 
+from common.token_cache import token_cache
+
+
 class WechatComAppClient(WeChatClient):
     def __init__(self, corp_id, secret, access_token=None, session=None, timeout=None, auto_retry=True):
         super(WechatComAppClient, self).__init__(corp_id, secret, access_token, session, timeout, auto_retry)
-        self.fetch_access_token_lock = threading.Lock()
-        self._active_refresh()
-        
-    def _active_refresh(self):
-        """启动主动刷新的后台线程"""
-        def refresh_loop():
-            while True:
-                now = time.time()
-                expires_at = self.session.get(f"{self.corp_id}_expires_at", 0)
-                
-                # 提前10分钟刷新(600秒)
-                if expires_at - now < 600:
-                    with self.fetch_access_token_lock:
-                        # 双重检查避免重复刷新
-                        if self.session.get(f"{self.corp_id}_expires_at", 0) - time.time() < 600:
-                            super(WechatComAppClient, self).fetch_access_token()
-                # 每次检查间隔60秒
-                time.sleep(60)
-                
-        # 启动守护线程
-        refresh_thread = threading.Thread(
-            target=refresh_loop,
-            daemon=True,
-            name="wechatcom_token_refresh_thread"
-        )
-        refresh_thread.start()
+        self.session_token = None
+        self.token_key = ("wechatcom", corp_id, secret)
+
+    @property
+    def access_token(self):  # 重载父类属性，从共享的token缓存获取，并发时只请求一次，过期前10分钟在后台提前刷新
+        access_token = token_cache.get(self.token_key, self._fetch_access_token_from_server, refresh_before=600)
+        if access_token != self.session_token:  # token变化时才写入session，session可能是redis等外部存储
+            entry = token_cache.entry(self.token_key)
+            expires_in = max(int(entry.expires_at - time.time()), 0) if entry else 0
+            self.session.set(self.access_token_key, access_token, expires_in)
+            self.expires_at = int(time.time()) + expires_in
+            self.session_token = access_token
+        return access_token
+
+    def fetch_access_token(self):  # 重载父类方法，父类在access_token失效时调用，丢弃缓存重新获取
+        token_cache.invalidate(self.token_key)
+        access_token = self.access_token
+        return {"access_token": access_token, "expires_in": self.expires_at - int(time.time())}
 
-    def fetch_access_token(self):
-        with self.fetch_access_token_lock:
-            access_token = self.session.get(self.access_token_key)
-            expires_at = self.session.get(f"{self.corp_id}_expires_at", 0)
-            
-            if access_token and expires_at > time.time() + 60:
-                return access_token
-            return super().fetch_access_token()
\ No newline at end of file
+    def _fetch_access_token_from_server(self):
+        result = super().fetch_access_token()
+        return result["access_token"], result["expires_in"]
@@ -7,6 +7,8 @@ from common.tmp_dir import TmpDir
 
 
 class WechatComAppMessage(ChatMessage):
+    __slots__ = ()
+
     def __init__(self, msg, client: WeChatClient, is_group=False):
         super().__init__(msg)
         self.msg_id = msg.id
@@ -6,12 +6,14 @@ from wechatpy.exceptions import APILimitedException
 
 from channel.wechatmp.common import *
 from common.log import logger
+from common.token_cache import token_cache
 
 
 class WechatMPClient(WeChatClient):
     def __init__(self, appid, secret, access_token=None, session=None, timeout=None, auto_retry=True):
         super(WechatMPClient, self).__init__(appid, secret, access_token, session, timeout, auto_retry)
-        self.fetch_access_token_lock = threading.Lock()
+        self.session_token = None
+        self.token_key = ("wechatmp", appid, secret)
         self.clear_quota_lock = threading.Lock()
         self.last_clear_quota_time = -1
 
@@ -21,16 +23,25 @@ class WechatMPClient(WeChatClient):
     def clear_quota_v2(self):
         return self.post("clear_quota/v2", params={"appid": self.appid, "appsecret": self.secret})
 
-    def fetch_access_token(self):  # 重载父类方法，加锁避免多线程重复获取access_token
-        with self.fetch_access_token_lock:
-            access_token = self.session.get(self.access_token_key)
-            if access_token:
-                if not self.expires_at:
-                    return access_token
-                timestamp = time.time()
-                if self.expires_at - timestamp > 60:
-                    return access_token
-            return super().fetch_access_token()
+    @property
+    def access_token(self):  # 重载父类属性，从共享的token缓存获取，并发时只请求一次，过期前10分钟在后台提前刷新
+        access_token = token_cache.get(self.token_key, self._fetch_access_token_from_server, refresh_before=600)
+        if access_token != self.session_token:  # token变化时才写入session，session可能是redis等外部存储
+            entry = token_cache.entry(self.token_key)
+            expires_in = max(int(entry.expires_at - time.time()), 0) if entry else 0
+            self.session.set(self.access_token_key, access_token, expires_in)
+            self.expires_at = int(time.time()) + expires_in
+            self.session_token = access_token
+        return access_token
+
+    def fetch_access_token(self):  # 重载父类方法，父类在access_token失效时调用，丢弃缓存重新获取
+        token_cache.invalidate(self.token_key)
+        access_token = self.access_token
+        return {"access_token": access_token, "expires_in": self.expires_at - int(time.time())}
+
+    def _fetch_access_token_from_server(self):
+        result = super().fetch_access_token()
+        return result["access_token"], result["expires_in"]
 
     def _request(self, method, url_or_endpoint, **kwargs):  # 重载父类方法，遇到API限流时，清除quota后重试
         try:
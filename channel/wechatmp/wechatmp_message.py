@@ -7,6 +7,8 @@ from common.tmp_dir import TmpDir
 
 
 class WeChatMPMessage(ChatMessage):
+    __slots__ = ()
+
     def __init__(self, msg, client=None):
         super().__init__(msg)
         self.msg_id = msg.id
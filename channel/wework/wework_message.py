@@ -103,6 +103,8 @@ def c2c_download_and_convert(wework, message, file_name):
 
 
 class WeworkMessage(ChatMessage):
+    __slots__ = ("wework",)
+
     def __init__(self, wework_msg, wework, is_group=False):
         try:
             super().__init__(wework_msg)
@@ -0,0 +1,43 @@
+"""
+共享的异步HTTP客户端，供异步处理管道中的bot复用连接
+"""
+
+import asyncio
+
+from config import conf
+
+_sessions = {}  # 事件循环 -> aiohttp.ClientSession，aiohttp的session不能跨事件循环使用
+
+
+async def get_session():
+    import aiohttp
+
+    loop = asyncio.get_event_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=conf().get("async_http_max_connections", 100), ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=conf().get("request_timeout", 180))
+        session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _sessions[loop] = session
+    return session
+
+
+async def post_json(url, headers=None, body=None):
+    """
+    发送json请求
+    :return: (status_code, 响应json)，响应不是json时为None
+    """
+    session = await get_session()
+    async with session.post(url, headers=headers, json=body) as res:
+        try:
+            data = await res.json(content_type=None)
+        except ValueError:
+            data = None
+        return res.status, data
+
+
+async def close():
+    loop = asyncio.get_event_loop()
+    session = _sessions.pop(loop, None)
+    if session is not None:
+        await session.close()
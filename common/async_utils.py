@@ -0,0 +1,52 @@
+"""
+异步处理管道的事件循环与线程卸载工具
+
+- 后台事件循环运行在单独的守护线程中，channel通过submit提交协程
+- 同步的插件、bot、发送函数通过run_sync放到线程池中执行，不阻塞事件循环
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from common.log import logger
+from config import conf
+
+_loop = None
+_offload_executor = None
+_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """获取后台事件循环，首次调用时启动"""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="async_pipeline", daemon=True)
+                thread.start()
+                _loop = loop
+                logger.info("[async] event loop started")
+    return _loop
+
+
+def submit(coro) -> Future:
+    """在后台事件循环中执行协程，返回concurrent.futures.Future，可以像线程池任务一样取消和注册回调"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def _get_offload_executor() -> ThreadPoolExecutor:
+    global _offload_executor
+    if _offload_executor is None:
+        with _lock:
+            if _offload_executor is None:
+                _offload_executor = ThreadPoolExecutor(max_workers=conf().get("async_offload_workers", 16), thread_name_prefix="async_offload")
+    return _offload_executor
+
+
+async def run_sync(fn, *args, **kwargs):
+    """在线程池中执行同步函数并等待结果"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_get_offload_executor(), functools.partial(fn, *args, **kwargs))
@@ -1,22 +1,90 @@
-from datetime import datetime, timedelta
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
 
 
-class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
-        super().__init__()
+class ExpiredDict(MutableMapping):
+    """
+    带过期时间的字典
+
+    - 读取(d[key]、get)会刷新过期时间，peek、in、keys、items不会刷新
+    - 过期的key记录在最小堆中，写入时顺带清理，不依赖再次读取
+    - max_size大于0时按最近最少使用(LRU)淘汰
+    - expires_in_seconds为0或None时不过期，只按max_size淘汰
+    """
+
+    def __init__(self, expires_in_seconds, max_size=0):
         self.expires_in_seconds = expires_in_seconds
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> [value, expiry_time]，按最近使用排序
+        self._heap = []  # (expiry_time, seq, key)，刷新过期时间后旧的记录作废，弹出时跳过
+        self._seq = 0
+        self._lock = threading.RLock()
+
+    def _now(self):
+        return time.monotonic()
+
+    def _push_expiry(self, key, expiry_time):
+        self._seq += 1
+        heapq.heappush(self._heap, (expiry_time, self._seq, key))
+        if len(self._heap) > 2 * len(self._data) + 64:  # 作废记录太多时重建堆
+            self._heap = [(entry[1], i, k) for i, (k, entry) in enumerate(self._data.items())]
+            heapq.heapify(self._heap)
+            self._seq = len(self._heap)
+
+    def expire(self):
+        """清理所有已过期的key，返回清理的数量"""
+        now = self._now()
+        count = 0
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                expiry_time, _, key = heapq.heappop(heap)
+                entry = self._data.get(key)
+                if entry is not None and entry[1] == expiry_time:
+                    del self._data[key]
+                    count += 1
+        return count
+
+    def _get_entry(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if now > entry[1]:
+            del self._data[key]
+            return None
+        return entry
 
     def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
-            raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
-        return value
+        now = self._now()
+        with self._lock:
+            entry = self._get_entry(key, now)
+            if entry is None:
+                raise KeyError(key)
+            if self.expires_in_seconds:
+                entry[1] = now + self.expires_in_seconds
+                self._push_expiry(key, entry[1])
+            self._data.move_to_end(key)
+            return entry[0]
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        now = self._now()
+        expiry_time = now + self.expires_in_seconds if self.expires_in_seconds else float("inf")
+        with self._lock:
+            self.expire()
+            self._data[key] = [value, expiry_time]
+            self._data.move_to_end(key)
+            if self.expires_in_seconds:
+                self._push_expiry(key, expiry_time)
+            if self.max_size > 0:
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
 
     def get(self, key, default=None):
         try:
@@ -24,19 +92,42 @@ class ExpiredDict(dict):
         except KeyError:
             return default
 
+    def peek(self, key, default=None):
+        """读取但不刷新过期时间"""
+        with self._lock:
+            entry = self._get_entry(key, self._now())
+            return default if entry is None else entry[0]
+
     def __contains__(self, key):
-        try:
-            self[key]
-            return True
-        except KeyError:
-            return False
+        with self._lock:
+            return self._get_entry(key, self._now()) is not None
+
+    def __len__(self):
+        self.expire()
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._heap.clear()
 
     def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+        self.expire()
+        with self._lock:
+            return list(self._data.keys())
+
+    def values(self):
+        self.expire()
+        with self._lock:
+            return [entry[0] for entry in self._data.values()]
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        self.expire()
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items()]
 
     def __iter__(self):
-        return self.keys().__iter__()
+        return iter(self.keys())
+
+    def __repr__(self):
+        return "{}({}, expires_in_seconds={})".format(type(self).__name__, dict(self.items()), self.expires_in_seconds)
@@ -0,0 +1,144 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from common import async_utils
+from common.log import logger
+from config import conf
+
+LANE_LONG = "long"  # 耗时的阻塞任务: LLM对话、语音识别/合成、画图
+LANE_SHORT = "short"  # 短任务: 插件指令、#管理命令
+LANE_PLUGIN = "plugin"  # 设置了时限的插件处理函数，由PluginManager使用
+
+# lane名称 -> (线程数配置项, 默认线程数)
+LANE_WORKERS = {
+    LANE_LONG: ("handler_pool_long_workers", 32),
+    LANE_SHORT: ("handler_pool_short_workers", 4),
+    LANE_PLUGIN: ("handler_pool_plugin_workers", 16),
+}
+
+
+class HandlerLane:
+    """
+    线程池中的一条lane，记录排队、执行中、完成和拒绝的任务数
+    """
+
+    def __init__(self, name, max_workers, max_queue=0, initializer=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue  # 排队上限，0为不限制
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="handler_" + name, initializer=initializer)
+        self.lock = threading.Lock()
+        self.pending = 0  # 已提交还未开始执行
+        self.running = 0  # 执行中
+        self.completed = 0  # 已完成(包括异常结束)
+        self.rejected = 0  # 因排队过多被拒绝
+        self.coroutines = 0  # 提交到异步管道(async_pipeline)还未结束的协程
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        def task():
+            with self.lock:
+                self.pending -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        with self.lock:
+            self.pending += 1
+        future = self.executor.submit(task)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def submit_coroutine(self, coro) -> Future:
+        """在异步管道中执行协程，同样计入本lane，排队上限对异步管道也生效"""
+        with self.lock:
+            self.coroutines += 1
+        future = async_utils.submit(coro)
+        future.add_done_callback(self._on_coroutine_done)
+        return future
+
+    def _on_done(self, future: Future):
+        if future.cancelled():  # 被取消的任务不会执行task，需要在这里扣减排队数
+            with self.lock:
+                self.pending -= 1
+
+    def _on_coroutine_done(self, future: Future):
+        with self.lock:
+            self.coroutines -= 1
+            self.completed += 1
+
+    def is_full(self):
+        if self.max_queue <= 0:
+            return False
+        # 协程不占用线程，超过线程数的部分视为排队，总容量与线程模式相同
+        return self.pending >= self.max_queue or self.coroutines - self.max_workers >= self.max_queue
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self.pending,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "max_queue": self.max_queue,
+                "coroutines": self.coroutines,
+            }
+
+
+class HandlerPool:
+    """
+    处理消息的线程池，按任务类型分为多条lane，lane在首次使用时按配置创建
+    """
+
+    def __init__(self):
+        self.lanes = {}
+        self.lock = threading.Lock()
+        self.initializer = None
+
+    def lane(self, name) -> HandlerLane:
+        lane = self.lanes.get(name)
+        if lane is None:
+            with self.lock:
+                lane = self.lanes.get(name)
+                if lane is None:
+                    key, default = LANE_WORKERS[name]
+                    max_workers = conf().get(key, default)
+                    max_queue = conf().get("handler_pool_max_queue", 200)
+                    lane = HandlerLane(name, max_workers, max_queue, self.initializer)
+                    self.lanes[name] = lane
+                    logger.info("[handler_pool] lane {} created, workers={}, max_queue={}".format(name, max_workers, max_queue))
+        return lane
+
+    def submit(self, lane, fn, *args, **kwargs) -> Future:
+        return self.lane(lane).submit(fn, *args, **kwargs)
+
+    def submit_coroutine(self, lane, coro) -> Future:
+        return self.lane(lane).submit_coroutine(coro)
+
+    def is_full(self, lane):
+        return self.lane(lane).is_full()
+
+    def reject(self, lane):
+        self.lane(lane).reject()
+
+    def set_initializer(self, initializer):
+        # 线程池线程的初始化函数，只对之后新建的线程生效
+        self.initializer = initializer
+        for lane in self.lanes.values():
+            lane.executor._initializer = initializer
+
+    def reset_shutdown(self):
+        # 重新登录时恢复已关闭的线程池
+        for lane in self.lanes.values():
+            lane.executor._shutdown = False
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
@@ -0,0 +1,132 @@
+"""
+共享的HTTP客户端
+
+- 所有后端复用同一个requests.Session，按host维护连接池并保持长连接，避免每次请求都重新握手
+- 统一的重试策略: 连接错误、超时以及429/5xx响应按指数退避重试，响应带Retry-After时按其等待
+- 按host统计请求数、错误数、重试数和耗时，可以通过#pool指令查看
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.log import logger
+from config import conf
+
+SERVER_ERROR_STATUS = (500, 502, 503, 504)
+RETRY_STATUS = (429,) + SERVER_ERROR_STATUS
+
+_session = None
+_lock = threading.Lock()
+_stats = {}  # host -> HostStats
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0  # 异常或者状态码>=400
+        self.retries = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed, error):
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_time": self.total_time / self.requests if self.requests else 0,
+            "max_time": self.max_time,
+        }
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=conf().get("http_pool_connections", 20),  # 缓存连接池的host数
+                    pool_maxsize=conf().get("http_pool_maxsize", 50),  # 每个host保持的连接数
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _host_stats(host) -> HostStats:
+    stats = _stats.get(host)
+    if stats is None:
+        with _lock:
+            stats = _stats.setdefault(host, HostStats())
+    return stats
+
+
+def _retry_delay(res, attempt, backoff):
+    if res is not None:
+        retry_after = res.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), 60)
+    return backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def request(method, url, retries=0, backoff=1.0, retry_status=RETRY_STATUS, **kwargs) -> requests.Response:
+    """
+    发送请求，参数同requests.request
+    :param retries: 最多重试次数，默认不重试
+    :param backoff: 第一次重试前等待的秒数，之后每次翻倍
+    :param retry_status: 需要重试的响应状态码，重试用完后返回最后一次的响应
+    """
+    kwargs.setdefault("timeout", (10, conf().get("request_timeout", 180)))  # (连接超时, 读取超时)
+    parsed = urlparse(url)
+    target = parsed.netloc + parsed.path  # 日志中不打印query，避免泄露其中的token
+    stats = _host_stats(parsed.netloc)
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        try:
+            res = get_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            with _lock:
+                stats.record(time.monotonic() - start, True)
+            if attempt >= retries:
+                raise
+            delay = _retry_delay(None, attempt, backoff)
+            logger.warn("[http] {} {} failed: {}, retry in {:.1f}s".format(method, target, e, delay))
+        else:
+            with _lock:
+                stats.record(time.monotonic() - start, res.status_code >= 400)
+            if res.status_code not in retry_status or attempt >= retries:
+                return res
+            delay = _retry_delay(res, attempt, backoff)
+            logger.warn("[http] {} {} status={}, retry in {:.1f}s".format(method, target, res.status_code, delay))
+            res.close()
+        with _lock:
+            stats.retries += 1
+        attempt += 1
+        time.sleep(delay)
+
+
+def get(url, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def stats():
+    with _lock:
+        return {host: host_stats.to_dict() for host, host_stats in _stats.items()}
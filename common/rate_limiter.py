@@ -0,0 +1,74 @@
+import threading
+
+from common.expired_dict import ExpiredDict
+from common.token_bucket import KeyedTokenBucket
+from config import conf
+
+# 限流维度，按从粗到细的顺序检查: 群、用户、会话
+DIMENSIONS = ["group", "user", "session"]
+
+
+class ChannelRateLimiter:
+    """
+    channel入口的准入控制，按群、用户、会话分别限流
+
+    每个维度的速率和突发量从配置读取(rate_limit_<维度>，rate_limit_<维度>_burst)，速率为0时不限制，配置变化后自动重建
+    """
+
+    def __init__(self):
+        self.limits = {}  # 维度 -> (速率, 突发量, 最大key数, KeyedTokenBucket)
+        self.lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = {dimension: 0 for dimension in DIMENSIONS}
+        self.notified = ExpiredDict(60, max_size=10000)  # 同一个key每分钟最多提示一次，避免刷屏时被放大
+
+    def _bucket(self, dimension):
+        rate = conf().get("rate_limit_" + dimension, 0)
+        if not rate:
+            return None
+        burst = conf().get("rate_limit_{}_burst".format(dimension), 0) or rate
+        max_keys = conf().get("rate_limit_max_keys", 100000)
+        limit = self.limits.get(dimension)
+        if limit is None or limit[:3] != (rate, burst, max_keys):
+            with self.lock:
+                limit = self.limits.get(dimension)
+                if limit is None or limit[:3] != (rate, burst, max_keys):
+                    limit = (rate, burst, max_keys, KeyedTokenBucket(rate, capacity=burst, max_keys=max_keys))
+                    self.limits[dimension] = limit
+        return limit[3]
+
+    def admit(self, keys: dict):
+        """
+        :param keys: 维度 -> key，key为空的维度不检查
+        :return: 允许时返回None，否则返回(被限流的维度, 需要等待的秒数)
+        """
+        for dimension in DIMENSIONS:
+            key = keys.get(dimension)
+            if not key:
+                continue
+            bucket = self._bucket(dimension)
+            if bucket is None:
+                continue
+            wait = bucket.try_acquire(key)
+            if wait > 0:
+                with self.lock:
+                    self.rejected[dimension] += 1
+                return dimension, wait
+        with self.lock:
+            self.admitted += 1
+        return None
+
+    def should_notify(self, dimension, key):
+        notified_key = (dimension, key)
+        if self.notified.peek(notified_key):
+            return False
+        self.notified[notified_key] = True
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "keys": {dimension: len(limit[3]) for dimension, limit in self.limits.items()},
+            }
@@ -1,7 +1,9 @@
-import heapq
-
-
 class SortedDict(dict):
+    """
+    按sort_func(key, value)排序迭代的dict
+    修改时只记录排序值，迭代时才重新排序，排序结果缓存到下次修改
+    """
+
     def __init__(self, sort_func=lambda k, v: k, init_dict=None, reverse=False):
         if init_dict is None:
             init_dict = []
@@ -10,53 +12,34 @@ class SortedDict(dict):
         self.sort_func = sort_func
         self.sorted_keys = None
         self.reverse = reverse
-        self.heap = []
+        self.priorities = {}  # key -> 排序值
         for k, v in init_dict:
             self[k] = v
 
     def __setitem__(self, key, value):
-        if key in self:
-            super().__setitem__(key, value)
-            for i, (priority, k) in enumerate(self.heap):
-                if k == key:
-                    self.heap[i] = (self.sort_func(key, value), key)
-                    heapq.heapify(self.heap)
-                    break
-            self.sorted_keys = None
-        else:
-            super().__setitem__(key, value)
-            heapq.heappush(self.heap, (self.sort_func(key, value), key))
-            self.sorted_keys = None
+        super().__setitem__(key, value)
+        self.priorities[key] = self.sort_func(key, value)
+        self.sorted_keys = None
 
     def __delitem__(self, key):
         super().__delitem__(key)
-        for i, (priority, k) in enumerate(self.heap):
-            if k == key:
-                del self.heap[i]
-                heapq.heapify(self.heap)
-                break
+        del self.priorities[key]
         self.sorted_keys = None
 
     def keys(self):
         if self.sorted_keys is None:
-            self.sorted_keys = [k for _, k in sorted(self.heap, reverse=self.reverse)]
+            self.sorted_keys = [k for _, k in sorted(((priority, k) for k, priority in self.priorities.items()), reverse=self.reverse)]
         return self.sorted_keys
 
     def items(self):
-        if self.sorted_keys is None:
-            self.sorted_keys = [k for _, k in sorted(self.heap, reverse=self.reverse)]
-        sorted_items = [(k, self[k]) for k in self.sorted_keys]
-        return sorted_items
+        return [(k, self[k]) for k in self.keys()]
 
     def _update_heap(self, key):
-        for i, (priority, k) in enumerate(self.heap):
-            if k == key:
-                new_priority = self.sort_func(key, self[key])
-                if new_priority != priority:
-                    self.heap[i] = (new_priority, key)
-                    heapq.heapify(self.heap)
-                    self.sorted_keys = None
-                break
+        """value被直接修改后调用，重新计算排序值"""
+        new_priority = self.sort_func(key, self[key])
+        if new_priority != self.priorities[key]:
+            self.priorities[key] = new_priority
+            self.sorted_keys = None
 
     def __iter__(self):
         return iter(self.keys())
@@ -0,0 +1,134 @@
+"""
+启动耗时分析，用法(在项目根目录执行):
+    python app.py --profile-startup [--cmd] [--budget 秒数]
+
+在子进程中以-X importtime执行与正常启动相同的步骤: 导入app、加载配置、创建channel、加载插件，但不启动channel
+汇总各阶段的耗时和每个模块的导入耗时，用于观察冷启动时间
+
+指定--budget时作为启动耗时的检查(可以放在CI中执行): 各阶段总耗时超过预算，
+或者启动阶段导入了应当延迟加载的重依赖(DEFERRED_MODULES)时，以非0状态码退出
+"""
+
+import subprocess
+import sys
+import time
+
+MARKER = "[startup-profile]"
+TOP = 30
+# 只在用到时才导入的重依赖，启动阶段不应该出现
+DEFERRED_MODULES = ["openai", "tiktoken", "PIL", "pydub", "pysilk"]
+
+
+def run_stages(channel_name=None):
+    """子进程中执行，各阶段的耗时以MARKER开头输出到stdout"""
+    start = time.perf_counter()
+
+    def stage(name, begin):
+        print("{} stage {} {:.6f}".format(MARKER, name, time.perf_counter() - begin), flush=True)
+        return time.perf_counter()
+
+    t = time.perf_counter()
+    import app  # noqa: F401
+    from config import conf, load_config
+
+    t = stage("import_app", t)
+    load_config()
+    t = stage("load_config", t)
+    if channel_name is None:
+        channel_name = conf().get("channel_type", "wx")
+    try:
+        from channel import channel_factory
+
+        channel_factory.create_channel(channel_name)
+    except Exception as e:
+        print("{} error create_channel {}".format(MARKER, e), flush=True)
+    t = stage("create_channel", t)
+    from plugins import PluginManager
+
+    PluginManager().load_plugins()
+    stage("load_plugins", t)
+    print("{} lazy {}".format(MARKER, ",".join(PluginManager().lazy)), flush=True)
+    stage("total", start)
+
+
+def _parse_importtime(stderr):
+    """返回[(模块名, 自身耗时us, 累计耗时us, 层级)]"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip())) // 2
+            modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return modules
+
+
+def _parse_budget(argv):
+    if "--budget" not in argv:
+        return None
+    index = argv.index("--budget")
+    try:
+        return float(argv[index + 1])
+    except (IndexError, ValueError):
+        raise SystemExit("--budget需要指定秒数，如: --budget 2")
+
+
+def profile_startup(argv=None):
+    argv = sys.argv if argv is None else argv
+    channel_name = "terminal" if "--cmd" in argv else None
+    budget = _parse_budget(argv)
+    code = "from common.startup_profile import run_stages; run_stages({!r})".format(channel_name)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+
+    stages, errors, lazy = [], [], []
+    for line in result.stdout.splitlines():
+        if not line.startswith(MARKER):
+            continue
+        kind, _, rest = line[len(MARKER) + 1:].partition(" ")
+        if kind == "stage":
+            name, seconds = rest.rsplit(" ", 1)
+            stages.append((name, float(seconds)))
+        elif kind == "error":
+            errors.append(rest)
+        elif kind == "lazy":
+            lazy = [name for name in rest.split(",") if name]
+    if result.returncode != 0 and not stages:
+        print(result.stdout[-2000:])
+        print(result.stderr[-2000:])
+        return result.returncode
+
+    modules = _parse_importtime(result.stderr)
+    print("启动耗时(子进程总计{:.2f}s，包含解释器启动):".format(wall))
+    for name, seconds in stages:
+        print("  {:<16} {:>8.3f}s".format(name, seconds))
+    for error in errors:
+        print("  创建channel失败: {}".format(error))
+    print("延迟导入的插件: {}".format(", ".join(lazy) if lazy else "无"))
+    top_level = sum(cumulative for _, _, cumulative, depth in modules if depth == 0)
+    print("导入模块{}个，顶层导入累计{:.3f}s".format(len(modules), top_level / 1e6))
+    print("累计耗时最多的{}个模块(包含其导入的模块):".format(TOP))
+    for name, self_us, cumulative_us, depth in sorted(modules, key=lambda m: m[2], reverse=True)[:TOP]:
+        print("  {:>9.1f}ms  {:>9.1f}ms(自身)  {}".format(cumulative_us / 1000, self_us / 1000, name))
+    print("自身耗时最多的{}个模块:".format(TOP))
+    for name, self_us, cumulative_us, depth in sorted(modules, key=lambda m: m[1], reverse=True)[:TOP]:
+        print("  {:>9.1f}ms  {}".format(self_us / 1000, name))
+
+    imported = {name for name, _, _, _ in modules}
+    eager = [name for name in DEFERRED_MODULES if name in imported]
+    print("启动阶段导入的重依赖: {}".format(", ".join(eager) if eager else "无"))
+    if budget is None:
+        return 0
+    total = dict(stages).get("total")
+    if total is None or total > budget:
+        print("启动耗时超出预算: {} > {:.3f}s".format("未完成" if total is None else "{:.3f}s".format(total), budget))
+        return 1
+    if eager:
+        print("启动阶段不应导入: {}".format(", ".join(eager)))
+        return 1
+    print("启动耗时{:.3f}s，在预算{:.3f}s之内".format(total, budget))
+    return 0
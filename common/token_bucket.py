@@ -1,39 +1,143 @@
+import asyncio
 import threading
 import time
+from collections import OrderedDict
 
 
 class TokenBucket:
-    def __init__(self, tpm, timeout=None):
-        self.capacity = int(tpm)  # 令牌桶容量
-        self.tokens = 0  # 初始令牌数为0
+    """
+    令牌桶限流，不需要生成令牌的线程
+
+    获取令牌时根据距上次计算的时间(time.monotonic)补充令牌，锁只保护几次算术运算，不会在锁内等待
+    """
+
+    def __init__(self, tpm, timeout=None, capacity=None):
         self.rate = int(tpm) / 60  # 令牌每秒生成速率
+        self.capacity = int(capacity if capacity is not None else tpm)  # 令牌桶容量
+        self.tokens = float(self.capacity)  # 初始时令牌桶是满的
         self.timeout = timeout  # 等待令牌超时时间
-        self.cond = threading.Condition()  # 条件变量
-        self.is_running = True
-        # 开启令牌生成线程
-        threading.Thread(target=self._generate_tokens).start()
-
-    def _generate_tokens(self):
-        """生成令牌"""
-        while self.is_running:
-            with self.cond:
-                if self.tokens < self.capacity:
-                    self.tokens += 1
-                self.cond.notify()  # 通知获取令牌的线程
-            time.sleep(1 / self.rate)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def try_acquire(self, tokens=1) -> float:
+        """
+        尝试获取令牌，不等待
+        :param tokens: 需要的令牌数，超过容量时按容量计算
+        :return: 获取成功返回0，否则返回还需要等待的秒数(此时不扣减令牌)
+        """
+        tokens = min(tokens, self.capacity)
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            if self.rate <= 0:
+                return float("inf")
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1, timeout=None) -> bool:
+        """获取令牌，令牌不足时等待，超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, tokens=1, timeout=None) -> bool:
+        """acquire的异步版本，等待时不阻塞事件循环"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
 
     def get_token(self):
         """获取令牌"""
-        with self.cond:
-            while self.tokens <= 0:
-                flag = self.cond.wait(self.timeout)
-                if not flag:  # 超时
-                    return False
-            self.tokens -= 1
-        return True
+        return self.acquire(1, self.timeout)
+
+    def available(self) -> float:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
 
     def close(self):
-        self.is_running = False
+        # 已经没有生成令牌的线程，保留接口兼容旧代码
+        pass
+
+
+class KeyedTokenBucket:
+    """
+    按key(用户、群、api key等)区分的令牌桶，最多保留max_keys个，超出时淘汰最久未使用的
+
+    每个key只保存[令牌数, 上次补充时间]，所有key共用一把锁，大量key时占用的内存也很小
+    被淘汰的key再次使用时桶是满的，空闲超过capacity/rate秒的桶本来也已经补满，所以max_keys不宜太小
+    """
+
+    def __init__(self, tpm, timeout=None, capacity=None, max_keys=10000):
+        self.tpm = tpm
+        self.rate = int(tpm) / 60
+        self.capacity = int(capacity if capacity is not None else tpm)
+        self.timeout = timeout
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> [令牌数, 上次补充时间]，按最近使用排序
+        self.lock = threading.Lock()
+
+    def try_acquire(self, key, tokens=1) -> float:
+        """尝试获取key的令牌，不等待，返回值同TokenBucket.try_acquire"""
+        tokens = min(tokens, self.capacity)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.buckets.get(key)
+            if entry is None:
+                entry = [float(self.capacity), now]
+                self.buckets[key] = entry
+                while len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                if now > entry[1]:
+                    entry[0] = min(self.capacity, entry[0] + (now - entry[1]) * self.rate)
+                    entry[1] = now
+            if entry[0] >= tokens:
+                entry[0] -= tokens
+                return 0
+            if self.rate <= 0:
+                return float("inf")
+            return (tokens - entry[0]) / self.rate
+
+    def acquire(self, key, tokens=1, timeout=None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(key, tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, key, tokens=1, timeout=None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(key, tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def __len__(self):
+        return len(self.buckets)
 
 
 if __name__ == "__main__":
@@ -42,4 +146,5 @@ if __name__ == "__main__":
     for i in range(3):
         if token_bucket.get_token():
             print(f"第{i+1}次请求成功")
+    print("再请求20个令牌需要等待{:.1f}秒".format(token_bucket.try_acquire(20)))
     token_bucket.close()
@@ -0,0 +1,124 @@
+"""
+共享的access token缓存
+
+- 按(服务商, 凭证)缓存token，过期前一段时间在后台提前刷新，刷新期间继续返回旧token
+- 同一个key同时只有一个线程去获取，其他线程等待这一次的结果
+- 获取失败时按指数退避加随机抖动重试
+"""
+
+import random
+import threading
+import time
+
+from common import http_client
+from common.log import logger
+
+
+class AccessToken:
+    def __init__(self, value, expires_at, refresh_at):
+        self.value = value
+        self.expires_at = expires_at
+        self.refresh_at = refresh_at
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TokenCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = {}  # key -> AccessToken
+        self.flights = {}  # key -> 正在进行的获取
+
+    def get(self, key, fetch, refresh_before=300, retries=2, backoff=1.0) -> str:
+        """
+        返回key对应的有效token
+        :param key: 缓存的key，(服务商, 凭证...)
+        :param fetch: 获取token的函数，返回(token, 有效秒数)，有效秒数为None时表示不过期，失败时抛出异常
+        :param refresh_before: 过期前多少秒开始在后台刷新
+        """
+        now = time.time()
+        with self.lock:
+            token = self.tokens.get(key)
+            if token is not None and now < token.expires_at:
+                if now < token.refresh_at or key in self.flights:
+                    return token.value
+                # 快过期了，后台刷新，这次先用旧的
+                flight = self.flights[key] = _Flight()
+                background = True
+            else:
+                flight = self.flights.get(key)
+                if flight is not None:
+                    background = None  # 等待其他线程的结果
+                else:
+                    flight = self.flights[key] = _Flight()
+                    background = False
+        if background:
+            threading.Thread(target=self._refresh, args=(key, fetch, flight, refresh_before, retries, backoff), daemon=True).start()
+            return token.value
+        if background is False:
+            self._refresh(key, fetch, flight, refresh_before, retries, backoff)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def invalidate(self, key):
+        """服务端提示token失效时调用，下次get会重新获取"""
+        with self.lock:
+            self.tokens.pop(key, None)
+
+    def entry(self, key) -> AccessToken:
+        return self.tokens.get(key)
+
+    def _refresh(self, key, fetch, flight, refresh_before, retries, backoff):
+        try:
+            attempt = 0
+            while True:
+                try:
+                    value, expires_in = fetch()
+                    break
+                except Exception as e:
+                    if attempt >= retries:
+                        raise
+                    delay = backoff * (2**attempt) * (0.5 + random.random() / 2)
+                    logger.warn("[TokenCache] fetch token for {} failed: {}, retry in {:.1f}s".format(key[0], e, delay))
+                    attempt += 1
+                    time.sleep(delay)
+            now = time.time()
+            if expires_in is None:
+                expires_at = refresh_at = float("inf")
+            else:
+                expires_at = now + expires_in
+                refresh_at = expires_at - min(refresh_before, expires_in / 2)
+            with self.lock:
+                self.tokens[key] = AccessToken(value, expires_at, refresh_at)
+            flight.value = value
+        except Exception as e:
+            logger.error("[TokenCache] fetch token for {} failed: {}".format(key[0], e))
+            flight.error = e
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+
+
+token_cache = TokenCache()
+
+
+def baidu_access_token(api_key, secret_key) -> str:
+    """百度智能云的access token，文心一言、语音、UNIT共用"""
+
+    def fetch():
+        params = {"grant_type": "client_credentials", "client_id": api_key, "client_secret": secret_key}
+        res = http_client.post("https://aip.baidubce.com/oauth/2.0/token", params=params).json()
+        if not res.get("access_token"):
+            raise Exception("get baidu access token failed: {}".format(res))
+        return res["access_token"], res.get("expires_in", 2592000)
+
+    return token_cache.get(("baidu", api_key, secret_key), fetch)
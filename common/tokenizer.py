@@ -0,0 +1,148 @@
+"""
+共享的token计数工具
+
+- OpenAI系列模型使用tiktoken计算，encoding按名称缓存，只加载一次
+- 其他厂商的模型官方计算规则不统一，按字符数粗略估算
+- count_many使用tiktoken的encode_batch批量计算多条消息
+- 启动时可以调用warm_up预先加载encoding，避免第一条消息等待BPE词表加载
+"""
+
+import threading
+
+from common import const
+from common.log import logger
+
+# 按gpt-4规则计算的模型，其余OpenAI模型都按gpt-3.5-turbo计算
+GPT4_TOKENIZER_MODELS = [
+    "gpt-4", "gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
+    "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
+    "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
+    const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO, const.GPT_5, const.GPT_5_MINI, const.GPT_5_NANO,
+]
+
+_encodings = {}  # 模型名 -> tiktoken encoding
+_tokenizers = {}  # 模型名 -> MessageTokenizer
+_lock = threading.Lock()
+
+
+def is_character_model(model) -> bool:
+    """不使用tiktoken，按字符数估算token的模型"""
+    return not model or model in ["wenxin", "xunfei"] or model.startswith(const.GEMINI)
+
+
+def get_encoding(model):
+    """获取模型对应的tiktoken encoding，未知模型使用cl100k_base"""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        with _lock:
+            encoding = _encodings.get(model)
+            if encoding is None:
+                import tiktoken
+
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    logger.debug("[tokenizer] model {} not found, using cl100k_base encoding".format(model))
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                _encodings[model] = encoding
+    return encoding
+
+
+class MessageTokenizer(object):
+    """
+    消息的token计数器，encoding为None时按字符数估算
+    """
+
+    def __init__(self, encoding=None, tokens_per_message=0, tokens_per_name=0, priming_tokens=0, content_key="content"):
+        self.encoding = encoding
+        self.tokens_per_message = tokens_per_message
+        self.tokens_per_name = tokens_per_name
+        self.priming_tokens = priming_tokens  # 每次回复额外占用的token
+        self.content_key = content_key  # 按字符估算时统计的字段
+
+    def count_message(self, message) -> int:
+        if self.encoding is None:
+            return len(message[self.content_key])
+        num_tokens = self.tokens_per_message
+        for key, value in message.items():
+            num_tokens += len(self.encoding.encode(value, disallowed_special=()))
+            if key == "name":
+                num_tokens += self.tokens_per_name
+        return num_tokens
+
+    def count_many(self, messages) -> list:
+        """批量计算多条消息的token数，返回与messages一一对应的列表"""
+        if self.encoding is None or len(messages) < 2:
+            return [self.count_message(message) for message in messages]
+        texts = []
+        for message in messages:
+            texts.extend(message.values())
+        encoded = self.encoding.encode_batch(texts, disallowed_special=())
+        counts = []
+        i = 0
+        for message in messages:
+            num_tokens = self.tokens_per_message
+            for key in message:
+                num_tokens += len(encoded[i])
+                if key == "name":
+                    num_tokens += self.tokens_per_name
+                i += 1
+            counts.append(num_tokens)
+        return counts
+
+    def count_messages(self, messages) -> int:
+        return self.priming_tokens + sum(self.count_many(messages))
+
+
+CHARACTER_TOKENIZER = MessageTokenizer()
+
+
+def get_tokenizer(model) -> MessageTokenizer:
+    """按模型获取消息token计数器"""
+    tokenizer = _tokenizers.get(model)
+    if tokenizer is None:
+        tokenizer = _create_tokenizer(model)
+        _tokenizers[model] = tokenizer
+    return tokenizer
+
+
+def _create_tokenizer(model) -> MessageTokenizer:
+    if is_character_model(model):
+        return CHARACTER_TOKENIZER
+    # refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+    if model in GPT4_TOKENIZER_MODELS:
+        # every reply is primed with <|start|>assistant<|message|>
+        return MessageTokenizer(get_encoding("gpt-4"), tokens_per_message=3, tokens_per_name=1, priming_tokens=3)
+    if model != "gpt-3.5-turbo":
+        logger.debug("[tokenizer] model {} is not implemented, counting tokens as gpt-3.5-turbo".format(model))
+    # every message follows <|start|>{role/name}\n{content}<|end|>\n, if there's a name, the role is omitted
+    return MessageTokenizer(get_encoding("gpt-3.5-turbo"), tokens_per_message=4, tokens_per_name=-1, priming_tokens=3)
+
+
+def num_tokens_from_messages(messages, model) -> int:
+    """Returns the number of tokens used by a list of messages."""
+    return get_tokenizer(model).count_messages(messages)
+
+
+def num_tokens_from_string(string: str, model: str) -> int:
+    """Returns the number of tokens in a text string."""
+    return len(get_encoding(model).encode(string, disallowed_special=()))
+
+
+def num_tokens_by_character(messages, key="content") -> int:
+    """按字符数粗略估算token数，用于官方计算规则不明确的模型"""
+    tokens = 0
+    for msg in messages:
+        tokens += len(msg[key])
+    return tokens
+
+
+def warm_up(model):
+    """预先加载OpenAI模型对应的encoding，加载失败(如未安装tiktoken)时忽略"""
+    if not model or not (model.startswith("gpt") or model in GPT4_TOKENIZER_MODELS):
+        return
+    try:
+        get_tokenizer(model)
+        logger.debug("[tokenizer] encoding for model {} loaded".format(model))
+    except Exception as e:
+        logger.warn("[tokenizer] warm up failed for model {}: {}".format(model, e))
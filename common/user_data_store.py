@@ -0,0 +1,127 @@
+"""
+用户数据(user_datas)的持久化存储
+
+- 每个用户一行，保存在sqlite(WAL)中，修改某个用户的数据时只写这一行，不需要退出时整体保存
+- 按需加载，最近访问的用户缓存在内存中，没有数据的用户也会缓存，避免重复查询
+- 没有数据的用户不会写入，数据被清空时删除对应的行
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+
+_MISSING = object()
+
+
+class UserData(dict):
+    """单个用户的数据，修改后立即写入存储"""
+
+    def __init__(self, store, user, data=None):
+        super().__init__(data or {})
+        self._store = store
+        self._user = user
+
+    def _save(self):
+        self._store.save(self._user, self)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._save()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._save()
+
+    def pop(self, key, *args):
+        value = super().pop(key, *args)
+        self._save()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._save()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._save()
+
+    def clear(self):
+        super().clear()
+        self._save()
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class UserDataStore(object):
+    def __init__(self, path, cache_size=10000):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS user_datas (user TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID")
+        self.cache = ExpiredDict(0, max_size=cache_size)  # user -> UserData，没有数据时为None
+
+    def get(self, user, create=False):
+        """
+        返回用户数据，没有数据时返回None
+        :param create: 没有数据时返回一个空的UserData，写入内容后才会保存
+        """
+        with self.lock:
+            data = self.cache.get(user, _MISSING)
+            if data is _MISSING:
+                row = self.conn.execute("SELECT data FROM user_datas WHERE user=?", (user,)).fetchone()
+                data = UserData(self, user, pickle.loads(row[0])) if row else None
+                self.cache[user] = data
+            if data is None and create:
+                data = self.cache[user] = UserData(self, user)
+            return data
+
+    def save(self, user, data):
+        with self.lock:
+            if data:
+                self.conn.execute("INSERT OR REPLACE INTO user_datas (user, data) VALUES (?, ?)", (user, pickle.dumps(dict(data))))
+            else:
+                self.conn.execute("DELETE FROM user_datas WHERE user=?", (user,))
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM user_datas").fetchone()[0]
+
+    def migrate_pickle(self, pickle_path) -> int:
+        """导入旧版本整体保存的user_datas.pkl，导入后重命名为.bak，返回导入的用户数"""
+        with open(pickle_path, "rb") as f:
+            user_datas = pickle.load(f)
+        rows = [(user, pickle.dumps(dict(data))) for user, data in user_datas.items() if data]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO user_datas (user, data) VALUES (?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.cache.clear()
+        os.replace(pickle_path, pickle_path + ".bak")
+        logger.info("[UserDataStore] migrated {} of {} users from {}".format(len(rows), len(user_datas), pickle_path))
+        return len(rows)
+
+    def __deepcopy__(self, memo):
+        # Config会被deepcopy后打印，存储本身共用
+        return self
@@ -0,0 +1,59 @@
+"""
+启动预热，channel创建、插件加载完成后在后台线程执行，避免第一条消息等待重依赖的加载
+
+- tokenizer: 加载当前模型的tiktoken encoding(BPE词表)
+- chat_bot: 创建对话bot实例，导入openai等SDK
+- http_pool: 创建共享HTTP客户端的连接池
+"""
+
+import threading
+import time
+
+from common import tokenizer
+from common.log import logger
+from config import conf
+
+
+def _warm_up_tokenizer():
+    tokenizer.warm_up(conf().get("model"))
+
+
+def _warm_up_chat_bot():
+    from bridge.bridge import Bridge
+
+    Bridge().get_bot("chat")
+
+
+def _warm_up_http_pool():
+    from common import http_client
+
+    http_client.get_session()
+
+
+STEPS = [
+    ("tokenizer", _warm_up_tokenizer),
+    ("chat_bot", _warm_up_chat_bot),
+    ("http_pool", _warm_up_http_pool),
+]
+
+
+def warm_up():
+    """依次执行各预热步骤，单个步骤失败只记录日志，返回[(步骤名, 耗时秒)]"""
+    timings = []
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warn("[warm_up] {} failed: {}".format(name, e))
+            continue
+        timings.append((name, time.perf_counter() - start))
+    logger.info("[warm_up] done, {}".format(", ".join("{} {:.2f}s".format(name, seconds) for name, seconds in timings)))
+    return timings
+
+
+def start():
+    """配置了startup_warm_up时在后台线程预热，不阻塞channel启动"""
+    if not conf().get("startup_warm_up", True):
+        return
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
@@ -3,10 +3,10 @@
 import json
 import logging
 import os
-import pickle
 import copy
 
 from common.log import logger
+from common.user_data_store import UserDataStore
 
 # 将所有可用的配置项写在字典里, 请使用小写字母
 # 此处的配置值无实际意义，程序不会读取此处的配置，仅用于提示格式，请将配置加入到config.json中
@@ -49,16 +49,44 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    # 消息处理线程池配置
+    "handler_pool_long_workers": 32,  # 耗时任务(LLM对话、语音、画图)的线程数
+    "handler_pool_short_workers": 4,  # 短任务(插件指令、#管理命令)的线程数
+    "handler_pool_plugin_workers": 16,  # 设置了插件时限(plugin_timeout)时执行插件处理函数的线程数
+    "handler_pool_max_queue": 200,  # 每类任务最多排队的消息数，超过后直接回复繁忙提示，0为不限制。开启async_pipeline时，超过线程数的未完成协程同样计为排队
+    "handler_pool_busy_reply": "当前提问的人太多啦，请稍后再试",  # 排队过多时的回复，为空则不回复
+    "async_pipeline": False,  # 是否使用异步管道处理耗时消息，开启后LLM请求不再占用线程，适合大量并发对话
+    "async_offload_workers": 16,  # 异步管道中执行同步插件、语音和发送函数的线程数
+    "async_http_max_connections": 100,  # 异步HTTP客户端的最大连接数
+    # 消息入口限流，在分发插件之前执行，每分钟允许的消息数，0为不限制，burst为允许的突发消息数，0表示与每分钟消息数相同
+    "rate_limit_group": 0,  # 每个群
+    "rate_limit_group_burst": 0,
+    "rate_limit_user": 0,  # 每个用户
+    "rate_limit_user_burst": 0,
+    "rate_limit_session": 0,  # 每个会话
+    "rate_limit_session_burst": 0,
+    "rate_limit_max_keys": 100000,  # 每个维度最多记录的key数，超过后淘汰最久未发消息的
+    "rate_limit_reply": "消息太频繁啦，请{}秒后再试",  # 被限流时的回复，{}为需要等待的秒数，为空则不回复
+    # 流式回复，bot支持时边生成边发送
+    "stream_reply": False,
+    "stream_update_interval": 1.0,  # 支持编辑消息的channel(web、飞书、钉钉AI卡片)更新消息的最小间隔秒数
+    "stream_chunk_chars": 300,  # 其他channel第一段之后每段至少攒够的字数，在段落边界分段发送
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     # chatgpt会话参数
     "expires_in_seconds": 3600,  # 无操作会话的过期时间
+    "session_store": "memory",  # 会话存储，memory: 只保存在内存中，重启后丢失；sqlite: 持久化到sqlite，内存中只缓存最近使用的会话
+    "session_store_path": "",  # sqlite会话存储的文件路径，默认为数据目录下的sessions.db
+    "session_cache_size": 1000,  # 持久化存储时内存中最多缓存的会话数
+    "session_flush_interval": 1,  # 持久化存储时修改过的会话写入存储的间隔秒数
+    "history_compress_keep": 0,  # 大于0时，会话空闲期间最近N条之前的消息用zlib压缩保存，0为不压缩
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
     # chatgpt限流配置
     "rate_limit_chatgpt": 20,  # chatgpt的调用频率限制
     "rate_limit_dalle": 50,  # openai dalle的调用频率限制
+    "rate_limit_chatgpt_tokens": 0,  # chatgpt每分钟允许提交的prompt token数，按api key区分，0为不限制
     # chatgpt api参数 参考https://platform.openai.com/docs/api-reference/chat/create
     "temperature": 0.9,
     "top_p": 1,
@@ -66,6 +94,13 @@ available_setting = {
     "presence_penalty": 0,
     "request_timeout": 180,  # chatgpt请求超时时间，openai接口默认设置为600，对于难问题一般需要较长时间
     "timeout": 120,  # chatgpt重试超时时间，在这个时间内，将会自动重试
+    "http_pool_connections": 20,  # 共享HTTP客户端缓存连接池的host数
+    "http_pool_maxsize": 50,  # 共享HTTP客户端每个host保持的长连接数
+    # 相同请求合并与回复缓存，只有system prompt、历史消息和问题都相同时才共用回复，按bot类型和会话模式开启
+    "reply_cache_bot_types": [],  # 开启的bot类型，如["chatGPT"]，为空时不开启
+    "reply_cache_session_modes": [],  # 开启的会话模式: single(私聊)、group(群聊，每人一个会话)、group_shared(group_chat_in_one_session中的群)
+    "reply_cache_ttl": 300,  # 回复缓存的秒数
+    "reply_cache_max_size": 1000,  # 最多缓存的回复条数
     # Baidu 文心一言参数
     "baidu_wenxin_model": "eb-instant",  # 默认使用ERNIE-Bot-turbo模型
     "baidu_wenxin_api_key": "",  # Baidu api key
@@ -162,6 +197,12 @@ available_setting = {
     "appdata_dir": "",  # 数据目录
     # 插件配置
     "plugin_trigger_prefix": "$",  # 规范插件提供聊天相关指令的前缀，建议不要和管理员指令前缀"#"冲突
+    "startup_warm_up": True,  # channel创建、插件加载后在后台预加载tokenizer、对话bot和HTTP连接池，避免第一条消息变慢
+    "plugin_lazy_load": True,  # 有manifest.json的插件(如tool、agent、linkai)启动时只注册，第一次用到时再导入模块
+    "plugin_timeout": 0,  # 插件处理单个事件的时限(秒)，超时后跳过该插件继续处理，0为不限制(在消息处理线程中直接执行)
+    "plugin_timeouts": {},  # 按插件名单独设置时限，如{"tool": 300}，0为不限制，只在plugin_timeout不为0时生效
+    "plugin_timeout_strikes": 3,  # 插件连续超时达到该次数后临时禁用，0为不禁用
+    "plugin_suspend_seconds": 600,  # 临时禁用的秒数，到期后自动恢复
     # 是否使用全局插件配置
     "use_global_plugin_config": False,
     "max_media_send_count": 3,  # 单次最大发送媒体资源的个数
@@ -189,12 +230,14 @@ available_setting = {
 class Config(dict):
     def __init__(self, d=None):
         super().__init__()
+        # 每次修改配置项加1，用于让由配置编译出的对象(如触发匹配器)失效重建
+        self.version = 0
         if d is None:
             d = {}
         for k, v in d.items():
             self[k] = v
-        # user_datas: 用户数据，key为用户名，value为用户数据，也是dict
-        self.user_datas = {}
+        # user_datas: 用户数据的存储，按用户保存，每个用户的数据是一个dict
+        self.user_datas = None
 
     def __getitem__(self, key):
         if key not in available_setting:
@@ -204,6 +247,7 @@ class Config(dict):
     def __setitem__(self, key, value):
         if key not in available_setting:
             raise Exception("key {} not in available_setting".format(key))
+        self.version += 1
         return super().__setitem__(key, value)
 
     def get(self, key, default=None):
@@ -214,30 +258,33 @@ class Config(dict):
         except Exception as e:
             raise e
 
+    def _user_data_store(self) -> UserDataStore:
+        if self.user_datas is None:  # 没有调用load_user_datas时只保存在内存中
+            self.user_datas = UserDataStore(":memory:")
+        return self.user_datas
+
     # Make sure to return a dictionary to ensure atomic
     def get_user_data(self, user) -> dict:
-        if self.user_datas.get(user) is None:
-            self.user_datas[user] = {}
-        return self.user_datas[user]
+        """返回的dict被修改时会立即保存"""
+        return self._user_data_store().get(user, create=True)
+
+    def peek_user_data(self, user) -> dict:
+        """只读获取用户数据，用户没有数据时返回空dict，不会创建"""
+        return self._user_data_store().get(user) or {}
 
     def load_user_datas(self):
         try:
-            with open(os.path.join(get_appdata_dir(), "user_datas.pkl"), "rb") as f:
-                self.user_datas = pickle.load(f)
-                logger.info("[Config] User datas loaded.")
-        except FileNotFoundError as e:
-            logger.info("[Config] User datas file not found, ignore.")
+            self.user_datas = UserDataStore(os.path.join(get_appdata_dir(), "user_datas.db"))
+            logger.info("[Config] User datas store opened.")
+            pickle_path = os.path.join(get_appdata_dir(), "user_datas.pkl")
+            if os.path.exists(pickle_path):  # 旧版本整体保存的用户数据
+                self.user_datas.migrate_pickle(pickle_path)
         except Exception as e:
             logger.info("[Config] User datas error: {}".format(e))
-            self.user_datas = {}
 
     def save_user_datas(self):
-        try:
-            with open(os.path.join(get_appdata_dir(), "user_datas.pkl"), "wb") as f:
-                pickle.dump(self.user_datas, f)
-                logger.info("[Config] User datas saved.")
-        except Exception as e:
-            logger.info("[Config] User datas error: {}".format(e))
+        """用户数据在修改时已经保存，保留该方法兼容旧的调用"""
+        pass
 
 
 config = Config()
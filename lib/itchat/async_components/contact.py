@@ -3,7 +3,7 @@ import json, copy
 import logging
 
 from .. import config, utils
-from ..components.contact import accept_friend
+from ..components.contact import accept_friend, merge_chatroom_members
 from ..returnvalues import ReturnValue
 from ..storage import contact_change
 from ..utils import update_info_dict
@@ -104,6 +104,7 @@ def update_local_chatrooms(core, l):
         get a list of chatrooms for updating local chatrooms
         return a list of given chatrooms with updated info
     '''
+    memberChanges = {}
     for chatroom in l:
         # format new chatrooms
         utils.emoji_formatter(chatroom, 'NickName')
@@ -118,33 +119,19 @@ def update_local_chatrooms(core, l):
         oldChatroom = utils.search_dict_list(
             core.chatroomList, 'UserName', chatroom['UserName'])
         if oldChatroom:
+            # members are not known before the first detailed fetch, that is not a change
+            hadMembers = bool(oldChatroom.get('MemberList'))
             update_info_dict(oldChatroom, chatroom)
-            #  - update other values
-            memberList = chatroom.get('MemberList', [])
-            oldMemberList = oldChatroom['MemberList']
-            if memberList:
-                for member in memberList:
-                    oldMember = utils.search_dict_list(
-                        oldMemberList, 'UserName', member['UserName'])
-                    if oldMember:
-                        update_info_dict(oldMember, member)
-                    else:
-                        oldMemberList.append(member)
+            #  - update members and delete useless members
+            added, removed = merge_chatroom_members(
+                oldChatroom['MemberList'], chatroom.get('MemberList', []))
+            if hadMembers and (added or removed):
+                memberChanges[chatroom['UserName']] = {
+                    'Added': added, 'Removed': removed, }
         else:
             core.chatroomList.append(chatroom)
             oldChatroom = utils.search_dict_list(
                 core.chatroomList, 'UserName', chatroom['UserName'])
-        # delete useless members
-        if len(chatroom['MemberList']) != len(oldChatroom['MemberList']) and \
-                chatroom['MemberList']:
-            existsUserNames = [member['UserName'] for member in chatroom['MemberList']]
-            delList = []
-            for i, member in enumerate(oldChatroom['MemberList']):
-                if member['UserName'] not in existsUserNames:
-                    delList.append(i)
-            delList.sort(reverse=True)
-            for i in delList:
-                del oldChatroom['MemberList'][i]
         #  - update OwnerUin
         if oldChatroom.get('ChatRoomOwner') and oldChatroom.get('MemberList'):
             owner = utils.search_dict_list(oldChatroom['MemberList'],
@@ -160,12 +147,14 @@ def update_local_chatrooms(core, l):
         newSelf = utils.search_dict_list(oldChatroom['MemberList'],
             'UserName', core.storageClass.userName)
         oldChatroom['Self'] = newSelf or copy.deepcopy(core.loginInfo['User'])
+    core.storageClass.record_member_changes(memberChanges)
     return {
-        'Type'         : 'System',
-        'Text'         : [chatroom['UserName'] for chatroom in l],
-        'SystemInfo'   : 'chatrooms',
-        'FromUserName' : core.storageClass.userName,
-        'ToUserName'   : core.storageClass.userName, }
+        'Type'          : 'System',
+        'Text'          : [chatroom['UserName'] for chatroom in l],
+        'SystemInfo'    : 'chatrooms',
+        'MemberChanges' : memberChanges,
+        'FromUserName'  : core.storageClass.userName,
+        'ToUserName'    : core.storageClass.userName, }
 
 @contact_change
 def update_local_friends(core, l):
@@ -337,6 +326,7 @@ def set_alias(self, userName, alias):
     r = ReturnValue(rawResponse=r)
     if r:
         oldFriendInfo['RemarkName'] = alias
+        self.storageClass.contacts_changed()
     return r
 
 def set_pinned(self, userName, isPinned=True):
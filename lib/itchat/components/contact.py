@@ -106,12 +106,42 @@ def update_friend(self, userName):
     return r if len(r) != 1 else r[0]
 
 
+def merge_chatroom_members(oldMemberList, memberList):
+    ''' merge the latest member list into the local one in place
+        * return (added, removed) members
+        * members are matched by UserName, so it's linear in member count
+    '''
+    if not memberList:
+        return [], []
+    oldMembers = {member['UserName']: member for member in oldMemberList}
+    added = []
+    for member in memberList:
+        oldMember = oldMembers.get(member['UserName'])
+        if oldMember is None:
+            oldMemberList.append(member)
+            added.append(oldMemberList[-1])
+        else:
+            update_info_dict(oldMember, member)
+    removed = []
+    if len(memberList) != len(oldMemberList):
+        existsUserNames = {member['UserName'] for member in memberList}
+        keptList = []
+        for member in oldMemberList:
+            if member['UserName'] in existsUserNames:
+                keptList.append(member)
+            else:
+                removed.append(member)
+        oldMemberList[:] = keptList
+    return added, removed
+
+
 @contact_change
 def update_local_chatrooms(core, l):
     '''
         get a list of chatrooms for updating local chatrooms
         return a list of given chatrooms with updated info
     '''
+    memberChanges = {}
     for chatroom in l:
         # format new chatrooms
         utils.emoji_formatter(chatroom, 'NickName')
@@ -126,34 +156,19 @@ def update_local_chatrooms(core, l):
         oldChatroom = utils.search_dict_list(
             core.chatroomList, 'UserName', chatroom['UserName'])
         if oldChatroom:
+            # members are not known before the first detailed fetch, that is not a change
+            hadMembers = bool(oldChatroom.get('MemberList'))
             update_info_dict(oldChatroom, chatroom)
-            #  - update other values
-            memberList = chatroom.get('MemberList', [])
-            oldMemberList = oldChatroom['MemberList']
-            if memberList:
-                for member in memberList:
-                    oldMember = utils.search_dict_list(
-                        oldMemberList, 'UserName', member['UserName'])
-                    if oldMember:
-                        update_info_dict(oldMember, member)
-                    else:
-                        oldMemberList.append(member)
+            #  - update members and delete useless members
+            added, removed = merge_chatroom_members(
+                oldChatroom['MemberList'], chatroom.get('MemberList', []))
+            if hadMembers and (added or removed):
+                memberChanges[chatroom['UserName']] = {
+                    'Added': added, 'Removed': removed, }
         else:
             core.chatroomList.append(chatroom)
             oldChatroom = utils.search_dict_list(
                 core.chatroomList, 'UserName', chatroom['UserName'])
-        # delete useless members
-        if len(chatroom['MemberList']) != len(oldChatroom['MemberList']) and \
-                chatroom['MemberList']:
-            existsUserNames = [member['UserName']
-                               for member in chatroom['MemberList']]
-            delList = []
-            for i, member in enumerate(oldChatroom['MemberList']):
-                if member['UserName'] not in existsUserNames:
-                    delList.append(i)
-            delList.sort(reverse=True)
-            for i in delList:
-                del oldChatroom['MemberList'][i]
         #  - update OwnerUin
         if oldChatroom.get('ChatRoomOwner') and oldChatroom.get('MemberList'):
             owner = utils.search_dict_list(oldChatroom['MemberList'],
@@ -169,10 +184,12 @@ def update_local_chatrooms(core, l):
         newSelf = utils.search_dict_list(oldChatroom['MemberList'],
                                          'UserName', core.storageClass.userName)
         oldChatroom['Self'] = newSelf or copy.deepcopy(core.loginInfo['User'])
+    core.storageClass.record_member_changes(memberChanges)
     return {
         'Type': 'System',
         'Text': [chatroom['UserName'] for chatroom in l],
         'SystemInfo': 'chatrooms',
+        'MemberChanges': memberChanges,
         'FromUserName': core.storageClass.userName,
         'ToUserName': core.storageClass.userName, }
 
@@ -357,6 +374,7 @@ def set_alias(self, userName, alias):
     r = ReturnValue(rawResponse=r)
     if r:
         oldFriendInfo['RemarkName'] = alias
+        self.storageClass.contacts_changed()
     return r
 
 
@@ -299,10 +299,8 @@ def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
                     pass
                 else:
                     msgList, contactList = self.get_msg()
-                    if msgList:
-                        msgList = produce_msg(self, msgList)
-                        for msg in msgList:
-                            self.msgList.put(msg)
+                    # update contacts first, so that messages of new members can be produced
+                    # and member changes are ready when join/exit notes are handled
                     if contactList:
                         chatroomList, otherList = [], []
                         for contact in contactList:
@@ -315,6 +313,10 @@ def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
                         chatroomMsg['User'] = self.loginInfo['User']
                         self.msgList.put(chatroomMsg)
                         update_local_friends(self, otherList)
+                    if msgList:
+                        msgList = produce_msg(self, msgList)
+                        for msg in msgList:
+                            self.msgList.put(msg)
                 retryCount = 0
             except requests.exceptions.ReadTimeout:
                 pass
@@ -6,10 +6,15 @@ from .templates import (
     ContactList, AbstractUserDict, User,
     MassivePlatform, Chatroom, ChatroomMember)
 
+MEMBER_CHANGES_TTL = 10 # seconds a recorded member change waits for its note
+
 def contact_change(fn):
     def _contact_change(core, *args, **kwargs):
         with core.storageClass.updateLock:
-            return fn(core, *args, **kwargs)
+            try:
+                return fn(core, *args, **kwargs)
+            finally:
+                core.storageClass.contacts_changed()
     return _contact_change
 
 class Storage(object):
@@ -22,6 +27,7 @@ class Storage(object):
         self.chatroomList      = ContactList()
         self.msgList           = Queue(-1)
         self.lastInputUserName = None
+        self.memberChanges     = {} # chatroom UserName -> latest added/removed members
         self.memberList.set_default_value(contactClass=User)
         self.memberList.core = core
         self.mpList.set_default_value(contactClass=MassivePlatform)
@@ -59,15 +65,48 @@ class Storage(object):
                 chatroom['Self'].core = chatroom.core
                 chatroom['Self'].chatroom = chatroom
         self.lastInputUserName = j.get('lastInputUserName', None)
+    def contacts_changed(self):
+        ''' contacts may be modified in place, so indexes are dropped after every contact change '''
+        self.memberList.clear_index()
+        self.mpList.clear_index()
+        self.chatroomList.clear_index()
+    def record_member_changes(self, memberChanges):
+        ''' called with updateLock held, keeps the latest changes of each chatroom
+            * changes are only kept for MEMBER_CHANGES_TTL seconds, the note that caused them
+              arrives right after the sync, older ones must not be taken for a later note
+        '''
+        now = time.time()
+        for chatroomUserName in [k for k, v in self.memberChanges.items()
+                if now - v['Time'] > MEMBER_CHANGES_TTL]:
+            del self.memberChanges[chatroomUserName]
+        for chatroomUserName, changes in memberChanges.items():
+            self.memberChanges[chatroomUserName] = dict(changes, Time=now)
+    def pop_member_changes(self, chatroomUserName, kind):
+        ''' return and forget the latest added or removed members of a chatroom
+            * kind: 'Added' or 'Removed'
+            * changes recorded more than MEMBER_CHANGES_TTL seconds ago are dropped
+        '''
+        with self.updateLock:
+            changes = self.memberChanges.get(chatroomUserName)
+            if not changes:
+                return []
+            if time.time() - changes['Time'] > MEMBER_CHANGES_TTL:
+                del self.memberChanges[chatroomUserName]
+                return []
+            members = changes.pop(kind, None) or []
+            if not any(changes.get(k) for k in ('Added', 'Removed')):
+                del self.memberChanges[chatroomUserName]
+            return members
     def search_friends(self, name=None, userName=None, remarkName=None, nickName=None,
             wechatAccount=None):
+        ''' contacts are looked up by index and returned as shallow snapshots '''
         with self.updateLock:
             if (name or userName or remarkName or nickName or wechatAccount) is None:
-                return copy.deepcopy(self.memberList[0]) # my own account
+                return copy.copy(self.memberList[0]) # my own account
             elif userName: # return the only userName match
-                for m in self.memberList:
-                    if m['UserName'] == userName:
-                        return copy.deepcopy(m)
+                m = self.memberList.search('UserName', userName)
+                if m is not None:
+                    return copy.copy(m)
             else:
                 matchDict = {
                     'RemarkName' : remarkName,
@@ -77,10 +116,13 @@ class Storage(object):
                     if matchDict[k] is None:
                         del matchDict[k]
                 if name: # select based on name
-                    contact = []
-                    for m in self.memberList:
-                        if any([m.get(k) == name for k in ('RemarkName', 'NickName', 'Alias')]):
-                            contact.append(m)
+                    positions = set()
+                    for k in ('RemarkName', 'NickName', 'Alias'):
+                        positions.update(self.memberList.search_index(k, name))
+                    contact = [self.memberList[i] for i in sorted(positions)]
+                elif matchDict: # narrow down by any one of the keys
+                    k, v = next(iter(matchDict.items()))
+                    contact = [self.memberList[i] for i in self.memberList.search_index(k, v)]
                 else:
                     contact = self.memberList[:]
                 if matchDict: # select again based on matchDict
@@ -88,30 +130,30 @@ class Storage(object):
                     for m in contact:
                         if all([m.get(k) == v for k, v in matchDict.items()]):
                             friendList.append(m)
-                    return copy.deepcopy(friendList)
+                    return [copy.copy(m) for m in friendList]
                 else:
-                    return copy.deepcopy(contact)
+                    return [copy.copy(m) for m in contact]
     def search_chatrooms(self, name=None, userName=None):
         with self.updateLock:
             if userName is not None:
-                for m in self.chatroomList:
-                    if m['UserName'] == userName:
-                        return copy.deepcopy(m)
+                m = self.chatroomList.search('UserName', userName)
+                if m is not None:
+                    return copy.copy(m)
             elif name is not None:
                 matchList = []
                 for m in self.chatroomList:
                     if name in m['NickName']:
-                        matchList.append(copy.deepcopy(m))
+                        matchList.append(copy.copy(m))
                 return matchList
     def search_mps(self, name=None, userName=None):
         with self.updateLock:
             if userName is not None:
-                for m in self.mpList:
-                    if m['UserName'] == userName:
-                        return copy.deepcopy(m)
+                m = self.mpList.search('UserName', userName)
+                if m is not None:
+                    return copy.copy(m)
             elif name is not None:
                 matchList = []
                 for m in self.mpList:
                     if name in m['NickName']:
-                        matchList.append(copy.deepcopy(m))
+                        matchList.append(copy.copy(m))
                 return matchList
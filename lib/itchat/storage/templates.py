@@ -27,7 +27,9 @@ class UnInitializedItchat(object):
         return self._raise_error
 
 class ContactList(list):
-    ''' when a dict is append, init function will be called to format that dict '''
+    ''' when a dict is append, init function will be called to format that dict
+        indexes by key are built lazily and dropped whenever the list changes '''
+    _indexes = None
     def __init__(self, *args, **kwargs):
         super(ContactList, self).__init__(*args, **kwargs)
         self.__setstate__(None)
@@ -48,6 +50,55 @@ class ContactList(list):
         if self.contactInitFn is not None:
             contact = self.contactInitFn(self, contact) or contact
         super(ContactList, self).append(contact)
+        self.clear_index()
+    def clear_index(self):
+        ''' call it after contacts are modified in place '''
+        self._indexes = None
+    def _changed(fn):
+        def __changed(self, *args, **kwargs):
+            self._indexes = None
+            return fn(self, *args, **kwargs)
+        return __changed
+    __setitem__ = _changed(list.__setitem__)
+    __delitem__ = _changed(list.__delitem__)
+    __iadd__    = _changed(list.__iadd__)
+    insert      = _changed(list.insert)
+    extend      = _changed(list.extend)
+    pop         = _changed(list.pop)
+    remove      = _changed(list.remove)
+    clear       = _changed(list.clear)
+    sort        = _changed(list.sort)
+    reverse     = _changed(list.reverse)
+    del _changed
+    def _index(self, key):
+        if self._indexes is None:
+            self._indexes = {}
+        index = self._indexes.get(key)
+        if index is None:
+            index = {}
+            for i, contact in enumerate(self):
+                value = contact.get(key)
+                if value is not None:
+                    index.setdefault(value, []).append(i)
+            self._indexes[key] = index
+        return index
+    def search_index(self, key, value):
+        ''' return positions of contacts whose key equals value, in list order '''
+        return [i for i in self._index(key).get(value, ()) if self[i].get(key) == value]
+    def search(self, key, value):
+        ''' same as utils.search_dict_list, but uses the index '''
+        positions = self.search_index(key, value)
+        return self[positions[0]] if positions else None
+    def __copy__(self):
+        r = self.__class__(self)
+        r.contactInitFn = self.contactInitFn
+        r.contactClass = self.contactClass
+        r.core = self.core
+        # same contacts in same order, so the index is shared until either side changes
+        if self._indexes is None:
+            self._indexes = {}
+        r._indexes = self._indexes
+        return r
     def __deepcopy__(self, memo):
         r = self.__class__([copy.deepcopy(v) for v in self])
         r.contactInitFn = self.contactInitFn
@@ -124,6 +175,12 @@ class AbstractUserDict(AttributeDict):
             'Ret': -1006,
             'ErrMsg': '%s do not have members' % \
                 self.__class__.__name__, }, })
+    def __copy__(self):
+        ''' shallow snapshot, nested contacts are shared with the original '''
+        r = self.__class__.__new__(self.__class__)
+        dict.update(r, self)
+        r.__dict__.update(self.__dict__)
+        return r
     def __deepcopy__(self, memo):
         r = self.__class__()
         for k, v in self.items():
@@ -156,6 +213,10 @@ class User(AbstractUserDict):
         return self.core.set_pinned(self.userName, isPinned)
     def verify(self):
         return self.core.add_friend(**self.verifyDict)
+    def __copy__(self):
+        r = super(User, self).__copy__()
+        r.verifyDict = dict(self.verifyDict)
+        return r
     def __deepcopy__(self, memo):
         r = super(User, self).__deepcopy__(memo)
         r.verifyDict = copy.deepcopy(self.verifyDict)
@@ -192,6 +253,8 @@ class Chatroom(AbstractUserDict):
         return getattr(self, '_core', lambda: fakeItchat)() or fakeItchat
     @core.setter
     def core(self, value):
+        if getattr(self, '_core', lambda: None)() is value:
+            return # snapshots keep the core of the stored chatroom, no need to walk the members again
         self._core = ref(value)
         self.memberList.core = value
         for member in self.memberList:
@@ -216,9 +279,9 @@ class Chatroom(AbstractUserDict):
             if (name or userName or remarkName or nickName or wechatAccount) is None:
                 return None
             elif userName: # return the only userName match
-                for m in self.memberList:
-                    if m.userName == userName:
-                        return copy.deepcopy(m)
+                m = self.memberList.search('UserName', userName)
+                if m is not None:
+                    return copy.copy(m)
             else:
                 matchDict = {
                     'RemarkName' : remarkName,
@@ -239,9 +302,14 @@ class Chatroom(AbstractUserDict):
                     for m in contact:
                         if all([m.get(k) == v for k, v in matchDict.items()]):
                             friendList.append(m)
-                    return copy.deepcopy(friendList)
+                    return [copy.copy(m) for m in friendList]
                 else:
-                    return copy.deepcopy(contact)
+                    return [copy.copy(m) for m in contact]
+    def __copy__(self):
+        r = super(Chatroom, self).__copy__()
+        if isinstance(self.get('MemberList'), ContactList):
+            r['MemberList'] = copy.copy(self['MemberList'])
+        return r
     def __setstate__(self, state):
         super(Chatroom, self).__setstate__(state)
         if not 'MemberList' in self:
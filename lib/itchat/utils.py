@@ -113,7 +113,10 @@ def struct_friend_info(knownInfo):
 
 def search_dict_list(l, key, value):
     ''' Search a list of dict
-        * return dict with specific value & key '''
+        * return dict with specific value & key
+        * ContactList is searched by its index '''
+    if hasattr(l, 'search'):
+        return l.search(key, value)
     for i in l:
         if i.get(key) == value:
             return i
@@ -20,6 +20,9 @@ from common.log import logger
     version="0.1.0",
     author="Saboteur7",
     desire_priority=1,
+    context_types=[ContextType.TEXT],
+    trigger_prefixes=["{trigger_prefix}agent "],
+    timeout=600,
 )
 class AgentPlugin(Plugin):
     """Plugin for integrating AgentMesh framework."""
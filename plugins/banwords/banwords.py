@@ -2,6 +2,8 @@
 
 import json
 import os
+import threading
+import time
 
 import plugins
 from bridge.context import ContextType
@@ -9,7 +11,7 @@ from bridge.reply import Reply, ReplyType
 from common.log import logger
 from plugins import *
 
-from .lib.WordsSearch import WordsSearch
+from .lib.automaton import CompiledWordsSearch, source_digest
 
 
 @plugins.register(
@@ -19,6 +21,7 @@ from .lib.WordsSearch import WordsSearch
     desc="判断消息中是否有敏感词、决定是否回复。",
     version="1.0",
     author="lanvent",
+    context_types=[ContextType.TEXT, ContextType.IMAGE_CREATE],
 )
 class Banwords(Plugin):
     def __init__(self):
@@ -35,16 +38,16 @@ class Banwords(Plugin):
                     with open(config_path, "w") as f:
                         json.dump(conf, f, indent=4)
 
-            self.searchr = WordsSearch()
             self.action = conf["action"]
-            banwords_path = os.path.join(curdir, "banwords.txt")
-            with open(banwords_path, "r", encoding="utf-8") as f:
-                words = []
-                for line in f:
-                    word = line.strip()
-                    if word:
-                        words.append(word)
-            self.searchr.SetKeywords(words)
+            self.banwords_path = os.path.join(curdir, "banwords.txt")
+            # 编译好的自动机缓存，词库不变时直接mmap加载
+            self.cache_path = os.path.join(curdir, "banwords.dat")
+            # 每隔多少秒检查一次banwords.txt是否被修改，<=0时不检查
+            self.reload_interval = conf.get("reload_interval", 5)
+            self.reload_lock = threading.Lock()
+            self.last_check = time.time()
+            self.mtime = os.stat(self.banwords_path).st_mtime
+            self.searchr = self._load_searcher()
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
             if conf.get("reply_filter", True):
                 self.handlers[Event.ON_DECORATE_REPLY] = self.on_decorate_reply
@@ -54,6 +57,64 @@ class Banwords(Plugin):
             logger.warn("[Banwords] init failed, ignore or see https://github.com/zhayujie/chatgpt-on-wechat/tree/master/plugins/banwords .")
             raise e
 
+    def _load_searcher(self) -> CompiledWordsSearch:
+        with open(self.banwords_path, "rb") as f:
+            data = f.read()
+        digest = source_digest(data)
+        if os.path.exists(self.cache_path):
+            try:
+                searchr = CompiledWordsSearch.load(self.cache_path, digest)
+                if searchr:
+                    logger.debug("[Banwords] loaded compiled banwords from {}".format(self.cache_path))
+                    return searchr
+            except Exception as e:
+                logger.warn("[Banwords] load {} failed: {}".format(self.cache_path, e))
+        words = []
+        for line in data.decode("utf-8").splitlines():
+            word = line.strip()
+            if word:
+                words.append(word)
+        start = time.time()
+        searchr = CompiledWordsSearch()
+        searchr.SetKeywords(words)
+        logger.info("[Banwords] compiled {} words in {:.2f}s".format(len(words), time.time() - start))
+        try:
+            # 先写临时文件再替换，避免其他进程读到写了一半的缓存
+            tmp_path = "{}.{}.tmp".format(self.cache_path, os.getpid())
+            searchr.save(tmp_path, digest)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warn("[Banwords] save {} failed: {}".format(self.cache_path, e))
+        return searchr
+
+    def _reload_words(self):
+        if not self.reload_lock.acquire(blocking=False):
+            return
+        try:
+            self.mtime = os.stat(self.banwords_path).st_mtime
+            self.searchr = self._load_searcher()
+            logger.info("[Banwords] banwords reloaded")
+        except Exception as e:
+            logger.warn("[Banwords] reload banwords failed: {}".format(e))
+        finally:
+            self.reload_lock.release()
+
+    def _check_reload(self):
+        now = time.time()
+        if self.reload_interval <= 0 or now - self.last_check < self.reload_interval:
+            return
+        self.last_check = now
+        try:
+            mtime = os.stat(self.banwords_path).st_mtime
+        except OSError:
+            return
+        if mtime != self.mtime and not self.reload_lock.locked():
+            # 在后台重新编译，完成前继续使用旧的词库
+            threading.Thread(target=self._reload_words, daemon=True).start()
+
+    def reload(self):
+        self._reload_words()
+
     def on_handle_context(self, e_context: EventContext):
         if e_context["context"].type not in [
             ContextType.TEXT,
@@ -61,6 +122,7 @@ class Banwords(Plugin):
         ]:
             return
 
+        self._check_reload()
         content = e_context["context"].content
         logger.debug("[Banwords] on_handle_context. content: %s" % content)
         if self.action == "ignore":
@@ -80,6 +142,7 @@ class Banwords(Plugin):
         if e_context["reply"].type not in [ReplyType.TEXT]:
             return
 
+        self._check_reload()
         reply = e_context["reply"]
         content = reply.content
         if self.reply_action == "ignore":
@@ -0,0 +1,198 @@
+# encoding:utf-8
+"""
+扁平数组实现的Aho-Corasick自动机，接口与WordsSearch相同
+
+- 状态按层(BFS)编号，每个状态的子状态编号连续且按字符排序，所有信息保存在几个int32数组中:
+  first[s]为s第一个子状态的编号，label[s]为进入s的字符，fail为失败转移，
+  match为沿失败链最近的词尾状态(没有时为0)，term为词尾状态对应的关键词下标
+- goto转移在first[s]:first[s+1]区间内二分查找label，根状态的转移用字典
+- 可以序列化为二进制文件，加载时通过mmap映射，大词库也能立即加载
+"""
+
+import hashlib
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+__all__ = ["CompiledWordsSearch", "source_digest"]
+
+MAGIC = b"BWAC"
+VERSION = 1
+# magic, version, 状态数, 关键词数, 关键词字节数, 词库摘要
+HEADER = struct.Struct("<4sIIII20s")
+ARRAYS = ("label", "fail", "match", "term")
+
+
+def source_digest(data: bytes) -> bytes:
+    return hashlib.sha1(data).digest()
+
+
+class CompiledWordsSearch:
+    def __init__(self):
+        self._keywords = []
+        self._root = {}  # 根状态的转移，字符 -> 状态
+        self.first = array("i", [1, 1])
+        self.label = array("i", [0])
+        self.fail = array("i", [0])
+        self.match = array("i", [0])
+        self.term = array("i", [-1])
+        self.digest = b""
+        self._mmap = None
+
+    def SetKeywords(self, keywords):
+        self._keywords = list(keywords)
+        self._build()
+
+    def _build(self):
+        # 重复的关键词只保留第一次出现的下标
+        first_index = {}
+        for i, word in enumerate(self._keywords):
+            if word and word not in first_index:
+                first_index[word] = i
+        words = sorted(first_index)
+
+        first = array("i")
+        label = array("i", [0])
+        fail = array("i", [0])
+        match = array("i", [0])
+        term = array("i", [-1])
+
+        def goto(state, c):
+            lo, hi = first[state], first[state + 1]
+            i = bisect_left(label, c, lo, hi)
+            return i if i < hi and label[i] == c else 0
+
+        # 按层遍历排好序的关键词，每个状态对应words[lo:hi]的公共前缀，出队顺序即状态编号
+        queue = deque([(0, len(words), 0)])
+        state = 0
+        while queue:
+            lo, hi, depth = queue.popleft()
+            if lo < hi and len(words[lo]) == depth:
+                term[state] = first_index[words[lo]]
+                lo += 1
+            # 失败状态更浅，已经先出队，它的match和子状态区间都是确定的
+            if state != 0:
+                match[state] = state if term[state] >= 0 else match[fail[state]]
+            first.append(len(label))
+            start = lo
+            while start < hi:
+                ch = words[start][depth]
+                end = start + 1
+                while end < hi and words[end][depth] == ch:
+                    end += 1
+                c = ord(ch)
+                # 失败转移: 沿父状态的失败链找到第一个有c转移的状态
+                f = 0
+                if state != 0:
+                    f = fail[state]
+                    while True:
+                        t = goto(f, c)
+                        if t or f == 0:
+                            f = t
+                            break
+                        f = fail[f]
+                label.append(c)
+                fail.append(f)
+                match.append(0)
+                term.append(-1)
+                queue.append((start, end, depth + 1))
+                start = end
+            state += 1
+        first.append(len(label))
+        self.first, self.label, self.fail, self.match, self.term = first, label, fail, match, term
+        self._root = {chr(label[s]): s for s in range(first[0], first[1])}
+
+    def _matches(self, text):
+        """依次返回(结束位置, 词尾状态)，同一位置只返回最长的词"""
+        first, label, fail, match = self.first, self.label, self.fail, self.match
+        root = self._root.get
+        state = 0
+        for index, ch in enumerate(text):
+            if state:
+                c = ord(ch)
+                while True:
+                    hi = first[state + 1]
+                    i = bisect_left(label, c, first[state], hi)
+                    if i < hi and label[i] == c:
+                        state = i
+                        break
+                    state = fail[state]
+                    if not state:
+                        state = root(ch, 0)
+                        break
+            else:
+                state = root(ch, 0)
+            if state:
+                m = match[state]
+                if m:
+                    yield index, m
+
+    def _result(self, index, m):
+        item = self.term[m]
+        keyword = self._keywords[item]
+        return {"Keyword": keyword, "Success": True, "End": index, "Start": index + 1 - len(keyword), "Index": item}
+
+    def FindFirst(self, text):
+        for index, m in self._matches(text):
+            return self._result(index, m)
+        return None
+
+    def FindAll(self, text):
+        results = []
+        for index, m in self._matches(text):
+            while m:
+                results.append(self._result(index, m))
+                m = self.match[self.fail[m]]
+        return results
+
+    def ContainsAny(self, text):
+        for _ in self._matches(text):
+            return True
+        return False
+
+    def Replace(self, text, replaceChar="*"):
+        result = None
+        for index, m in self._matches(text):
+            if result is None:
+                result = list(text)
+            for j in range(index + 1 - len(self._keywords[self.term[m]]), index + 1):
+                result[j] = replaceChar
+        return text if result is None else "".join(result)
+
+    def save(self, path, digest=b""):
+        """序列化到path，digest为词库文件的摘要，用于判断缓存是否过期"""
+        keywords = "\n".join(self._keywords).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.label), len(self._keywords), len(keywords), digest))
+            f.write(self.first.tobytes())
+            for name in ARRAYS:
+                f.write(getattr(self, name).tobytes())
+            f.write(keywords)
+
+    @classmethod
+    def load(cls, path, digest=None):
+        """
+        通过mmap加载序列化的自动机
+        :param digest: 不为None时校验词库摘要，不一致时返回None
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, states, keyword_count, keyword_bytes, saved_digest = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION or (digest is not None and saved_digest != digest):
+            mm.close()
+            return None
+        self = cls()
+        self._mmap = mm
+        view = memoryview(mm)
+        offset = HEADER.size
+        self.first = view[offset: offset + (states + 1) * 4].cast("i")
+        offset += (states + 1) * 4
+        for name in ARRAYS:
+            setattr(self, name, view[offset: offset + states * 4].cast("i"))
+            offset += states * 4
+        self._keywords = bytes(view[offset: offset + keyword_bytes]).decode("utf-8").split("\n") if keyword_count else []
+        self._root = {chr(self.label[s]): s for s in range(self.first[0], self.first[1])}
+        self.digest = saved_digest
+        return self
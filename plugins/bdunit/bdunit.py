@@ -10,6 +10,7 @@ import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.token_cache import baidu_access_token
 from plugins import *
 
 """利用百度UNIT实现智能对话
@@ -24,6 +25,7 @@ from plugins import *
     desc="Baidu unit bot system",
     version="0.1",
     author="jackson",
+    context_types=[ContextType.TEXT],
 )
 class BDunit(Plugin):
     def __init__(self):
@@ -35,7 +37,7 @@ class BDunit(Plugin):
             self.service_id = conf["service_id"]
             self.api_key = conf["api_key"]
             self.secret_key = conf["secret_key"]
-            self.access_token = self.get_token()
+            self.get_token()
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
             logger.info("[BDunit] inited")
         except Exception as e:
@@ -64,21 +66,18 @@ class BDunit(Plugin):
         help_text = "本插件会处理询问实时日期时间，天气，数学运算等问题，这些技能由您的百度智能对话UNIT决定\n"
         return help_text
 
+    @property
+    def access_token(self):
+        return self.get_token()
+
     def get_token(self):
-        """获取访问百度UUNIT 的access_token
+        """获取访问百度UUNIT 的access_token，有效期内复用缓存，过期前自动刷新
         #param api_key: UNIT apk_key
         #param secret_key: UNIT secret_key
         Returns:
             string: access_token
         """
-        url = "https://aip.baidubce.com/oauth/2.0/token?client_id={}&client_secret={}&grant_type=client_credentials".format(self.api_key, self.secret_key)
-        payload = ""
-        headers = {"Content-Type": "application/json", "Accept": "application/json"}
-
-        response = requests.request("POST", url, headers=headers, data=payload)
-
-        # print(response.text)
-        return response.json()["access_token"]
+        return baidu_access_token(self.api_key, self.secret_key)
 
     def getUnit(self, query):
         """
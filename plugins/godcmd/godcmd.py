@@ -131,6 +131,15 @@ ADMIN_COMMANDS = {
         "alias": ["debug", "调试模式", "DEBUG"],
         "desc": "开启机器调试日志",
     },
+    "pool": {
+        "alias": ["pool", "线程池"],
+        "desc": "查看消息处理线程池、限流、流式回复和回复缓存状态",
+    },
+    "plugin": {
+        "alias": ["plugin", "插件统计"],
+        "args": ["stats"],
+        "desc": "查看各插件的调用次数和耗时",
+    },
 }
 
 
@@ -353,6 +362,38 @@ class Godcmd(Plugin):
                             else:
                                 logger.setLevel(logging.DEBUG)
                                 ok, result = True, "DEBUG模式已开启"
+                        elif cmd == "pool":
+                            from channel.chat_channel import handler_pool, rate_limiter
+                            ok = True
+                            result = "线程池状态：\n"
+                            for lane, stats in handler_pool.stats().items():
+                                result += f"{lane}: 线程{stats['workers']} 执行中{stats['running']} 排队{stats['pending']}/{stats['max_queue']} 已完成{stats['completed']} 已拒绝{stats['rejected']}"
+                                result += f" 协程{stats['coroutines']}\n" if stats["coroutines"] else "\n"
+                            limit_stats = rate_limiter.stats()
+                            result += f"限流：通过{limit_stats['admitted']}"
+                            for dimension, count in limit_stats["rejected"].items():
+                                result += f" {dimension}拒绝{count}(记录{limit_stats['keys'].get(dimension, 0)})"
+                            from channel.stream_reply import stream_stats
+                            stream = stream_stats.stats()
+                            if stream["count"]:
+                                result += f"\n流式回复：{stream['count']}次 中断{stream['interrupted']} 首字p50/p90 {stream['ttfb']['p50']:.2f}s/{stream['ttfb']['p90']:.2f}s 首次发送p50 {stream['first_send']['p50']:.2f}s"
+                            from common import http_client
+                            for host, host_stats in http_client.stats().items():
+                                result += f"\n{host}: 请求{host_stats['requests']} 失败{host_stats['errors']} 重试{host_stats['retries']} 平均{host_stats['avg_time']:.2f}s 最长{host_stats['max_time']:.2f}s"
+                            from bridge.reply_cache import reply_cache
+                            cache = reply_cache.stats()
+                            if cache["hits"] or cache["shared"] or cache["misses"]:
+                                result += f"\n回复缓存：命中{cache['hits']} 合并{cache['shared']} 未命中{cache['misses']} 命中率{cache['hit_rate']:.0%} 缓存{cache['size']}条 进行中{cache['inflight']}"
+                        elif cmd == "plugin":
+                            if len(args) != 1 or args[0] != "stats":
+                                ok, result = False, "用法：#plugin stats"
+                            else:
+                                ok = True
+                                result = "插件调用统计：\n"
+                                suspended = PluginManager().suspended
+                                for name, stats in PluginManager().plugin_stats().items():
+                                    result += f"{name}: 调用{stats['calls']} 异常{stats['errors']} 超时{stats['timeouts']} 总计{stats['total_time']:.2f}s p50 {stats['p50'] * 1000:.2f}ms p99 {stats['p99'] * 1000:.2f}ms 最长{stats['max'] * 1000:.2f}ms"
+                                    result += " (超时临时禁用中)\n" if name in suspended else "\n"
                         elif cmd == "plist":
                             plugins = PluginManager().list_plugins()
                             ok = True
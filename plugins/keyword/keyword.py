@@ -2,7 +2,6 @@
 
 import json
 import os
-import requests
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
@@ -17,6 +16,7 @@ from plugins import *
     desc="关键词匹配过滤",
     version="0.1",
     author="fengyege.top",
+    context_types=[ContextType.TEXT],
 )
 class Keyword(Plugin):
     def __init__(self):
@@ -68,6 +68,8 @@ class Keyword(Plugin):
                     os.makedirs(file_path)
                 file_name = reply_text.split("/")[-1]  # 获取文件名
                 file_path = os.path.join(file_path, file_name)
+                import requests
+
                 response = requests.get(reply_text)
                 with open(file_path, "wb") as f:
                     f.write(response.content)
@@ -5,6 +5,10 @@ from common.log import logger
 
 
 class Plugin:
+    # 是否需要在ON_RECEIVE_MESSAGE中接收没有触发机器人的群消息(没有@、没有匹配前缀和关键词)
+    # 默认不接收，这类消息会在分发给插件之前直接丢弃
+    receive_untriggered = False
+
     def __init__(self):
         self.handlers = {}
 
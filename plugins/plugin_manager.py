@@ -5,13 +5,142 @@ import importlib.util
 import json
 import os
 import sys
-
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import wait
+
+from bridge.context import Context, ContextType
+from common.handler_pool import LANE_PLUGIN, HandlerPool
 from common.log import logger
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
 from config import conf, remove_plugin_config, write_plugin_config
 
 from .event import *
+from .plugin import Plugin
+
+MANIFEST = "manifest.json"
+
+
+class LazyPlugin(Plugin):
+    """
+    按插件目录下manifest.json注册的插件占位实例，启动时不导入插件模块
+    第一次收到需要处理的事件(或访问插件的其他属性)时才导入模块并创建真正的插件实例，之后的事件直接分发给真正的实例
+    """
+
+    import_path = None
+    manifest_events = ()
+    manifest_priority = 0
+    _real = None
+
+    def __init__(self):
+        super().__init__()
+        for event in self.manifest_events:
+            self.handlers[event] = self._make_handler(event)
+
+    def _make_handler(self, event):
+        def handler(e_context, *args, **kwargs):
+            real = self._load()
+            if real is not None and event in real.handlers:
+                real.handlers[event](e_context, *args, **kwargs)
+
+        return handler
+
+    def _load(self):
+        if self._real is None:
+            self._real = PluginManager().load_lazy_plugin(self.name.upper(), self)
+        return self._real
+
+    def get_help_text(self, **kwargs):
+        real = self._load()
+        return real.get_help_text(**kwargs) if real is not None else super().get_help_text(**kwargs)
+
+    def reload(self):
+        real = self._load()
+        if real is not None:
+            real.reload()
+
+    def __getattr__(self, name):
+        # 插件自己的属性和方法，导入后从真正的实例上获取
+        if name.startswith("__"):
+            raise AttributeError(name)
+        real = self._load()
+        if real is None:
+            raise AttributeError(name)
+        return getattr(real, name)
+
+
+def _shadow_event(e_context: EventContext):
+    """复制一份事件给在线程池中执行的插件，超时后插件继续修改的是副本，不影响后续处理"""
+    shadow = EventContext(e_context.event, dict(e_context.econtext))
+    shadow.action = e_context.action
+    context = e_context.econtext.get("context")
+    shadow_context = None
+    if isinstance(context, Context):
+        shadow_context = shadow.econtext["context"] = Context(context.type, context.content, dict(context.kwargs))
+    else:
+        context = None
+    return shadow, context, shadow_context
+
+
+def _merge_event(e_context: EventContext, shadow: EventContext, context, shadow_context):
+    """插件按时完成后把副本上的修改写回原事件，原Context对象被channel持有，在原对象上更新"""
+    if shadow_context is not None:
+        context.type, context.content, context.kwargs = shadow_context.type, shadow_context.content, shadow_context.kwargs
+        if shadow.econtext.get("context") is shadow_context:
+            shadow.econtext["context"] = context
+    e_context.econtext.clear()
+    e_context.econtext.update(shadow.econtext)
+    e_context.action = shadow.action
+
+
+class PluginStats:
+    """单个插件处理事件的调用次数和耗时，保留最近window次的耗时用于计算分位数"""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.consecutive_timeouts = 0  # 连续超时次数，正常返回后清零
+        self.total_time = 0.0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, elapsed, error=False, timeout=False):
+        with self.lock:
+            self.calls += 1
+            if error:
+                self.errors += 1
+            if timeout:
+                self.timeouts += 1
+                self.consecutive_timeouts += 1
+            else:
+                self.consecutive_timeouts = 0
+            self.total_time += elapsed
+            self.latencies.append(elapsed)
+            return self.consecutive_timeouts
+
+    def reset_timeouts(self):
+        with self.lock:
+            self.consecutive_timeouts = 0
+
+    def stats(self):
+        with self.lock:
+            values = sorted(self.latencies)
+            calls, errors, timeouts, total_time = self.calls, self.errors, self.timeouts, self.total_time
+        if not values:
+            return {"calls": calls, "errors": errors, "timeouts": timeouts, "total_time": total_time, "p50": 0, "p99": 0, "max": 0}
+        return {
+            "calls": calls,
+            "errors": errors,
+            "timeouts": timeouts,
+            "total_time": total_time,
+            "p50": values[len(values) // 2],
+            "p99": values[min(len(values) - 1, int(len(values) * 0.99))],
+            "max": values[-1],
+        }
 
 
 @singleton
@@ -23,6 +152,15 @@ class PluginManager:
         self.pconf = {}
         self.current_plugin_path = None
         self.loaded = {}
+        # 分发表: event -> {context类型: [(顺序, 插件名, handler, 触发前缀, stats, 时限)]}，插件启用、禁用、调整优先级时清空，按需重建
+        self.dispatch_tables = {}
+        self.dispatch_config = None  # 构建分发表时的(配置对象, 配置版本)，触发前缀依赖plugin_trigger_prefix
+        self.stats = {}  # 插件名 -> PluginStats
+        self.pool = HandlerPool()  # 设置了时限时执行插件处理函数
+        self.suspended = {}  # 因连续超时被临时禁用的插件名 -> 恢复时间(time.monotonic)
+        self.resume_at = float("inf")  # 最早的恢复时间
+        self.lazy = {}  # 按manifest注册、还未导入的插件名 -> (插件目录, 模块路径)
+        self.lazy_lock = threading.RLock()
 
     def register(self, name: str, desire_priority: int = 0, **kwargs):
         def wrapper(plugincls):
@@ -34,6 +172,11 @@ class PluginManager:
             plugincls.version = kwargs.get("version") if kwargs.get("version") != None else "1.0"
             plugincls.namecn = kwargs.get("namecn") if kwargs.get("namecn") != None else name
             plugincls.hidden = kwargs.get("hidden") if kwargs.get("hidden") != None else False
+            # ON_HANDLE_CONTEXT中只处理的context类型和文本前缀，不声明时接收全部，前缀中的{trigger_prefix}替换为plugin_trigger_prefix
+            plugincls.context_types = frozenset(kwargs["context_types"]) if kwargs.get("context_types") is not None else None
+            plugincls.trigger_prefixes = tuple(kwargs["trigger_prefixes"]) if kwargs.get("trigger_prefixes") is not None else None
+            # 插件自己声明的默认时限(秒)，只在配置了plugin_timeout时生效，0为不限制
+            plugincls.timeout = kwargs.get("timeout")
             plugincls.enabled = True
             if self.current_plugin_path == None:
                 raise Exception("Plugin path not set")
@@ -96,6 +239,11 @@ class PluginManager:
                 if os.path.isfile(main_module_path):
                     # 导入插件
                     import_path = "plugins.{}".format(plugin_name)
+                    manifest_path = os.path.join(plugin_path, MANIFEST)
+                    if plugin_path not in self.loaded and conf().get("plugin_lazy_load", True) and os.path.isfile(manifest_path):
+                        # 有manifest的插件先注册占位，第一次用到时再导入
+                        self._register_manifest(plugin_path, import_path, manifest_path)
+                        continue
                     try:
                         self.current_plugin_path = plugin_path
                         if plugin_path in self.loaded:
@@ -129,13 +277,220 @@ class PluginManager:
                 self.plugins[name].enabled = pconf["plugins"][rawname]["enabled"]
                 self.plugins[name].priority = pconf["plugins"][rawname]["priority"]
                 self.plugins._update_heap(name)  # 更新下plugins中的顺序
+        self.invalidate_dispatch()
         if modified:
             self.save_config()
         return new_plugins
 
+    def _register_manifest(self, plugin_path, import_path, manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            name = manifest["name"]
+            if name.upper() in self.plugins:
+                return
+            attrs = {
+                "import_path": import_path,
+                "manifest_events": tuple(Event[event] for event in manifest.get("events", ["ON_HANDLE_CONTEXT"])),
+                "receive_untriggered": manifest.get("receive_untriggered", False),
+                "manifest_priority": manifest.get("desire_priority", 0),
+            }
+            kwargs = {key: manifest[key] for key in ("desc", "author", "version", "namecn", "hidden", "trigger_prefixes", "timeout") if key in manifest}
+            if manifest.get("context_types") is not None:
+                kwargs["context_types"] = [ContextType[ctype] for ctype in manifest["context_types"]]
+            plugincls = type("Lazy" + name, (LazyPlugin,), attrs)
+            self.current_plugin_path = plugin_path
+            self.register(name, manifest.get("desire_priority", 0), **kwargs)(plugincls)
+            self.lazy[name.upper()] = (plugin_path, import_path)
+        except Exception as e:
+            logger.warn("Failed to load plugin manifest %s: %s" % (manifest_path, e))
+        finally:
+            self.current_plugin_path = None
+
+    def load_lazy_plugin(self, name, placeholder):
+        """导入按manifest注册的插件，创建真正的实例替换占位实例，失败时禁用插件并返回None"""
+        with self.lazy_lock:
+            instance = self.instances.get(name)
+            if instance is not None and not isinstance(instance, LazyPlugin):
+                return instance
+            if name not in self.lazy:
+                return None
+            plugin_path, import_path = self.lazy[name]
+            lazycls = self.plugins[name]
+            start = time.perf_counter()
+            try:
+                self.current_plugin_path = plugin_path
+                self.loaded[plugin_path] = importlib.import_module(import_path)
+                plugincls = self.plugins[name]
+                if plugincls is lazycls:
+                    raise Exception("plugin %s not registered by %s" % (name, import_path))
+                instance = plugincls()
+                self._check_manifest(name, lazycls, plugincls, instance)
+                plugincls.enabled = lazycls.enabled
+                plugincls.priority = lazycls.priority
+                self.plugins._update_heap(name)
+            except Exception as e:
+                logger.warn("Failed to load plugin %s, disabled. %s" % (name, e))
+                self.plugins[name] = lazycls
+                self.disable_plugin(name)
+                return None
+            finally:
+                self.current_plugin_path = None
+            del self.lazy[name]
+            placeholder.handlers.clear()
+            self.instances[name] = instance
+            for event in instance.handlers:
+                if name not in self.listening_plugins.setdefault(event, []):
+                    self.listening_plugins[event].append(name)
+            self.refresh_order()
+            logger.info("Plugin %s loaded on first use in %.2fs" % (name, time.perf_counter() - start))
+            return instance
+
+    def _check_manifest(self, name, lazycls, plugincls, instance):
+        """manifest.json中的注册信息与插件@register的不一致时，延迟导入前后的分发结果会不同，记录警告"""
+        declared = {
+            "desire_priority": (lazycls.manifest_priority, plugincls.priority),
+            "events": (set(lazycls.manifest_events), set(instance.handlers)),
+            "context_types": (lazycls.context_types, plugincls.context_types),
+            "trigger_prefixes": (lazycls.trigger_prefixes, plugincls.trigger_prefixes),
+            "timeout": (lazycls.timeout, plugincls.timeout),
+            "receive_untriggered": (lazycls.receive_untriggered, instance.receive_untriggered),
+        }
+        mismatched = ["%s: manifest=%s, register=%s" % (key, manifest, real) for key, (manifest, real) in declared.items() if manifest != real]
+        if mismatched:
+            logger.warn("Plugin %s manifest.json does not match @register, please keep them in sync: %s" % (name, "; ".join(mismatched)))
+        return mismatched
+
     def refresh_order(self):
         for event in self.listening_plugins.keys():
             self.listening_plugins[event].sort(key=lambda name: self.plugins[name].priority, reverse=True)
+        self.invalidate_dispatch()
+
+    def invalidate_dispatch(self):
+        """插件启用、禁用、重载或优先级变化后调用，下次分发事件时重建分发表"""
+        self.dispatch_tables = {}
+
+    def _dispatch_entries(self, event, context_type):
+        """返回event中需要处理context_type的已启用插件，按优先级排序"""
+        config = conf()
+        if self.dispatch_config != (config, config.version):
+            self.dispatch_tables = {}
+            self.dispatch_config = (config, config.version)
+        if time.monotonic() >= self.resume_at:
+            self._resume_plugins()
+        tables = self.dispatch_tables
+        table = tables.get(event)
+        if table is None:
+            table = tables[event] = {}
+        entries = table.get(context_type)
+        if entries is None:
+            entries = table[context_type] = self._build_entries(event, context_type)
+        return entries
+
+    def _build_entries(self, event, context_type):
+        entries = []
+        trigger_prefix = conf().get("plugin_trigger_prefix", "$")
+        for order, name in enumerate(self.listening_plugins.get(event, ())):
+            plugincls = self.plugins.get(name)
+            instance = self.instances.get(name)
+            if plugincls is None or not plugincls.enabled or instance is None or event not in instance.handlers:
+                continue
+            if name in self.suspended:
+                continue
+            prefixes = None
+            if event == Event.ON_HANDLE_CONTEXT:
+                context_types = getattr(plugincls, "context_types", None)
+                if context_types is not None and context_type not in context_types:
+                    continue
+                if getattr(plugincls, "trigger_prefixes", None) is not None:
+                    prefixes = tuple(prefix.replace("{trigger_prefix}", trigger_prefix) for prefix in plugincls.trigger_prefixes)
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = PluginStats()
+            entries.append((order, name, instance.handlers[event], prefixes, stats, self._plugin_timeout(plugincls)))
+        return entries
+
+    @staticmethod
+    def _plugin_timeout(plugincls):
+        """插件处理单个事件的时限，0为不限制"""
+        default = conf().get("plugin_timeout", 0)
+        if not default:
+            return 0
+        timeouts = {name.upper(): timeout for name, timeout in (conf().get("plugin_timeouts", {}) or {}).items()}
+        if plugincls.name.upper() in timeouts:
+            return timeouts[plugincls.name.upper()]
+        if getattr(plugincls, "timeout", None) is not None:
+            return plugincls.timeout
+        return default
+
+    def _call_handler(self, name, handler, e_context, stats, timeout, args, kwargs):
+        """
+        调用插件处理函数，返回是否正常结束
+        设置了时限时在插件线程池中执行，超时后放弃等待并跳过该插件，处理函数继续在后台执行，但对事件的修改不再生效
+        线程池被卡住的插件占满时，排队超过时限还没开始执行的同样按超时处理，不会在当前线程中无时限地执行
+        """
+        if not timeout:
+            start = time.perf_counter()
+            error = True
+            try:
+                handler(e_context, *args, **kwargs)
+                error = False
+            finally:
+                stats.record(time.perf_counter() - start, error)
+            return True
+        shadow, context, shadow_context = _shadow_event(e_context)
+        started = []  # 开始执行的时间，时限从开始执行时算起
+
+        def run():
+            started.append(time.perf_counter())
+            return handler(shadow, *args, **kwargs)
+
+        queued_at = time.perf_counter()
+        future = self.pool.submit(LANE_PLUGIN, run)
+        wait([future], timeout)
+        if not started and future.cancel():
+            self._record_timeout(name, e_context, stats, 0, "waited {:.1f}s for a free plugin worker".format(time.perf_counter() - queued_at))
+            return False
+        # 排队期间开始执行的，从开始执行起再等到时限
+        remaining = started[0] + timeout - time.perf_counter() if started else timeout
+        if remaining > 0:
+            wait([future], remaining)
+        elapsed = time.perf_counter() - (started[0] if started else queued_at)
+        if not future.done():
+            self._record_timeout(name, e_context, stats, elapsed, "timed out after {:.1f}s".format(elapsed))
+            return False
+        if future.exception() is not None:
+            stats.record(elapsed, error=True)
+            future.result()  # 与直接调用时一样抛出处理函数的异常
+        stats.record(elapsed)
+        _merge_event(e_context, shadow, context, shadow_context)
+        return True
+
+    def _record_timeout(self, name, e_context, stats, elapsed, reason):
+        strikes = stats.record(elapsed, timeout=True)
+        logger.warning("[PluginManager] plugin {} {} handling {} ({} in a row)".format(name, reason, e_context.event, strikes))
+        max_strikes = conf().get("plugin_timeout_strikes", 3)
+        if max_strikes and strikes >= max_strikes:
+            self.suspend_plugin(name, conf().get("plugin_suspend_seconds", 600))
+
+    def suspend_plugin(self, name, seconds):
+        """临时禁用插件，不修改plugins.json，到期后自动恢复"""
+        name = name.upper()
+        self.suspended[name] = time.monotonic() + seconds
+        self.resume_at = min(self.suspended.values())
+        if name in self.stats:
+            self.stats[name].reset_timeouts()
+        self.invalidate_dispatch()
+        logger.warning("[PluginManager] plugin {} suspended for {}s".format(name, seconds))
+
+    def _resume_plugins(self):
+        now = time.monotonic()
+        for name, until in list(self.suspended.items()):
+            if until <= now:
+                self.suspended.pop(name, None)
+                logger.info("[PluginManager] plugin {} resumed".format(name))
+        self.resume_at = min(self.suspended.values(), default=float("inf"))
+        self.dispatch_tables = {}
 
     def activate_plugins(self):  # 生成新开启的插件实例
         failed_plugins = []
@@ -157,7 +512,8 @@ class PluginManager:
                 for event in instance.handlers:
                     if event not in self.listening_plugins:
                         self.listening_plugins[event] = []
-                    self.listening_plugins[event].append(name)
+                    if name not in self.listening_plugins[event]:  # 重新激活已有实例时不重复添加
+                        self.listening_plugins[event].append(name)
         self.refresh_order()
         return failed_plugins
 
@@ -188,17 +544,46 @@ class PluginManager:
         self.activate_plugins()
 
     def emit_event(self, e_context: EventContext, *args, **kwargs):
-        if e_context.event in self.listening_plugins:
-            for name in self.listening_plugins[e_context.event]:
-                if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
-                    logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
-                    instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context,*args,**kwargs)
-                    if e_context.is_break():
-                        e_context["breaked_by"] = name
-                        logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
+        event = e_context.event
+        if event not in self.listening_plugins:
+            return e_context
+        # 只有ON_HANDLE_CONTEXT按context类型和前缀过滤
+        context = e_context.econtext.get("context") if event == Event.ON_HANDLE_CONTEXT else None
+        context_type = context.type if context is not None else None
+        entries = self._dispatch_entries(event, context_type)
+        i = 0
+        while i < len(entries) and e_context.action == EventAction.CONTINUE:
+            order, name, handler, prefixes, stats, timeout = entries[i]
+            i += 1
+            if prefixes is not None:
+                content = context.content
+                if not isinstance(content, str) or not content.startswith(prefixes):
+                    continue
+            logger.debug("Plugin %s triggered by event %s" % (name, event))
+            if not self._call_handler(name, handler, e_context, stats, timeout, args, kwargs):
+                continue
+            if e_context.is_break():
+                e_context["breaked_by"] = name
+                logger.debug("Plugin %s breaked event %s" % (name, event))
+            elif context is not None and context.type != context_type:
+                # 插件修改了context类型(如Hello把End转为IMAGE_CREATE)，后续插件按新类型分发
+                context_type = context.type
+                entries = self._dispatch_entries(event, context_type)
+                i = bisect_right([entry[0] for entry in entries], order)
         return e_context
 
+    def plugin_stats(self):
+        """各插件处理事件的调用次数和耗时，按总耗时排序"""
+        result = {name: stats.stats() for name, stats in list(self.stats.items())}
+        return dict(sorted(result.items(), key=lambda item: item[1]["total_time"], reverse=True))
+
+    def has_untriggered_listener(self) -> bool:
+        """是否有启用的插件需要在ON_RECEIVE_MESSAGE中接收没有触发机器人的消息"""
+        for name in self.listening_plugins.get(Event.ON_RECEIVE_MESSAGE, ()):
+            if self.plugins[name].enabled and self.instances[name].receive_untriggered:
+                return True
+        return False
+
     def set_plugin_priority(self, name: str, priority: int):
         name = name.upper()
         if name not in self.plugins:
@@ -238,6 +623,7 @@ class PluginManager:
             rawname = self.plugins[name].name
             self.pconf["plugins"][rawname]["enabled"] = False
             self.save_config()
+            self.invalidate_dispatch()
             return True
         return True
 
@@ -618,6 +1004,7 @@ class PluginManager:
                     self.listening_plugins[event].remove(name)
             del self.plugins[name]
             del self.pconf["plugins"][rawname]
+            self.invalidate_dispatch()
             self.loaded[dirname] = None
             self.save_config()
             return True, "卸载插件成功"
@@ -17,6 +17,9 @@ from plugins import *
     version="0.5",
     author="goldfishh",
     desire_priority=0,
+    context_types=[ContextType.TEXT],
+    trigger_prefixes=["{trigger_prefix}tool"],
+    timeout=300,
 )
 class Tool(Plugin):
     def __init__(self):
@@ -15,6 +15,7 @@ import time
 
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.token_cache import token_cache
 from voice.audio_convert import get_pcm_from_wav
 from voice.voice import Voice
 from voice.ali.ali_api import AliyunTokenGenerator, speech_to_text_aliyun, text_to_speech_aliyun
@@ -31,8 +32,6 @@ class AliVoice(Voice):
             config_path = os.path.join(curdir, "config.json")
             with open(config_path, "r") as fr:
                 config = json.load(fr)
-            self.token = None
-            self.token_expire_time = 0
             # 默认复用阿里云千问的 access_key 和 access_secret
             self.api_url_voice_to_text = config.get("api_url_voice_to_text")
             self.api_url_text_to_voice = config.get("api_url_text_to_voice")
@@ -83,19 +82,14 @@ class AliVoice(Voice):
 
     def get_valid_token(self):
         """
-        获取有效的阿里云token。
+        获取有效的阿里云token，使用共享的token缓存，过期前5分钟在后台刷新。
 
         :return: 返回有效的token字符串。
         """
-        current_time = time.time()
-        if self.token is None or current_time >= self.token_expire_time:
-            get_token = AliyunTokenGenerator(self.access_key_id, self.access_key_secret)
-            token_str = get_token.get_token()
+        def fetch():
+            token_str = AliyunTokenGenerator(self.access_key_id, self.access_key_secret).get_token()
             token_data = json.loads(token_str)
-            self.token = token_data["Token"]["Id"]
-            # 将过期时间减少一小段时间（例如5分钟），以避免在边界条件下的过期
-            self.token_expire_time = token_data["Token"]["ExpireTime"] - 300
-            logger.debug(f"新获取的阿里云token：{self.token}")
-        else:
-            logger.debug("使用缓存的token")
-        return self.token
+            logger.debug("[Ali] 获取到新的阿里云token")
+            return token_data["Token"]["Id"], token_data["Token"]["ExpireTime"] - time.time()
+
+        return token_cache.get(("aliyun_nls", self.access_key_id, self.access_key_secret), fetch, refresh_before=300)
@@ -3,14 +3,24 @@ import wave
 
 from common.log import logger
 
-try:
-    import pysilk
-except ImportError:
-    logger.debug("import pysilk failed, wechaty voice message will not be supported.")
+sil_supports = [8000, 12000, 16000, 24000, 32000, 44100, 48000]  # slk转wav时，支持的采样率
 
-from pydub import AudioSegment
 
-sil_supports = [8000, 12000, 16000, 24000, 32000, 44100, 48000]  # slk转wav时，支持的采样率
+def _audio_segment():
+    """pydub导入较慢，只在第一次转换音频时导入"""
+    from pydub import AudioSegment
+
+    return AudioSegment
+
+
+def _pysilk():
+    """pysilk只在处理silk语音时需要，未安装时在调用处报错"""
+    try:
+        import pysilk
+    except ImportError:
+        logger.error("import pysilk failed, silk voice message will not be supported.")
+        raise
+    return pysilk
 
 
 def find_closest_sil_supports(sample_rate):
@@ -50,7 +60,7 @@ def any_to_mp3(any_path, mp3_path):
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         sil_to_wav(any_path, any_path)
         any_path = mp3_path
-    audio = AudioSegment.from_file(any_path)
+    audio = _audio_segment().from_file(any_path)
     audio.export(mp3_path, format="mp3")
 
 
@@ -63,7 +73,7 @@ def any_to_wav(any_path, wav_path):
         return
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         return sil_to_wav(any_path, wav_path)
-    audio = AudioSegment.from_file(any_path)
+    audio = _audio_segment().from_file(any_path)
     audio.set_frame_rate(8000)    # 百度语音转写支持8000采样率, pcm_s16le, 单通道语音识别
     audio.set_channels(1)
     audio.export(wav_path, format="wav", codec='pcm_s16le')
@@ -76,13 +86,13 @@ def any_to_sil(any_path, sil_path):
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         shutil.copy2(any_path, sil_path)
         return 10000
-    audio = AudioSegment.from_file(any_path)
+    audio = _audio_segment().from_file(any_path)
     rate = find_closest_sil_supports(audio.frame_rate)
     # Convert to PCM_s16
     pcm_s16 = audio.set_sample_width(2)
     pcm_s16 = pcm_s16.set_frame_rate(rate)
     wav_data = pcm_s16.raw_data
-    silk_data = pysilk.encode(wav_data, data_rate=rate, sample_rate=rate)
+    silk_data = _pysilk().encode(wav_data, data_rate=rate, sample_rate=rate)
     with open(sil_path, "wb") as f:
         f.write(silk_data)
     return audio.duration_seconds * 1000
@@ -97,7 +107,7 @@ def any_to_amr(any_path, amr_path):
         return
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         raise NotImplementedError("Not support file type: {}".format(any_path))
-    audio = AudioSegment.from_file(any_path)
+    audio = _audio_segment().from_file(any_path)
     audio = audio.set_frame_rate(8000)  # only support 8000
     audio.export(amr_path, format="amr")
     return audio.duration_seconds * 1000
@@ -107,7 +117,7 @@ def sil_to_wav(silk_path, wav_path, rate: int = 24000):
     """
     silk 文件转 wav
     """
-    wav_data = pysilk.decode_file(silk_path, to_wav=True, sample_rate=rate)
+    wav_data = _pysilk().decode_file(silk_path, to_wav=True, sample_rate=rate)
     with open(wav_path, "wb") as f:
         f.write(wav_data)
 
@@ -116,7 +126,7 @@ def split_audio(file_path, max_segment_length_ms=60000):
     """
     分割音频文件
     """
-    audio = AudioSegment.from_file(file_path)
+    audio = _audio_segment().from_file(file_path)
     audio_length_ms = len(audio)
     if audio_length_ms <= max_segment_length_ms:
         return audio_length_ms, [file_path]
@@ -1,16 +1,16 @@
 """
-baidu voice service with thread-safe token caching
+baidu voice service with shared token caching
 """
 import json
 import os
 import time
-import threading
 import requests
 
 from aip import AipSpeech
 
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.token_cache import baidu_access_token
 from common.tmp_dir import TmpDir
 from config import conf
 from voice.audio_convert import get_pcm_from_wav
@@ -44,36 +44,16 @@ class BaiduVoice(Voice):
 
             # 百度 SDK 客户端（短文本合成 & 语音识别）
             self.client = AipSpeech(self.app_id, self.api_key, self.secret_key)
-
-            # access_token 缓存与锁
-            self._access_token    = None
-            self._token_expire_ts = 0
-            self._token_lock      = threading.Lock()
         except Exception as e:
             logger.warn("BaiduVoice init failed: %s, ignore" % e)
 
     def _get_access_token(self):
-        # 多线程安全获取 token
-        with self._token_lock:
-            now = time.time()
-            if self._access_token and now < self._token_expire_ts:
-                return self._access_token
-            url = "https://aip.baidubce.com/oauth/2.0/token"
-            params = {
-                "grant_type":    "client_credentials",
-                "client_id":     self.api_key,
-                "client_secret": self.secret_key,
-            }
-            resp = requests.post(url, params=params).json()
-            token = resp.get("access_token")
-            expires_in = resp.get("expires_in", 2592000)
-            if token:
-                self._access_token    = token
-                self._token_expire_ts = now + expires_in - 60  # 提前 1 分钟过期
-                return token
-            else:
-                logger.error("BaiduVoice _get_access_token failed: %s", resp)
-                return None
+        # 使用共享的 token 缓存，多线程并发时只获取一次
+        try:
+            return baidu_access_token(self.api_key, self.secret_key)
+        except Exception as e:
+            logger.error("BaiduVoice _get_access_token failed: %s", e)
+            return None
 
     def voiceToText(self, voice_file):
         logger.debug("[Baidu] recognize voice file=%s", voice_file)
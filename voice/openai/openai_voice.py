@@ -9,8 +9,7 @@ from bridge.reply import Reply, ReplyType
 from common.log import logger
 from config import conf
 from voice.voice import Voice
-import requests
-from common import const
+from common import const, http_client
 import datetime, random
 
 class OpenaiVoice(Voice):
@@ -33,7 +32,7 @@ class OpenaiVoice(Voice):
             data = {
                 "model": "whisper-1",
             }
-            response = requests.post(url, headers=headers, files=files, data=data)
+            response = http_client.post(url, headers=headers, files=files, data=data)  # 上传的文件流无法重放，不重试
             response_data = response.json()
             text = response_data['text']
             reply = Reply(ReplyType.TEXT, text)
@@ -57,7 +56,7 @@ class OpenaiVoice(Voice):
                 'input': text,
                 'voice': conf().get("tts_voice_id") or "alloy"
             }
-            response = requests.post(url, headers=headers, json=data)
+            response = http_client.post(url, headers=headers, json=data, retries=2)
             file_name = "tmp/" + datetime.datetime.now().strftime('%Y%m%d%H%M%S') + str(random.randint(0, 1000)) + ".mp3"
             logger.debug(f"[OPENAI] text_to_Voice file_name={file_name}, input={text}")
             with open(file_name, 'wb') as f: